@@ -1,4 +1,5 @@
 import os
+from sqlalchemy import inspect, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
@@ -59,3 +60,24 @@ Base = declarative_base()
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
+
+def add_missing_columns(sync_conn):
+    """
+    create_all() only creates missing tables. This adds columns and indexes
+    introduced since an existing table was created. Run with conn.run_sync().
+    """
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        added = [column for column in table.columns if column.name not in existing]
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for column in added:
+            column_type = column.type.compile(dialect=sync_conn.dialect)
+            print(f"🧱 Adding column {table.name}.{column.name}")
+            sync_conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                print(f"🧱 Adding index {index.name}")
+                index.create(sync_conn, checkfirst=True)
@@ -1,15 +1,25 @@
-import uuid
 import asyncio
+import json
 import os
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Form, BackgroundTasks, Request, Response
-from fastapi.responses import HTMLResponse, JSONResponse
+from typing import List
+from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Form, Request, Response
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import cookie_parser
 import hashlib
+import hmac
 from sqlalchemy.ext.asyncio import AsyncSession
-from .database import engine, Base, get_db, AsyncSessionLocal
+from .database import engine, Base, get_db, add_missing_columns
 from contextlib import asynccontextmanager
-from .services.orchestrator import process_transaction
+from .services.orchestrator import process_transaction, find_processed_image
+from .services.monarch import close_monarch_clients
+from .services.currency import close_client as close_currency_client
+from .services.ocr_cache import get_stats as get_ocr_cache_stats
+from .services.jobs import enqueue_job, get_job, job_status, job_events, can_retry, requeue_job, queue_full, WorkerPool, get_stats as get_job_stats
+from .services.jobs import enqueue_batch, get_batch_status, add_finished_job, UPLOAD_MAX_BYTES, BATCH_MAX_BYTES
+from .services.intake import spool_upload, spool_batch, UploadTooLarge
+from .services.blobstore import blob_store
+from starlette.concurrency import run_in_threadpool
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -18,13 +28,20 @@ async def lifespan(app: FastAPI):
     try:
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(add_missing_columns)
         print("✅ LIFESPAN: Database tables created/verified.")
     except Exception as e:
         print(f"❌ LIFESPAN: Database initialization failed: {e}")
         # We might want to re-raise or continue depending on severity, but for diagnosis, printing is key.
         raise e
+    workers = WorkerPool()
+    workers.start()
     print("✨ LIFESPAN: Startup complete.")
     yield
+    # Let running jobs finish before their Monarch/FX clients are closed
+    await workers.drain()
+    await close_monarch_clients()
+    await close_currency_client()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -34,33 +51,102 @@ DEVICE_TOKEN_COOKIE = "device_token"
 # Token value is a hash of the secret to avoid exposing it directly in the cookie if inspected
 COOKIE_VALUE = hashlib.sha256(UNLOCK_SECRET.encode()).hexdigest() if UNLOCK_SECRET else None
 
-class GhostSecurityMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+# Allow activation endpoint, plus static assets (manifest, Service Worker, icons) to support PWA installation.
+# Browsers often fetch these without credentials or in a separate context.
+# This exposes the *existence* of the app (if you guess the URL), but protects the functionality.
+PUBLIC_PATHS = frozenset({"/s", "/manifest.json", "/sw.js", "/favicon.ico"})
+PUBLIC_SUFFIXES = (".png", ".jpg", ".css", ".js", ".gif")
+
+class GhostSecurityMiddleware:
+    """
+    Plain ASGI middleware (no BaseHTTPMiddleware task/stream wrapping, so streamed
+    responses like /job/{job_id}/events pass straight through).
+    """
+    def __init__(self, app):
+        self.app = app
+        self.expected_token = COOKIE_VALUE.encode() if COOKIE_VALUE else None
+
+    async def __call__(self, scope, receive, send):
         # If no secret is configured, bypass security (or you could choose to block)
-        if not UNLOCK_SECRET:
-            return await call_next(request)
+        if scope["type"] != "http" or self.expected_token is None:
+            return await self.app(scope, receive, send)
+
+        path = scope["path"]
+        if path in PUBLIC_PATHS or path.endswith(PUBLIC_SUFFIXES):
+            return await self.app(scope, receive, send)
+
+        # Check for cookie (constant-time, so the token can't be guessed byte by byte)
+        token = self._device_token(scope)
+        if token is not None and hmac.compare_digest(token.encode(), self.expected_token):
+            return await self.app(scope, receive, send)
 
-        # Allow activation endpoint
-        if request.url.path == "/s":
-            return await call_next(request)
-            
-        # Allow static assets (manifest, Service Worker, icons) to support PWA installation.
-        # Browsers often fetch these without credentials or in a separate context.
-        # This exposes the *existence* of the app (if you guess the URL), but protects the functionality.
-        if request.url.path in ["/manifest.json", "/sw.js", "/favicon.ico"]:
-            return await call_next(request)
-            
-        if request.url.path.endswith((".png", ".jpg", ".css", ".js", ".gif")):
-             return await call_next(request)
-        
-        # Check for cookie
-        token = request.cookies.get(DEVICE_TOKEN_COOKIE)
-        if token == COOKIE_VALUE:
-            return await call_next(request)
-            
         # GHOST MODE: Return 404 Not Found if unauthorized
-        return Response(status_code=404, content="Not Found")
+        response = Response(status_code=404, content="Not Found")
+        await response(scope, receive, send)
+
+    @staticmethod
+    def _device_token(scope):
+        for name, value in scope["headers"]:
+            if name == b"cookie":
+                return cookie_parser(value.decode("latin-1")).get(DEVICE_TOKEN_COOKIE)
+        return None
 
+# Room for the multipart boundary and form fields around the images
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+# Upload endpoints and the largest request body each accepts
+UPLOAD_LIMITS = {
+    "/share": UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD,
+    "/upload": UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD,
+    "/batch": BATCH_MAX_BYTES + UPLOAD_FORM_OVERHEAD,
+}
+
+class UploadLimitMiddleware:
+    """
+    Answers 413 to oversized uploads up front from their Content-Length, instead of
+    after the whole body has been received and parsed. The form parser spools the body
+    to disk before any endpoint runs, so uploads without a Content-Length (chunked) are
+    counted as they are received and cut off as soon as they pass the limit.
+    """
+    def __init__(self, app, limits: dict = UPLOAD_LIMITS):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        max_bytes = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if max_bytes is None:
+            return await self.app(scope, receive, send)
+
+        length = self._content_length(scope)
+        if length is not None and length > max_bytes:
+            response = Response(status_code=413, content="Upload is too large")
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    # Re-raised as is by FastAPI's body parsing, so the client gets a 413
+                    raise HTTPException(status_code=413, detail="Upload is too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    def _content_length(scope):
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    return int(value)
+                except ValueError:
+                    return None
+        return None
+
+# Added last so it runs first: unauthorized clients still only ever see 404s
+app.add_middleware(UploadLimitMiddleware)
 app.add_middleware(GhostSecurityMiddleware)
 
 @app.get("/s")
@@ -72,7 +158,7 @@ async def activate(s: str):
     if not UNLOCK_SECRET:
         return Response(status_code=500, content="Security not configured on server.")
         
-    if s != UNLOCK_SECRET:
+    if not hmac.compare_digest(s.encode(), UNLOCK_SECRET.encode()):
         # Fake a 404 if secret is wrong to prevent guessing
         return Response(status_code=404, content="Not Found")
     
@@ -110,91 +196,23 @@ async def activate(s: str):
     )
     return response
 
-# Simple in-memory job store
-# Structure: { job_id: { "status": "processing" | "completed" | "failed", "result": dict, "error": str, "inputs": dict } }
-jobs = {}
-
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
 
-async def process_background_job(job_id: str, content: bytes, user_currency: str = None, manual_data: dict = None, force_override: bool = False):
+@app.get("/metrics/ocr-cache")
+async def ocr_cache_metrics(db: AsyncSession = Depends(get_db)):
     """
-    Background task to process the transaction using a fresh DB session.
+    Hit/miss counters (since startup) and size of the OCR result cache.
     """
-    print(f"Starting background job {job_id}")
-    
-    jobs[job_id] = {"status": "processing", "step": "Initializing...", "progress": 0}
-    
-    async def progress_callback(step_msg, percent=None):
-        jobs[job_id]["step"] = step_msg
-        if percent is not None:
-            jobs[job_id]["progress"] = percent
-
-    try:
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                if attempt > 0:
-                    print(f"Job {job_id}: Attempt {attempt+1}...")
-                
-                async with AsyncSessionLocal() as db:
-                    if manual_data:
-                         from .services.orchestrator import process_manual_transaction
-                         result = await process_manual_transaction(manual_data, db, progress_callback=progress_callback, force_override=force_override)
-                    else:
-                         result = await process_transaction(content, db, progress_callback=progress_callback, user_currency=user_currency, force_override=force_override)
-                
-                # Success
-                jobs[job_id] = {
-                    "status": "completed", 
-                    "result": result, 
-                    "progress": 100,
-                    # Store inputs for potential retry/force submit
-                    "inputs": {
-                        "content": content,
-                        "user_currency": user_currency,
-                        "manual_data": manual_data
-                    }
-                }
-                print(f"Job {job_id} completed successfully")
-                return # Exit function on success
-                
-            except Exception as e:
-                # Check for DB connection errors
-                error_str = str(e)
-                is_db_error = "InterfaceError" in str(type(e).__name__) or "connection is closed" in error_str
-                
-                if is_db_error and attempt < max_retries - 1:
-                    print(f"⚠️ DB Connection Error (Attempt {attempt+1}): {e}")
-                    print("Turning the database snooze button... 💤⏰")
-                    
-                    # Update UI to inform user
-                    jobs[job_id]["step"] = "Waking up database... 🥱"
-                    await asyncio.sleep(2) # Wait for DB to wake up
-                    continue
-                else:
-                    # Not a DB error or out of retries, raise to outer handler
-                    raise e
-                    
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"❌ Job {job_id} FAILED:\n{error_details}")
-        
-        # User-friendly error mapping
-        err_msg = str(e)
-        if "Connection" in err_msg or "timeout" in err_msg.lower():
-            display_error = "Database connection timed out. Please try again later."
-        elif "GEMINI_API_KEY" in err_msg:
-            display_error = "Server configuration error: Gemini API Key missing."
-        elif "Monarch" in err_msg:
-            display_error = f"Monarch Error: {err_msg}"
-        else:
-            display_error = f"I hit a snag: {err_msg}"
-
-        jobs[job_id] = {"status": "failed", "error": display_error, "progress": 0}
+    return await get_ocr_cache_stats(db)
 
-@app.get("/health")
-async def health():
-    return {"status": "ok"}
+@app.get("/metrics/jobs")
+async def job_metrics(db: AsyncSession = Depends(get_db)):
+    """
+    Jobs by status, and the size of the receipt blob store (in memory and on disk).
+    """
+    return await get_job_stats(db)
 
 @app.post("/upload")
 async def upload_receipt(
@@ -203,7 +221,17 @@ async def upload_receipt(
     db: AsyncSession = Depends(get_db)
 ):
     try:
-        content = await file.read()
+        content_hash = await spool_upload(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    try:
+        # Known images are answered from their hash alone, without loading them
+        existing = await find_processed_image(db, content_hash)
+        if existing:
+            return {"status": "success", "data": {"status": "duplicate", "data": existing.parsed_data}}
+
+        content = await run_in_threadpool(blob_store.get, content_hash)
         result = await process_transaction(content, db, user_currency=currency)
         return {"status": "success", "data": result}
     except HTTPException as e:
@@ -212,41 +240,100 @@ async def upload_receipt(
         print(f"Error processing transaction: {e}") # Log internal error
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
+@app.post("/batch")
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    currency: str = Form(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Queues many receipts at once, e.g. a trip's worth. Accepts several image files
+    and/or zip archives of images. Returns a batch id and one job per image;
+    follow progress with GET /batch/{batch_id}.
+    """
+    if await queue_full(db, batch=True):
+        raise HTTPException(status_code=429, detail="Too many batched receipts waiting, try again later", headers={"Retry-After": "60"})
+
+    # Streamed to the blob store file by file; only hashes are kept in memory
+    try:
+        images = await run_in_threadpool(spool_batch, files)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not images:
+        raise HTTPException(status_code=400, detail="No images found in upload")
+    # All or nothing: a batch that doesn't fit is refused before any of it is queued
+    if await queue_full(db, batch=True, adding=len({image_hash for _, image_hash in images})):
+        raise HTTPException(status_code=429, detail="Too many batched receipts waiting for this batch, try again later", headers={"Retry-After": "60"})
+
+    return await enqueue_batch(db, images, user_currency=currency)
+
+@app.get("/batch/{batch_id}")
+async def get_batch(batch_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    Overall counts by status plus each image's job status (same shape as /job/{job_id}).
+    """
+    batch = await get_batch_status(db, batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
+
 @app.get("/job/{job_id}")
-async def get_job_status(job_id: str):
-    job = jobs.get(job_id)
+async def get_job_status(job_id: str, db: AsyncSession = Depends(get_db)):
+    job = await get_job(db, job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    # Exclude inputs (bytes) to avoid JSON serialization errors
-    return {k: v for k, v in job.items() if k != "inputs"}
+    return job_status(job)
+
+@app.get("/job/{job_id}/events")
+async def stream_job_status(job_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    Server-Sent Events stream of the job's status (same JSON as /job/{job_id}),
+    sent on every change until the job completes or fails.
+    """
+    job = await get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    first = job_status(job)
+    # Don't hold a pooled DB connection for the lifetime of the stream
+    await db.close()
+
+    async def event_stream():
+        yield f"data: {json.dumps(first)}\n\n"
+        if first["status"] in ("completed", "failed"):
+            return
+        async for status in job_events(job_id):
+            if status is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"data: {json.dumps(status)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.post("/job/{job_id}/retry")
-async def retry_job(job_id: str, force: bool = False, background_tasks: BackgroundTasks = None):
-    job = jobs.get(job_id)
+async def retry_job(job_id: str, force: bool = False, db: AsyncSession = Depends(get_db)):
+    job = await get_job(db, job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
         
-    inputs = job.get("inputs")
-    if not inputs:
+    if not can_retry(job):
         raise HTTPException(status_code=400, detail="Cannot retry this job (inputs not saved)")
+    if job.status in ("queued", "processing"):
+        raise HTTPException(status_code=409, detail="Job is still running")
+        
+    if await queue_full(db, batch=job.batch_id is not None):
+        raise HTTPException(status_code=429, detail="Too many jobs waiting, try again later", headers={"Retry-After": "60"})
         
     print(f"Retrying job {job_id} with force={force}")
     
-    # Reset job status
-    jobs[job_id]["status"] = "processing"
-    jobs[job_id]["progress"] = 0
-    jobs[job_id]["step"] = "Retrying..."
-    
-    # Restart background task
-    background_tasks.add_task(
-        process_background_job, 
-        job_id, 
-        inputs.get("content"), 
-        inputs.get("user_currency"), 
-        inputs.get("manual_data"),
-        force_override=force
-    )
+    # Back into the queue, keeping its inputs
+    await requeue_job(db, job, force_override=force)
     
     return {"status": "ok"}
 
@@ -442,30 +529,54 @@ LOADING_HTML = """
                     .then(r => r.json())
                     .then(data => {
                         console.log("Retry started");
-                        setTimeout(checkStatus, pollInterval);
+                        watchJob();
                     })
                     .catch(err => showError("Retry failed: " + err));
             }
             
+            // Returns true once the job has finished
+            function handleStatus(data) {
+                if (data.status === 'completed') {
+                    showSuccess(data.result);
+                    return true;
+                } else if (data.status === 'failed') {
+                    showError(data.error);
+                    return true;
+                }
+                // Update progress text
+                if (data.step) {
+                    document.getElementById('loadingSubtitle').textContent = data.step;
+                }
+                // Update progress bar
+                if (data.progress !== undefined) {
+                    const bar = document.getElementById('progressBar');
+                    if (bar) bar.style.width = data.progress + '%';
+                }
+                return false;
+            }
+            
+            // Progress is pushed by the server; polling is only a fallback
+            function watchJob() {
+                if (!window.EventSource) {
+                    setTimeout(checkStatus, 100);
+                    return;
+                }
+                const source = new EventSource(`/job/${jobId}/events`);
+                source.onmessage = event => {
+                    if (handleStatus(JSON.parse(event.data))) source.close();
+                };
+                source.onerror = () => {
+                    console.warn("Event stream lost, falling back to polling");
+                    source.close();
+                    setTimeout(checkStatus, pollInterval);
+                };
+            }
+            
             function checkStatus() {
                 fetch(`/job/${jobId}`)
                     .then(response => response.json())
                     .then(data => {
-                        if (data.status === 'completed') {
-                            showSuccess(data.result);
-                        } else if (data.status === 'failed') {
-                            showError(data.error);
-                        } else {
-                            // Update progress text
-                            if (data.step) {
-                                document.getElementById('loadingSubtitle').textContent = data.step;
-                            }
-                            // Update progress bar
-                            if (data.progress !== undefined) {
-                                const bar = document.getElementById('progressBar');
-                                if (bar) bar.style.width = data.progress + '%';
-                            }
-                            
+                        if (!handleStatus(data)) {
                             // Still processing
                             setTimeout(checkStatus, pollInterval);
                         }
@@ -537,26 +648,36 @@ LOADING_HTML = """
                 document.getElementById('errorMessage').textContent = msg;
             }
 
-            // Start polling
-            setTimeout(checkStatus, 100);
+            // Start listening for progress
+            watchJob();
         </script>
     </body>
 </html>
 """
 
+def busy_response():
+    """Backpressure: too many jobs are already waiting, ask the client to come back later."""
+    return HTMLResponse(
+        content="The bridge is busy with other receipts. Please try again in a minute.",
+        status_code=429,
+        headers={"Retry-After": "60"},
+    )
+
 @app.post("/manual")
 async def handle_manual_entry(
-    background_tasks: BackgroundTasks,
     amount: float = Form(...),
     currency: str = Form(...),
     date: str = Form(...),
-    merchant: str = Form(...)
+    merchant: str = Form(...),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Handle Manual Entry POST request.
     """
     try:
-        job_id = str(uuid.uuid4())
+        if await queue_full(db):
+            return busy_response()
+
         mm_account = os.environ.get("MM_ACCOUNT", "Default Account")
         
         manual_data = {
@@ -566,8 +687,8 @@ async def handle_manual_entry(
             "merchant": merchant
         }
         
-        # Start background task
-        background_tasks.add_task(process_background_job, job_id, None, None, manual_data)
+        # Queue for a background worker
+        job_id = await enqueue_job(db, manual_data=manual_data)
         
         # Return Loading HTML
         return HTMLResponse(content=LOADING_HTML.replace("__JOB_ID__", job_id).replace("__MM_ACCOUNT__", mm_account))
@@ -578,22 +699,34 @@ async def handle_manual_entry(
 
 @app.post("/share")
 async def handle_share(
-    background_tasks: BackgroundTasks,
     currency: str = Form(None),
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Handle Share Target POST request. 
     Starts processing in background and returns a loading page that polls for status.
     """
     try:
-        # Read file immediately before response closes
-        content = await file.read()
-        job_id = str(uuid.uuid4())
+        if await queue_full(db):
+            return busy_response()
+
+        # Stream the file into the blob store before the response closes
+        try:
+            content_hash = await spool_upload(file)
+        except UploadTooLarge:
+            return HTMLResponse(content="This image is too large to upload.", status_code=413)
         mm_account = os.environ.get("MM_ACCOUNT", "Default Account")
-        
-        # Start background task
-        background_tasks.add_task(process_background_job, job_id, content, currency)
+
+        existing = await find_processed_image(db, content_hash)
+        if existing:
+            # Already imported: no need to queue it, the page shows the duplicate straight away
+            print(f"DUPLICATE TRANSACTION DETECTED: Hash={content_hash}")
+            result = {"status": "duplicate", "data": existing.parsed_data}
+            job_id = await add_finished_job(db, content_hash, result, user_currency=currency)
+        else:
+            # Queue for a background worker
+            job_id = await enqueue_job(db, content_hash=content_hash, user_currency=currency)
         
         # Return Loading HTML
         return HTMLResponse(content=LOADING_HTML.replace("__JOB_ID__", job_id).replace("__MM_ACCOUNT__", mm_account))
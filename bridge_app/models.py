@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, LargeBinary, DateTime, JSON
+from sqlalchemy import Column, Integer, String, LargeBinary, DateTime, Date, Float, JSON, Boolean, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from .database import Base
 
@@ -11,7 +11,72 @@ class Credentials(Base):
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        Index("ix_transactions_semantic", "currency", "merchant_key", "tx_date"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     image_hash = Column(String, unique=True, index=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # dHash of the receipt image (16 hex digits), see services/phash.py
+    perceptual_hash = Column(String(16), nullable=True)
+    # Normalized purchase details in the original currency, see services/dedup.py
+    tx_date = Column(Date, nullable=True)
+    amount_cents = Column(Integer, nullable=True)
+    currency = Column(String(3), nullable=True)
+    merchant_key = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     parsed_data = Column(JSON, nullable=True)
+
+class OcrResult(Base):
+    __tablename__ = "ocr_results"
+    id = Column(Integer, primary_key=True, index=True)
+    # sha256 of the uploaded image, same as Transaction.image_hash
+    image_hash = Column(String, unique=True, index=True, nullable=False)
+    model = Column(String, nullable=False)
+    data = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ExchangeRate(Base):
+    __tablename__ = "exchange_rates"
+    __table_args__ = (
+        UniqueConstraint("base", "quote", "date", name="uq_exchange_rates_pair_date"),
+        # Rate tables are loaded a whole date at a time (base + date, every quote)
+        Index("ix_exchange_rates_base_date", "base", "date"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    # 1 unit of `base` is worth `rate` units of `quote` on `date`
+    base = Column(String(3), nullable=False)
+    quote = Column(String(3), nullable=False)
+    date = Column(Date, nullable=False)
+    rate = Column(Float, nullable=False)
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_status_created_at", "status", "created_at"),
+    )
+    id = Column(String(36), primary_key=True)
+    # queued -> processing -> completed | failed
+    status = Column(String, nullable=False, default="queued")
+    step = Column(String, nullable=True)
+    progress = Column(Integer, nullable=False, default=0)
+    result = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+    # Inputs, kept so the job can be retried or force-submitted.
+    # Uploaded images are in the blob store (services/blobstore.py), by sha256.
+    content_hash = Column(String(64), nullable=True)
+    user_currency = Column(String, nullable=True)
+    manual_data = Column(JSON, nullable=True)
+    force_override = Column(Boolean, nullable=False, default=False)
+    # Set for jobs created by /batch
+    batch_id = Column(String(36), nullable=True, index=True)
+    filename = Column(String, nullable=True)
+    # Leasing: a processing job whose lease has expired is picked up by another worker
+    attempts = Column(Integer, nullable=False, default=0)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    # Set as soon as the transaction is created in Monarch, so a claim that takes over
+    # the job (or a retry) doesn't create it a second time
+    monarch_tx_id = Column(String, nullable=True)
+    # Naive UTC timestamps, see services/jobs.py
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=True)
@@ -0,0 +1,165 @@
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Uploaded receipts kept for job retries, one file per sha256 under BLOB_DIR.
+# All worker processes must see the same directory.
+BLOB_DIR = os.getenv("BLOB_DIR", "./blobs")
+# Blobs not read or written for this long are deleted.
+BLOB_TTL = float(os.getenv("BLOB_TTL", os.getenv("JOB_TTL", "86400")))
+# Least recently used blobs are deleted once the directory grows past this.
+BLOB_MAX_DISK_BYTES = int(os.getenv("BLOB_MAX_DISK_BYTES", str(1024 * 1024 * 1024)))
+# Recently used blobs are also kept in memory, up to this many bytes per process.
+BLOB_MEMORY_BYTES = int(os.getenv("BLOB_MEMORY_BYTES", str(32 * 1024 * 1024)))
+
+
+class BlobStore:
+    """
+    Content-addressed file store with LRU/TTL eviction and a small in-memory LRU in
+    front of it. File access time is tracked through mtime, which get() refreshes.
+    """
+
+    def __init__(self, root: str, ttl: float, max_disk_bytes: int, memory_bytes: int):
+        self.root = root
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_bytes = memory_bytes
+        self._memory = OrderedDict()
+        self._resident_bytes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, blob_hash: str) -> str:
+        return os.path.join(self.root, blob_hash[:2], blob_hash)
+
+    def _remember(self, blob_hash: str, content: bytes):
+        if len(content) > self.memory_bytes:
+            return
+        with self._lock:
+            if blob_hash in self._memory:
+                self._memory.move_to_end(blob_hash)
+                return
+            self._memory[blob_hash] = content
+            self._resident_bytes += len(content)
+            while self._resident_bytes > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._resident_bytes -= len(evicted)
+
+    def _forget(self, blob_hash: str):
+        with self._lock:
+            content = self._memory.pop(blob_hash, None)
+            if content is not None:
+                self._resident_bytes -= len(content)
+
+    def put(self, content: bytes) -> str:
+        """Stores `content` and returns its sha256. Storing the same bytes twice is a no-op."""
+        blob_hash = hashlib.sha256(content).hexdigest()
+        path = self._path(blob_hash)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so other processes never read a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(content)
+            os.replace(tmp_path, path)
+        self._remember(blob_hash, content)
+        return blob_hash
+
+    def spool(self):
+        """
+        Opens a temporary file next to the blobs for put_file(). Returns (file, path).
+        Left-over spool files are removed by evict() once they are older than the TTL.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        return os.fdopen(fd, "wb"), tmp_path
+
+    def put_file(self, tmp_path: str, blob_hash: str) -> str:
+        """
+        Stores a file written through spool() under `blob_hash` (its sha256, computed by
+        the caller while writing) by renaming it, so the bytes are never read back.
+        """
+        path = self._path(blob_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            os.utime(path)
+        else:
+            os.replace(tmp_path, path)
+        return blob_hash
+
+    def get(self, blob_hash: str):
+        """Returns the stored bytes, or None if they were never stored or have been evicted."""
+        with self._lock:
+            content = self._memory.get(blob_hash)
+            if content is not None:
+                self._memory.move_to_end(blob_hash)
+        path = self._path(blob_hash)
+        try:
+            os.utime(path)
+            if content is None:
+                with open(path, "rb") as fh:
+                    content = fh.read()
+        except FileNotFoundError:
+            # Evicted from disk (possibly by another process)
+            self._forget(blob_hash)
+            return None
+        self._remember(blob_hash, content)
+        return content
+
+    def exists(self, blob_hash: str) -> bool:
+        return os.path.exists(self._path(blob_hash))
+
+    def _files(self):
+        files = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, name, path))
+        return files
+
+    def evict(self, keep=frozenset()) -> int:
+        """
+        Deletes expired blobs, then least recently used ones until under the size limit.
+        Hashes in `keep` (images of jobs still waiting or running) are never deleted.
+        """
+        now = time.time()
+        files = sorted(self._files())
+        total = sum(size for _, size, _, _ in files)
+        removed = 0
+        for mtime, size, name, path in files:
+            # Leftover .tmp files from a crashed write expire like any other
+            if mtime > now - self.ttl and total <= self.max_disk_bytes:
+                break
+            if name in keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._forget(name)
+            total -= size
+            removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        files = self._files()
+        return {
+            "resident_bytes": self._resident_bytes,
+            "resident_blobs": len(self._memory),
+            "memory_limit_bytes": self.memory_bytes,
+            "disk_bytes": sum(size for _, size, _, _ in files),
+            "disk_blobs": len(files),
+            "disk_limit_bytes": self.max_disk_bytes,
+        }
+
+
+blob_store = BlobStore(BLOB_DIR, BLOB_TTL, BLOB_MAX_DISK_BYTES, BLOB_MEMORY_BYTES)
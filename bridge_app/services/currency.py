@@ -1,32 +1,279 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from datetime import date, timedelta
 import httpx
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models import ExchangeRate
 
-async def get_exchange_rate(from_curr: str, to_curr: str, date_str: str) -> float:
+FRANKFURTER_URL = "https://api.frankfurter.app"
+
+# Frankfurter publishes every rate against EUR. One EUR table per date is fetched and
+# any other pair is derived from it as a cross rate, e.g. GBP->USD = (EUR->USD) / (EUR->GBP).
+BASE_CURRENCY = "EUR"
+
+# Used until Frankfurter's own currency list has been loaded
+DEFAULT_CURRENCIES = {"EUR", "USD", "GBP", "JPY"}
+
+# Historical rates never change, so they are kept until evicted by the LRU bound.
+RATE_CACHE_SIZE = int(os.getenv("FX_RATE_CACHE_SIZE", "1024"))
+# "latest" rates move during the day, so they are only reused briefly.
+LATEST_RATE_TTL = float(os.getenv("FX_LATEST_RATE_TTL", "900"))
+
+# prefetch_rates() fetches this many days before its range, so days at the start that
+# fall on a weekend or holiday still get the preceding working day's rates.
+PREFETCH_LOOKBACK_DAYS = 10
+
+# Frankfurter requests in flight at once, across all background workers in this process.
+FX_CONCURRENCY = int(os.getenv("FX_CONCURRENCY", "4"))
+
+# Shared client so Frankfurter calls reuse keep-alive connections.
+_client = None
+_fx_slots = asyncio.Semaphore(FX_CONCURRENCY)
+
+# { date_str: { currency: rate against BASE_CURRENCY } }, least recently used first
+_historical_tables = OrderedDict()
+# (expires_at, table) for the latest published rates
+_latest_table = None
+# Dates Frankfurter has no rates for yet (today/future), { date_str: expires_at }
+_unpublished_dates = {}
+# Recent dates answered with an earlier day's rates, which may still be replaced once
+# the day's own rates are published, { date_str: (expires_at, table) }
+_provisional_tables = {}
+# Currency codes Frankfurter publishes, loaded once
+_supported_currencies = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=FRANKFURTER_URL,
+            timeout=10.0,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+        )
+    return _client
+
+async def close_client():
+    """Closes the shared HTTP client. Called on application shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def get_supported_currencies() -> set:
+    """Returns every currency code Frankfurter publishes rates for."""
+    global _supported_currencies
+    if _supported_currencies is None:
+        try:
+            response = await get_client().get("/currencies")
+            response.raise_for_status()
+            _supported_currencies = set(response.json())
+        except Exception as e:
+            print(f"Could not load Frankfurter currencies, using defaults: {e}")
+            return DEFAULT_CURRENCIES
+    return _supported_currencies
+
+async def is_supported_currency(currency: str) -> bool:
+    return currency in await get_supported_currencies()
+
+async def get_exchange_rate(from_curr: str, to_curr: str, date_str: str, db: AsyncSession = None) -> float:
     """
     Fetch the exchange rate for a specific date using Frankfurter API.
     date_str: YYYY-MM-DD
+
+    If `db` is given, rates stored in the exchange_rates table are used first and
+    rates fetched from Frankfurter are saved there.
+    """
+    table = await get_rate_table(date_str, db)
+    return cross_rate(table, from_curr, to_curr)
+
+def cross_rate(table: dict, from_curr: str, to_curr: str) -> float:
+    """Derives from_curr -> to_curr from a table of rates against BASE_CURRENCY."""
+    if from_curr not in table or to_curr not in table:
+        missing = from_curr if from_curr not in table else to_curr
+        raise ValueError(f"No exchange rate published for {missing}")
+    return table[to_curr] / table[from_curr]
+
+async def convert_many(amounts: list, currencies: list, dates: list, to_curr: str = "USD", db: AsyncSession = None) -> list:
+    """
+    Converts amounts[i] in currencies[i] on dates[i] (YYYY-MM-DD) to `to_curr`, e.g. for
+    a batch import. Each distinct date costs at most one rate table lookup, whatever
+    the currencies involved.
+    """
+    if not len(amounts) == len(currencies) == len(dates):
+        raise ValueError("amounts, currencies and dates must have the same length")
+
+    unique_dates = list(dict.fromkeys(dates))
+    if db is None:
+        tables = await asyncio.gather(*(get_rate_table(d) for d in unique_dates))
+    else:
+        # An AsyncSession can't run queries concurrently
+        tables = [await get_rate_table(d, db) for d in unique_dates]
+    tables = dict(zip(unique_dates, tables))
+
+    return [
+        float(amount) * cross_rate(tables[day], curr, to_curr)
+        for amount, curr, day in zip(amounts, currencies, dates)
+    ]
+
+async def get_rate_table(date_str: str, db: AsyncSession = None) -> dict:
+    """
+    Returns every rate against BASE_CURRENCY for a date as { currency: rate }, looking
+    in memory, then in the exchange_rates table (if `db` is given), then at Frankfurter.
     """
-    # Frankfurter API format
-    url = f"https://api.frankfurter.app/{date_str}?from={from_curr}&to={to_curr}"
-    
-    async with httpx.AsyncClient() as client:
+    if date_str in _historical_tables:
+        _historical_tables.move_to_end(date_str)
+        return _historical_tables[date_str]
+    if db is not None:
+        table = await get_stored_table(db, date.fromisoformat(date_str))
+        if table:
+            _remember_table(date_str, table)
+            return table
+    if _unpublished_dates.get(date_str, 0) > time.monotonic():
+        return await get_latest_table()
+    provisional = _provisional_tables.get(date_str)
+    if provisional and provisional[0] > time.monotonic():
+        return provisional[1]
+
+    try:
+        # Frankfurter API format
+        async with _fx_slots:
+            response = await get_client().get(f"/{date_str}", params={"from": BASE_CURRENCY})
+        response.raise_for_status()
+        payload = response.json()
+        table = _with_base(payload["rates"])
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+             # Date might be today/weekend/future. Fallback to latest.
+             print(f"Frankfurter 404 for {date_str}, trying without date (latest)")
+             now = time.monotonic()
+             for stale in [d for d, expires_at in _unpublished_dates.items() if expires_at <= now]:
+                 del _unpublished_dates[stale]
+             _unpublished_dates[date_str] = now + LATEST_RATE_TTL
+             return await get_latest_table()
+        raise e
+    except Exception as e:
+        print(f"Currency rate lookup error ({date_str}): {e}")
+        raise e
+
+    if _is_provisional(date_str, payload.get("date", date_str)):
+        # e.g. today's rates before the ECB has published them: Frankfurter answers with
+        # the previous working day's, so they are neither kept for good nor stored
+        now = time.monotonic()
+        for stale in [d for d, (expires_at, _) in _provisional_tables.items() if expires_at <= now]:
+            del _provisional_tables[stale]
+        _provisional_tables[date_str] = (now + LATEST_RATE_TTL, table)
+        return table
+
+    _remember_table(date_str, table)
+    if db is not None:
+        day = date.fromisoformat(date_str)
+        rows = [(BASE_CURRENCY, curr, day, rate) for curr, rate in table.items() if curr != BASE_CURRENCY]
         try:
-            response = await client.get(url, timeout=10.0)
-            response.raise_for_status()
-            data = response.json()
-            return data["rates"][to_curr]
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 404:
-                 # Date might be today/weekend/future. Fallback to latest.
-                 print(f"Frankfurter 404 for {date_str}, trying without date (latest)")
-                 return await get_latest_rate(from_curr, to_curr)
-            raise e
+            await store_rates(db, rows)
         except Exception as e:
-            print(f"Currency conversion error ({from_curr}->{to_curr}): {e}")
-            raise e
-
-async def get_latest_rate(from_curr: str, to_curr: str) -> float:
-    url = f"https://api.frankfurter.app/latest?from={from_curr}&to={to_curr}"
-    async with httpx.AsyncClient() as client:
-         response = await client.get(url)
-         data = response.json()
-         return data["rates"][to_curr]
+            # e.g. another job stored the same rates first; the in-memory cache still has them
+            print(f"Could not save exchange rates for {date_str}: {e}")
+            await db.rollback()
+    return table
+
+def _is_provisional(date_str: str, published_date: str) -> bool:
+    """
+    True if Frankfurter answered a request for `date_str` with another day's rates and
+    `date_str` is recent enough that its own rates may still be published. Older
+    weekends and holidays also get an earlier day's rates, but those never change.
+    """
+    if published_date == date_str:
+        return False
+    return date.fromisoformat(date_str) >= date.today() - timedelta(days=1)
+
+def _with_base(rates: dict) -> dict:
+    return {**rates, BASE_CURRENCY: 1.0}
+
+def _remember_table(date_str: str, table: dict):
+    _historical_tables[date_str] = table
+    if len(_historical_tables) > RATE_CACHE_SIZE:
+        _historical_tables.popitem(last=False)
+
+async def get_latest_table() -> dict:
+    global _latest_table
+    if _latest_table and _latest_table[0] > time.monotonic():
+        return _latest_table[1]
+
+    async with _fx_slots:
+        response = await get_client().get("/latest", params={"from": BASE_CURRENCY})
+    response.raise_for_status()
+    table = _with_base(response.json()["rates"])
+    _latest_table = (time.monotonic() + LATEST_RATE_TTL, table)
+    return table
+
+async def get_stored_table(db: AsyncSession, day: date) -> dict:
+    """
+    Loads the rates against BASE_CURRENCY stored in the exchange_rates table for `day`.
+    Returns an empty dict if none are stored.
+    """
+    stmt = select(ExchangeRate.quote, ExchangeRate.rate).where(
+        ExchangeRate.base == BASE_CURRENCY,
+        ExchangeRate.date == day,
+    )
+    rows = (await db.execute(stmt)).all()
+    return _with_base(dict(rows)) if rows else {}
+
+async def store_rates(db: AsyncSession, rows: list):
+    """
+    Bulk-inserts (base, quote, date, rate) rows, skipping any already stored.
+    Returns the number of rows inserted.
+    """
+    if not rows:
+        return 0
+    days = [row[2] for row in rows]
+    stmt = select(ExchangeRate.base, ExchangeRate.quote, ExchangeRate.date).where(
+        ExchangeRate.date >= min(days), ExchangeRate.date <= max(days)
+    )
+    existing = set((await db.execute(stmt)).all())
+
+    new_rows = {}
+    for base, quote, day, rate in rows:
+        if (base, quote, day) not in existing:
+            new_rows[(base, quote, day)] = ExchangeRate(base=base, quote=quote, date=day, rate=rate)
+    db.add_all(new_rows.values())
+    await db.commit()
+    return len(new_rows)
+
+async def prefetch_rates(db: AsyncSession, start_date: str, end_date: str) -> int:
+    """
+    Fetches every rate Frankfurter publishes between two dates (YYYY-MM-DD) with a single
+    time-series request and stores them in the exchange_rates table.
+
+    Frankfurter only publishes rates on working days. As for a single-date request,
+    every day from start_date through end_date (or today, if that comes first) is
+    stored with the nearest earlier published rates, including weekends and holidays
+    at either end of the range.
+    Returns the number of rows inserted.
+    """
+    start = date.fromisoformat(start_date)
+    end = min(date.fromisoformat(end_date), date.today())
+    if end < start:
+        return 0
+
+    # Reach back far enough to find a working day before a start on a weekend or holiday
+    fetch_from = start - timedelta(days=PREFETCH_LOOKBACK_DAYS)
+    response = await get_client().get(f"/{fetch_from.isoformat()}..{end.isoformat()}", params={"from": BASE_CURRENCY})
+    response.raise_for_status()
+    published = {date.fromisoformat(d): rates for d, rates in response.json()["rates"].items()}
+
+    earlier = [d for d in published if d <= start]
+    rates = published[max(earlier)] if earlier else None
+    rows = []
+    day = start
+    while day <= end:
+        rates = published.get(day, rates)
+        # Nothing to carry forward before the first rate Frankfurter has
+        for curr, rate in (rates or {}).items():
+            rows.append((BASE_CURRENCY, curr, day, rate))
+        day += timedelta(days=1)
+
+    return await store_rates(db, rows)
@@ -0,0 +1,73 @@
+import os
+import re
+import unicodedata
+from datetime import date, timedelta
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models import Transaction
+
+# Fuzzy window for "same purchase": dates this many days apart and amounts within
+# this fraction of each other (same currency, same normalized merchant).
+DEDUP_DAY_WINDOW = int(os.getenv("DEDUP_DAY_WINDOW", "1"))
+DEDUP_AMOUNT_TOLERANCE = float(os.getenv("DEDUP_AMOUNT_TOLERANCE", "0.01"))
+
+
+def normalize_merchant(merchant: str) -> str:
+    """'Café  de FLORE, Paris!' -> 'cafe de flore paris'"""
+    text = unicodedata.normalize("NFKD", str(merchant or ""))
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def semantic_key(data: dict, currency: str):
+    """
+    Returns the normalized (date, amount in cents, currency, merchant) of a transaction,
+    in its original currency, or None if any part is missing or unparseable.
+    """
+    try:
+        tx_date = date.fromisoformat(str(data["date"]))
+        amount_cents = round(abs(float(data["amount"])) * 100)
+    except (KeyError, TypeError, ValueError):
+        return None
+    merchant_key = normalize_merchant(data.get("merchant"))
+    if not merchant_key or not currency:
+        return None
+    return {
+        "tx_date": tx_date,
+        "amount_cents": amount_cents,
+        "currency": currency,
+        "merchant_key": merchant_key,
+    }
+
+
+def same_purchase(transaction: Transaction, key: dict) -> bool:
+    """True if a stored transaction matches `key` within the fuzzy window."""
+    if transaction.tx_date is None or transaction.amount_cents is None:
+        return False
+    days = timedelta(days=DEDUP_DAY_WINDOW)
+    slack = round(key["amount_cents"] * DEDUP_AMOUNT_TOLERANCE)
+    return (
+        transaction.currency == key["currency"]
+        and transaction.merchant_key == key["merchant_key"]
+        and abs(transaction.tx_date - key["tx_date"]) <= days
+        and abs(transaction.amount_cents - key["amount_cents"]) <= slack
+    )
+
+
+async def find_semantic_duplicate(db: AsyncSession, key: dict):
+    """Finds a stored transaction matching `key` within the fuzzy window, or None."""
+    days = timedelta(days=DEDUP_DAY_WINDOW)
+    slack = round(key["amount_cents"] * DEDUP_AMOUNT_TOLERANCE)
+    stmt = (
+        select(Transaction)
+        .where(
+            Transaction.currency == key["currency"],
+            Transaction.merchant_key == key["merchant_key"],
+            Transaction.tx_date.between(key["tx_date"] - days, key["tx_date"] + days),
+            Transaction.amount_cents.between(
+                key["amount_cents"] - slack, key["amount_cents"] + slack
+            ),
+        )
+        .limit(1)
+    )
+    return (await db.execute(stmt)).scalar_one_or_none()
@@ -1,37 +1,92 @@
 import os
 import json
+import time
+import asyncio
 from google import genai
-from PIL import Image
+from google.genai import types
+from PIL import Image, ImageOps
 import io
+from .phash import dhash
 
-def extract_transaction_data(image_bytes: bytes) -> dict:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        return {"error": "GEMINI_API_KEY not set"}
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-3-flash-preview")
 
-    # Initialize Client
-    client = genai.Client(api_key=api_key)
-    
-    # Prompt engineering
-    prompt = """
+# Receipt photos are downscaled so their longest side is at most this many pixels
+# before upload. Text stays legible for OCR well below full phone camera resolution.
+OCR_MAX_DIMENSION = int(os.getenv("OCR_MAX_DIMENSION", "1600"))
+OCR_JPEG_QUALITY = int(os.getenv("OCR_JPEG_QUALITY", "85"))
+OCR_GRAYSCALE = os.getenv("OCR_GRAYSCALE", "true").lower() in ("1", "true", "yes")
+# Gemini requests allowed in flight at once; further receipts wait their turn.
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", "8"))
+
+# Prompt engineering
+PROMPT = """
     You are a financial data extractor. Extract the following from the receipt image:
     - date (YYYY-MM-DD)
     - amount (float)
     - currency (ISO code, assume EUR if not specified but likely European)
     - merchant (string, clean name)
-    
+
     Return strictly valid JSON with keys: date, amount, currency, merchant.
     """
-    
+
+# Long-lived client so its HTTP connections are reused between receipts.
+_client = None
+_client_api_key = None
+_ocr_slots = asyncio.Semaphore(OCR_CONCURRENCY)
+
+
+def get_client(api_key: str) -> genai.Client:
+    global _client, _client_api_key
+    if _client is None or _client_api_key != api_key:
+        _client = genai.Client(api_key=api_key)
+        _client_api_key = api_key
+    return _client
+
+def preprocess_image(image_bytes: bytes) -> tuple:
+    """
+    Decodes the image once, applies its EXIF orientation, converts it to grayscale
+    (unless OCR_GRAYSCALE is off) and re-encodes it as a JPEG no larger than
+    OCR_MAX_DIMENSION on its longest side.
+    Returns (jpeg_bytes, perceptual_hash).
+    """
+    started = time.perf_counter()
+    image = Image.open(io.BytesIO(image_bytes))
+    image = ImageOps.exif_transpose(image)
+    image = image.convert("L" if OCR_GRAYSCALE else "RGB")
+    image.thumbnail((OCR_MAX_DIMENSION, OCR_MAX_DIMENSION), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=OCR_JPEG_QUALITY, optimize=True)
+    processed = buffer.getvalue()
+    perceptual_hash = dhash(image)
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    saved = len(image_bytes) - len(processed)
+    print(f"OCR preprocessing: {len(image_bytes)} -> {len(processed)} bytes "
+          f"({saved} saved, {image.width}x{image.height}) in {elapsed_ms:.0f}ms")
+    return processed, perceptual_hash
+
+async def extract_transaction_data(jpeg_bytes: bytes) -> dict:
+    """
+    Extracts date, amount, currency and merchant from a receipt already run through
+    preprocess_image().
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        return {"error": "GEMINI_API_KEY not set"}
+
+    client = get_client(api_key)
+
     try:
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # New SDK call
-        response = client.models.generate_content(
-            model="gemini-3-flash-preview", 
-            contents=[prompt, image]
-        )
-        
+        image = types.Part.from_bytes(data=jpeg_bytes, mime_type="image/jpeg")
+
+        # Async SDK call, so waiting on Gemini doesn't hold a worker thread
+        async with _ocr_slots:
+            response = await client.aio.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=[PROMPT, image]
+            )
+
         # Clean response to ensure it's JSON
         # The new SDK response object also has a .text property
         text_response = response.text.replace("```json", "").replace("```", "").strip()
@@ -0,0 +1,111 @@
+import os
+import hashlib
+import zipfile
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+from .blobstore import blob_store
+from .jobs import UPLOAD_MAX_BYTES, BATCH_MAX_FILES, BATCH_MAX_BYTES
+
+# Uploads are copied into the blob store this many bytes at a time.
+INTAKE_CHUNK_BYTES = int(os.getenv("INTAKE_CHUNK_BYTES", str(64 * 1024)))
+
+# Files inside a /batch zip archive that are queued as receipts. Only formats the
+# OCR step can decode, so a batch never queues images that are bound to fail.
+BATCH_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+def _spool_stream(source, name: str, max_bytes: int):
+    """
+    Copies a binary file object into the blob store in chunks, hashing as it goes.
+    Returns (sha256, size). Blocking, so call it from a worker thread.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    fh, tmp_path = blob_store.spool()
+    try:
+        with fh:
+            while chunk := source.read(INTAKE_CHUNK_BYTES):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"{name} is larger than {max_bytes} bytes")
+                hasher.update(chunk)
+                fh.write(chunk)
+        return blob_store.put_file(tmp_path, hasher.hexdigest()), size
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+async def spool_upload(file: UploadFile, max_bytes: int = UPLOAD_MAX_BYTES) -> str:
+    """
+    Streams an uploaded file into the blob store in chunks, hashing as it goes, and
+    returns its sha256. Only one chunk is held in memory at a time; uploads larger
+    than `max_bytes` raise UploadTooLarge.
+    """
+    blob_hash, _ = await run_in_threadpool(
+        _spool_stream, file.file, file.filename, max_bytes
+    )
+    return blob_hash
+
+
+def spool_batch(
+    files: list, max_files: int = BATCH_MAX_FILES, max_bytes: int = BATCH_MAX_BYTES
+) -> list:
+    """
+    Streams the files posted to /batch into the blob store: each plain file, and each
+    image inside a zip archive. Returns [(filename, sha256)]. Blocking, so call it from
+    a worker thread.
+
+    Raises UploadTooLarge for an image over UPLOAD_MAX_BYTES, more than `max_files`
+    images, or images adding up to more than `max_bytes`, and ValueError for a broken
+    zip archive. Images stored before the error are left for the blob store to expire.
+    """
+    images = []
+    total = 0
+
+    def add(source, name: str):
+        nonlocal total
+        if len(images) >= max_files:
+            raise UploadTooLarge(f"At most {max_files} images per batch")
+        blob_hash, size = _spool_stream(source, name, UPLOAD_MAX_BYTES)
+        total += size
+        if total > max_bytes:
+            raise UploadTooLarge(f"The images add up to more than {max_bytes} bytes")
+        images.append((name, blob_hash))
+
+    for file in files:
+        source = file.file
+        source.seek(0)
+        if not zipfile.is_zipfile(source):
+            source.seek(0)
+            add(source, file.filename)
+            continue
+
+        source.seek(0)
+        try:
+            with zipfile.ZipFile(source) as archive:
+                for info in archive.infolist():
+                    name = info.filename
+                    if (
+                        info.is_dir()
+                        or name.startswith("__MACOSX/")
+                        or os.path.basename(name).startswith(".")
+                    ):
+                        continue
+                    if not name.lower().endswith(BATCH_IMAGE_EXTENSIONS):
+                        continue
+                    # Checked before extracting, so a zip bomb is never inflated
+                    if info.file_size > UPLOAD_MAX_BYTES:
+                        raise UploadTooLarge(
+                            f"{name} is larger than {UPLOAD_MAX_BYTES} bytes"
+                        )
+                    with archive.open(info) as member:
+                        add(member, name)
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"{file.filename} is not a readable zip archive: {e}")
+    return images
@@ -0,0 +1,671 @@
+import os
+import uuid
+import socket
+import asyncio
+import traceback
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import update, delete, func, or_, and_
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import AsyncSessionLocal
+from ..models import Job
+from .blobstore import blob_store
+from starlette.concurrency import run_in_threadpool
+from fastapi import HTTPException
+
+# A processing job whose worker hasn't renewed its lease for this long is assumed
+# lost (crashed/restarted worker) and is handed to another worker.
+JOB_VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "120"))
+# How often a running job's lease is renewed, whether or not it reports progress, so
+# a slow OCR or Monarch call doesn't get the job handed to another worker.
+JOB_HEARTBEAT_INTERVAL = float(
+    os.getenv("JOB_HEARTBEAT_INTERVAL", str(JOB_VISIBILITY_TIMEOUT / 3))
+)
+# Finished jobs are deleted this long after finishing. Their uploaded images live in
+# the blob store, which has its own expiry (BLOB_TTL).
+JOB_TTL = float(os.getenv("JOB_TTL", "86400"))
+# How often an idle worker checks for jobs queued by other processes.
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+# Jobs picked up this many times without finishing are marked failed.
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Jobs each process works on at once.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Single uploads (/share, /upload, /manual, retries) are refused with 429 while this
+# many of them are waiting to start. Jobs from /batch are counted separately.
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", "50"))
+# A /batch upload is refused with 429 if it would leave more than this many batched
+# receipts waiting, so big batches never crowd out single shares.
+BATCH_QUEUE_LIMIT = int(os.getenv("BATCH_QUEUE_LIMIT", "1000"))
+# On shutdown, seconds to let running jobs finish before returning them to the queue.
+JOB_DRAIN_TIMEOUT = float(os.getenv("JOB_DRAIN_TIMEOUT", "30"))
+# Largest receipt image accepted, and most receipts and bytes accepted in one /batch
+# request (the images' total, and the request body's size).
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "200"))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(256 * 1024 * 1024)))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# How often /job/{job_id}/events re-reads a job from the database. Progress from this
+# process is pushed immediately; this only matters for jobs run by other processes.
+JOB_EVENTS_POLL_INTERVAL = float(os.getenv("JOB_EVENTS_POLL_INTERVAL", "2"))
+
+# Set when this process queues a job, so its worker starts without waiting for a poll
+_wakeup = asyncio.Event()
+
+# Open progress streams in this process, { job_id: set of asyncio.Queue }
+_subscribers = {}
+
+
+def _utcnow() -> datetime:
+    # Stored naive so SQLite and Postgres compare them the same way
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _claimable(now: datetime):
+    return or_(
+        Job.status == "queued",
+        and_(Job.status == "processing", Job.lease_expires_at < now),
+    )
+
+
+async def enqueue_job(
+    db: AsyncSession,
+    content: bytes = None,
+    user_currency: str = None,
+    manual_data: dict = None,
+    content_hash: str = None,
+) -> str:
+    """
+    Queues an image (`content`, or `content_hash` of one already in the blob store)
+    or a manual entry.
+    """
+    job_id = await _add_job(
+        db, content, user_currency, manual_data, content_hash=content_hash
+    )
+    await db.commit()
+    _wakeup.set()
+    return job_id
+
+
+async def add_finished_job(
+    db: AsyncSession, content_hash: str, result: dict, user_currency: str = None
+) -> str:
+    """
+    Records a job that needed no processing, e.g. an upload already known to be a
+    duplicate, so clients follow it like any other and can still retry it with force.
+    """
+    job_id = str(uuid.uuid4())
+    now = _utcnow()
+    db.add(
+        Job(
+            id=job_id,
+            status="completed",
+            step="Done",
+            progress=100,
+            result=result,
+            content_hash=content_hash,
+            user_currency=user_currency,
+            created_at=now,
+            expires_at=now + timedelta(seconds=JOB_TTL),
+        )
+    )
+    await db.commit()
+    return job_id
+
+
+async def _add_job(
+    db: AsyncSession,
+    content: bytes = None,
+    user_currency: str = None,
+    manual_data: dict = None,
+    batch_id: str = None,
+    filename: str = None,
+    content_hash: str = None,
+) -> str:
+    job_id = str(uuid.uuid4())
+    # The image goes to disk; the job row only references it by hash
+    if content is not None:
+        content_hash = await run_in_threadpool(blob_store.put, content)
+    db.add(
+        Job(
+            id=job_id,
+            status="queued",
+            step="Waiting in line...",
+            content_hash=content_hash,
+            user_currency=user_currency,
+            manual_data=manual_data,
+            batch_id=batch_id,
+            filename=filename,
+            created_at=_utcnow(),
+        )
+    )
+    return job_id
+
+
+async def enqueue_batch(
+    db: AsyncSession, images: list, user_currency: str = None
+) -> dict:
+    """
+    Queues one job per (filename, content_hash) in `images`, already in the blob
+    store, under a shared batch id. Identical images are only queued once; later
+    copies point at the first job.
+    """
+    batch_id = str(uuid.uuid4())
+    items = []
+    job_for_hash = {}
+    for filename, image_hash in images:
+        if image_hash in job_for_hash:
+            items.append(
+                {
+                    "filename": filename,
+                    "job_id": job_for_hash[image_hash],
+                    "duplicate_in_batch": True,
+                }
+            )
+            continue
+        job_id = await _add_job(
+            db,
+            user_currency=user_currency,
+            batch_id=batch_id,
+            filename=filename,
+            content_hash=image_hash,
+        )
+        job_for_hash[image_hash] = job_id
+        items.append({"filename": filename, "job_id": job_id})
+    await db.commit()
+    _wakeup.set()
+    return {"batch_id": batch_id, "items": items}
+
+
+async def get_batch_status(db: AsyncSession, batch_id: str):
+    stmt = select(Job).where(Job.batch_id == batch_id).order_by(Job.created_at)
+    jobs = (await db.execute(stmt)).scalars().all()
+    if not jobs:
+        return None
+    items = [
+        {"job_id": job.id, "filename": job.filename, **job_status(job)} for job in jobs
+    ]
+    counts = {}
+    for item in items:
+        counts[item["status"]] = counts.get(item["status"], 0) + 1
+    return {"batch_id": batch_id, "total": len(items), "counts": counts, "items": items}
+
+
+async def queue_depth(db: AsyncSession, batch: bool = False) -> int:
+    """Jobs waiting to start: single uploads, or batched ones if `batch`."""
+    in_batch = Job.batch_id.is_not(None) if batch else Job.batch_id.is_(None)
+    stmt = select(func.count()).select_from(Job).where(Job.status == "queued", in_batch)
+    return (await db.execute(stmt)).scalar()
+
+
+async def queue_full(db: AsyncSession, batch: bool = False, adding: int = 1) -> bool:
+    """True if queueing `adding` more jobs would go over their queue's limit."""
+    limit = BATCH_QUEUE_LIMIT if batch else JOB_QUEUE_LIMIT
+    return await queue_depth(db, batch) + adding > limit
+
+
+async def get_job(db: AsyncSession, job_id: str):
+    job = await db.get(Job, job_id)
+    if job is None or (job.expires_at and job.expires_at < _utcnow()):
+        return None
+    return job
+
+
+def can_retry(job: Job) -> bool:
+    if job.manual_data:
+        return True
+    return job.content_hash is not None and blob_store.exists(job.content_hash)
+
+
+def job_status(job: Job) -> dict:
+    """The JSON shape /job/{job_id} has always returned."""
+    if job.status == "completed":
+        return {"status": "completed", "result": job.result, "progress": 100}
+    if job.status == "failed":
+        return {"status": "failed", "error": job.error, "progress": 0}
+    # Queued jobs look like processing ones to the client
+    return {"status": "processing", "step": job.step, "progress": job.progress}
+
+
+def _publish(job_id: str, status: dict):
+    for queue in _subscribers.get(job_id, ()):
+        queue.put_nowait(status)
+
+
+async def job_events(job_id: str):
+    """
+    Yields the job's status (as returned by /job/{job_id}) every time it changes,
+    until it completes or fails, and None as a keep-alive while nothing happens.
+    """
+    queue = asyncio.Queue()
+    _subscribers.setdefault(job_id, set()).add(queue)
+    try:
+        last = None
+        while True:
+            try:
+                status = await asyncio.wait_for(
+                    queue.get(), timeout=JOB_EVENTS_POLL_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                # Nothing published here; the job may be running in another process
+                async with AsyncSessionLocal() as db:
+                    job = await get_job(db, job_id)
+                if job is None:
+                    return
+                status = job_status(job)
+
+            if status == last:
+                yield None
+                continue
+            last = status
+            yield status
+            if status["status"] in ("completed", "failed"):
+                return
+    finally:
+        _subscribers[job_id].discard(queue)
+        if not _subscribers[job_id]:
+            del _subscribers[job_id]
+
+
+async def requeue_job(db: AsyncSession, job: Job, force_override: bool = False):
+    job.status = "queued"
+    job.step = "Retrying..."
+    job.progress = 0
+    job.result = None
+    job.error = None
+    job.force_override = force_override
+    if force_override:
+        # Submitting anyway asks for a new Monarch transaction
+        job.monarch_tx_id = None
+    job.attempts = 0
+    job.lease_owner = None
+    job.lease_expires_at = None
+    job.expires_at = None
+    await db.commit()
+    _publish(job.id, job_status(job))
+    _wakeup.set()
+
+
+async def claim_job():
+    """
+    Leases the oldest queued job, or a processing one whose lease has expired.
+    Returns the Job, or None if there is nothing to do. `job.lease_owner` holds this
+    claim's lease token, needed to report progress on, release or finish the job.
+    """
+    async with AsyncSessionLocal() as db:
+        while True:
+            now = _utcnow()
+            # Single shares first, so a large batch doesn't hold up someone waiting on their phone
+            stmt = (
+                select(Job.id)
+                .where(_claimable(now))
+                .order_by(Job.batch_id.is_not(None), Job.created_at)
+                .limit(1)
+            )
+            job_id = (await db.execute(stmt)).scalar_one_or_none()
+            if job_id is None:
+                return None
+
+            # A token per claim, not per process: if this lease expires and the job is
+            # claimed again (even by another of this process's workers), only the new
+            # claim may still update it
+            lease = f"{WORKER_ID}/{uuid.uuid4().hex}"
+            # Conditional update, so when several workers race for the same job only one wins
+            claim = (
+                update(Job)
+                .where(Job.id == job_id, _claimable(now))
+                .values(
+                    status="processing",
+                    lease_owner=lease,
+                    lease_expires_at=now + timedelta(seconds=JOB_VISIBILITY_TIMEOUT),
+                    attempts=Job.attempts + 1,
+                )
+            )
+            claimed = (await db.execute(claim)).rowcount == 1
+            await db.commit()
+            if not claimed:
+                continue
+
+            job = await db.get(Job, job_id, populate_existing=True)
+            if job.attempts > JOB_MAX_ATTEMPTS:
+                print(f"Job {job_id} abandoned after {job.attempts - 1} attempts")
+                await finish_job(
+                    job_id,
+                    lease,
+                    "failed",
+                    error="This job kept getting interrupted. Please try again.",
+                )
+                continue
+            return job
+
+
+async def report_progress(job_id: str, lease: str, step: str, progress: int = None):
+    """Records progress and extends the lease, as long as this claim still holds it."""
+    values = {
+        "step": step,
+        "lease_expires_at": _utcnow() + timedelta(seconds=JOB_VISIBILITY_TIMEOUT),
+    }
+    if progress is not None:
+        values["progress"] = progress
+    async with AsyncSessionLocal() as db:
+        stmt = (
+            update(Job)
+            .where(Job.id == job_id, Job.lease_owner == lease)
+            .values(**values)
+        )
+        updated = (await db.execute(stmt)).rowcount == 1
+        await db.commit()
+    if not updated:
+        return
+    status = {"status": "processing", "step": step}
+    if progress is not None:
+        status["progress"] = progress
+    _publish(job_id, status)
+
+
+async def extend_lease(job_id: str, lease: str) -> bool:
+    """
+    Pushes back the lease's expiry. Returns False if this claim no longer holds it.
+    """
+    async with AsyncSessionLocal() as db:
+        stmt = (
+            update(Job)
+            .where(Job.id == job_id, Job.lease_owner == lease)
+            .values(
+                lease_expires_at=_utcnow() + timedelta(seconds=JOB_VISIBILITY_TIMEOUT)
+            )
+        )
+        extended = (await db.execute(stmt)).rowcount == 1
+        await db.commit()
+    return extended
+
+
+async def _heartbeat(job_id: str, lease: str):
+    """Renews the lease every JOB_HEARTBEAT_INTERVAL until cancelled or lost."""
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+        try:
+            if not await extend_lease(job_id, lease):
+                print(f"Job {job_id} is no longer held by lease {lease}")
+                return
+        except Exception as e:
+            # e.g. the database is briefly unreachable; the next beat tries again
+            print(f"Could not renew the lease on job {job_id}: {e}")
+
+
+async def get_pushed_transaction(job_id: str):
+    """The Monarch transaction id already created for this job, or None."""
+    async with AsyncSessionLocal() as db:
+        stmt = select(Job.monarch_tx_id).where(Job.id == job_id)
+        return (await db.execute(stmt)).scalar_one_or_none()
+
+
+async def record_pushed_transaction(job_id: str, monarch_tx_id: str):
+    """Remembers the Monarch transaction created for this job, whichever claim made it."""
+    async with AsyncSessionLocal() as db:
+        stmt = update(Job).where(Job.id == job_id).values(monarch_tx_id=monarch_tx_id)
+        await db.execute(stmt)
+        await db.commit()
+
+
+async def release_job(job_id: str, lease: str):
+    """Returns a job this claim holds to the queue without counting the attempt."""
+    async with AsyncSessionLocal() as db:
+        stmt = (
+            update(Job)
+            .where(Job.id == job_id, Job.lease_owner == lease)
+            .values(
+                status="queued",
+                step="Waiting in line...",
+                attempts=Job.attempts - 1,
+                lease_owner=None,
+                lease_expires_at=None,
+            )
+        )
+        await db.execute(stmt)
+        await db.commit()
+
+
+async def finish_job(
+    job_id: str, lease: str, status: str, result: dict = None, error: str = None
+) -> bool:
+    """
+    Records the outcome of a job, as long as this claim still holds its lease. Returns
+    False (and changes nothing) if the lease expired and the job was claimed again or
+    retried, so a stale worker can't overwrite the newer claim's outcome.
+    """
+    async with AsyncSessionLocal() as db:
+        stmt = (
+            update(Job)
+            .where(Job.id == job_id, Job.lease_owner == lease)
+            .values(
+                status=status,
+                result=result,
+                error=error,
+                progress=100 if status == "completed" else 0,
+                lease_owner=None,
+                lease_expires_at=None,
+                expires_at=_utcnow() + timedelta(seconds=JOB_TTL),
+            )
+        )
+        finished = (await db.execute(stmt)).rowcount == 1
+        await db.commit()
+    if not finished:
+        print(f"Job {job_id} is no longer held by lease {lease}; outcome dropped")
+        return False
+    if status == "completed":
+        _publish(job_id, {"status": "completed", "result": result, "progress": 100})
+    else:
+        _publish(job_id, {"status": "failed", "error": error, "progress": 0})
+    return True
+
+
+async def get_stats(db: AsyncSession) -> dict:
+    stmt = select(Job.status, func.count()).group_by(Job.status)
+    counts = dict((await db.execute(stmt)).all())
+    return {"jobs": counts, "blobs": await run_in_threadpool(blob_store.stats)}
+
+
+async def active_content_hashes() -> set:
+    """Hashes of the images queued or processing jobs still need from the blob store."""
+    async with AsyncSessionLocal() as db:
+        stmt = select(Job.content_hash).where(
+            Job.status.in_(("queued", "processing")), Job.content_hash.is_not(None)
+        )
+        return set((await db.execute(stmt)).scalars().all())
+
+
+async def purge_expired_jobs() -> int:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(delete(Job).where(Job.expires_at < _utcnow()))
+        await db.commit()
+        return result.rowcount
+
+
+async def process_job(job: Job):
+    """
+    Processes a claimed job using a fresh DB session.
+    """
+    from .orchestrator import process_transaction, process_manual_transaction
+
+    job_id = job.id
+    lease = job.lease_owner
+    print(f"Starting background job {job_id}")
+
+    async def progress_callback(step_msg, percent=None):
+        await report_progress(job_id, lease, step_msg, percent)
+
+    content = None
+    if not job.manual_data:
+        content = (
+            await run_in_threadpool(blob_store.get, job.content_hash)
+            if job.content_hash
+            else None
+        )
+        if content is None:
+            await finish_job(
+                job_id,
+                lease,
+                "failed",
+                error="The receipt image has expired. Please share it again.",
+            )
+            return
+
+    # Renews the lease while the job runs, including through long silent stretches
+    # such as waiting for an OCR slot or the Monarch push
+    heartbeat = asyncio.create_task(_heartbeat(job_id, lease))
+    try:
+        max_retries = 3
+        for attempt in range(max_retries):
+            try:
+                if attempt > 0:
+                    print(f"Job {job_id}: Attempt {attempt+1}...")
+
+                async with AsyncSessionLocal() as db:
+                    if job.manual_data:
+                        result = await process_manual_transaction(
+                            job.manual_data,
+                            db,
+                            progress_callback=progress_callback,
+                            force_override=job.force_override,
+                            job_id=job_id,
+                        )
+                    else:
+                        result = await process_transaction(
+                            content,
+                            db,
+                            progress_callback=progress_callback,
+                            user_currency=job.user_currency,
+                            force_override=job.force_override,
+                            job_id=job_id,
+                        )
+
+                # Success
+                if await finish_job(job_id, lease, "completed", result=result):
+                    print(f"Job {job_id} completed successfully")
+                return  # Exit function on success
+
+            except Exception as e:
+                # Check for DB connection errors
+                error_str = str(e)
+                is_db_error = (
+                    "InterfaceError" in str(type(e).__name__)
+                    or "connection is closed" in error_str
+                )
+
+                if is_db_error and attempt < max_retries - 1:
+                    print(f"⚠️ DB Connection Error (Attempt {attempt+1}): {e}")
+                    print("Turning the database snooze button... 💤⏰")
+
+                    # Update UI to inform user
+                    await progress_callback("Waking up database... 🥱")
+                    await asyncio.sleep(2)  # Wait for DB to wake up
+                    continue
+                else:
+                    # Not a DB error or out of retries, raise to outer handler
+                    raise e
+
+    except Exception as e:
+        error_details = traceback.format_exc()
+        print(f"❌ Job {job_id} FAILED:\n{error_details}")
+
+        # User-friendly error mapping
+        err_msg = str(e)
+        if "Connection" in err_msg or "timeout" in err_msg.lower():
+            display_error = "Database connection timed out. Please try again later."
+        elif "GEMINI_API_KEY" in err_msg:
+            display_error = "Server configuration error: Gemini API Key missing."
+        elif "Monarch" in err_msg:
+            display_error = f"Monarch Error: {err_msg}"
+        elif isinstance(e, HTTPException) and e.status_code < 500:
+            # Already worded for the user, e.g. an image that can't be decoded
+            display_error = e.detail
+        else:
+            display_error = f"I hit a snag: {err_msg}"
+
+        await finish_job(job_id, lease, "failed", error=display_error)
+    finally:
+        heartbeat.cancel()
+
+
+class WorkerPool:
+    """
+    JOB_WORKERS background workers per process, all claiming from the jobs table.
+    The pool size caps how many jobs this process runs at once; OCR, FX and Monarch
+    calls are further capped by their own semaphores (OCR_CONCURRENCY, FX_CONCURRENCY,
+    MONARCH_CONCURRENCY).
+    """
+
+    def __init__(self, size: int = JOB_WORKERS):
+        self.size = size
+        self._stop = asyncio.Event()
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.size)]
+        self._tasks.append(asyncio.create_task(self._housekeeping()))
+        print(f"👷 Job worker pool {WORKER_ID} started with {self.size} workers")
+
+    async def _idle(self, timeout: float):
+        """Waits for a local enqueue, the timeout, or shutdown."""
+        waiters = [
+            asyncio.create_task(_wakeup.wait()),
+            asyncio.create_task(self._stop.wait()),
+        ]
+        await asyncio.wait(
+            waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+        for waiter in waiters:
+            waiter.cancel()
+
+    async def _worker(self, n: int):
+        while not self._stop.is_set():
+            job = None
+            try:
+                _wakeup.clear()
+                job = await claim_job()
+                if job is not None:
+                    # More may be waiting; let an idle worker look too
+                    _wakeup.set()
+                    await process_job(job)
+                    continue
+            except asyncio.CancelledError:
+                if job is not None:
+                    # Cut off by shutdown: hand it straight to another worker
+                    await release_job(job.id, job.lease_owner)
+                raise
+            except Exception as e:
+                print(f"Job worker {n} error: {e}")
+            await self._idle(JOB_POLL_INTERVAL)
+
+    async def _housekeeping(self):
+        while not self._stop.is_set():
+            try:
+                purged = await purge_expired_jobs()
+                keep = await active_content_hashes()
+                evicted = await run_in_threadpool(blob_store.evict, keep)
+                if purged or evicted:
+                    print(
+                        f"🧹 Purged {purged} expired jobs and {evicted} receipt images"
+                    )
+            except Exception as e:
+                print(f"Job housekeeping error: {e}")
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=600)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain(self, timeout: float = JOB_DRAIN_TIMEOUT):
+        """
+        Stops claiming new jobs and waits up to `timeout` seconds for running ones to
+        finish. Jobs still running after that are put back in the queue.
+        """
+        self._stop.set()
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        print(f"👷 Job worker pool {WORKER_ID} stopped ({len(pending)} cut short)")
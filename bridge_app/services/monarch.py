@@ -1,6 +1,8 @@
 import os
+import time
 import asyncio
 import pickle
+import weakref
 import pyotp
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -8,8 +10,137 @@ from monarchmoney import MonarchMoney, RequireMFAException
 from ..models import Credentials
 from ..utils.crypto import decrypt
 
-# Path for session persistence - logic says store in DB, but library uses file.
-# We will use DB to store/retrieve the session pickle bytes.
+TAG_NAME = "Imported by MM Bridge"
+TAG_COLOR = "#2196F3" # Material Blue
+
+# How long resolved account/category/tag IDs are trusted before re-fetching from Monarch.
+REFERENCE_CACHE_TTL = float(os.getenv("MM_REFERENCE_CACHE_TTL", "3600"))
+
+
+class ReferenceCache:
+    """
+    Caches name -> id indexes for Monarch reference data (accounts, categories, tags).
+
+    Each index is fetched in full once and then served from memory until its TTL
+    expires. A lookup that misses a fresh index re-fetches it once, in case the item
+    was created in Monarch since the index was built.
+    """
+
+    def __init__(self, ttl: float = REFERENCE_CACHE_TTL):
+        self.ttl = ttl
+        self._indexes = {}  # kind -> (expires_at, {name: id})
+        self._fetches = {}  # kind -> Task, so concurrent misses share one fetch
+
+    def _fresh_index(self, kind: str):
+        entry = self._indexes.get(kind)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    async def resolve(self, kind: str, name: str, fetch_index):
+        """
+        Returns the id for `name`, fetching the index with `fetch_index()` if it is
+        missing, expired or does not contain `name`. Returns None if it still isn't found.
+        """
+        index = self._fresh_index(kind)
+        if index is not None and name in index:
+            return index[name]
+
+        fetch = self._fetches.get(kind)
+        if fetch is None:
+            fetch = asyncio.ensure_future(fetch_index())
+            self._fetches[kind] = fetch
+            fetch.add_done_callback(lambda _: self._fetches.pop(kind, None))
+        index = await asyncio.shield(fetch)
+        self._indexes[kind] = (time.monotonic() + self.ttl, index)
+        return index.get(name)
+
+    def first(self, kind: str):
+        """Returns the first id of a cached index, or None."""
+        index = self._fresh_index(kind)
+        return next(iter(index.values()), None) if index else None
+
+    def remember(self, kind: str, name: str, item_id: str):
+        """Adds a newly created item to a cached index."""
+        index = self._fresh_index(kind)
+        if index is not None:
+            index[name] = item_id
+
+    def invalidate(self, kind: str = None):
+        if kind is None:
+            self._indexes.clear()
+        else:
+            self._indexes.pop(kind, None)
+
+
+# One cache per Monarch client. Each pooled client belongs to a single credential and
+# a re-seeded session gets a new client, so ids never leak between accounts.
+_reference_caches = weakref.WeakKeyDictionary()
+
+def reference_cache_for(mm: MonarchMoney) -> ReferenceCache:
+    """Returns the reference data cache of a Monarch client, creating it on first use."""
+    cache = _reference_caches.get(mm)
+    if cache is None:
+        cache = _reference_caches[mm] = ReferenceCache()
+    return cache
+
+
+# Only the fields the name -> id indexes need, instead of every account/category/tag field
+ACCOUNT_INDEX_FIELDS = ("accounts.id", "accounts.displayName")
+CATEGORY_INDEX_FIELDS = ("categories.id", "categories.name")
+TAG_INDEX_FIELDS = ("householdTransactionTags.id", "householdTransactionTags.name")
+
+async def _fetch_account_index(mm: MonarchMoney) -> dict:
+    accounts = await mm.get_accounts(fields=ACCOUNT_INDEX_FIELDS)
+    return {acc["displayName"]: acc["id"] for acc in accounts.get("accounts", [])}
+
+async def _fetch_category_index(mm: MonarchMoney) -> dict:
+    categories = await mm.get_transaction_categories(fields=CATEGORY_INDEX_FIELDS)
+    return {cat["name"]: cat["id"] for cat in categories.get("categories", [])}
+
+async def _fetch_tag_index(mm: MonarchMoney) -> dict:
+    tags = await mm.get_transaction_tags(fields=TAG_INDEX_FIELDS)
+    return {tag["name"]: tag["id"] for tag in tags.get("householdTransactionTags", [])}
+
+# Held while creating the import tag, so concurrent jobs don't each create one
+_tag_lock = asyncio.Lock()
+
+async def resolve_tag_id(mm: MonarchMoney, tag_name: str = TAG_NAME, tag_color: str = TAG_COLOR) -> str:
+    """Returns the id of the bridge's import tag, creating it in Monarch if missing."""
+    reference_cache = reference_cache_for(mm)
+    tag_id = await reference_cache.resolve("tags", tag_name, lambda: _fetch_tag_index(mm))
+    if tag_id:
+        return tag_id
+
+    async with _tag_lock:
+        # Another job may have created it while we waited
+        tag_id = await reference_cache.resolve("tags", tag_name, lambda: _fetch_tag_index(mm))
+        if tag_id:
+            return tag_id
+        return await _create_tag(mm, tag_name, tag_color)
+
+async def _create_tag(mm: MonarchMoney, tag_name: str, tag_color: str) -> str:
+    new_tag_res = await mm.create_transaction_tag(name=tag_name, color=tag_color)
+    tag_id = new_tag_res["createTransactionTag"]["tag"]["id"]
+    reference_cache_for(mm).remember("tags", tag_name, tag_id)
+    print(f"Created new tag: {tag_name} with ID: {tag_id}")
+    return tag_id
+
+# How long a validated Monarch client is reused before its session is checked again.
+CLIENT_REVALIDATE_SECS = float(os.getenv("MM_CLIENT_REVALIDATE_SECS", "900"))
+
+# Process-wide pool of validated clients.
+# Structure: { credential_id: { "client": MonarchMoney, "session": bytes, "validated_at": float } }
+_clients = {}
+# Held while a client is validated, so concurrent jobs don't each log in and replace each other's client
+_clients_lock = asyncio.Lock()
+
+# Transactions pushed to Monarch at once, across all background workers in this process.
+MONARCH_CONCURRENCY = int(os.getenv("MONARCH_CONCURRENCY", "2"))
+_monarch_slots = asyncio.Semaphore(MONARCH_CONCURRENCY)
+
+# The session pickle bytes are stored in the DB (Credentials.monarch_session) and
+# loaded straight into the client, so no session file is written to disk.
 
 async def get_monarch_client(db: AsyncSession, user_id: int):
     # Fetch credentials
@@ -17,51 +148,78 @@ async def get_monarch_client(db: AsyncSession, user_id: int):
     if not creds:
         raise ValueError("No credentials found for user")
 
-    mm = MonarchMoney()
-    
+    pooled = _clients.get(user_id)
+    if pooled and pooled["session"] == creds.monarch_session:
+        if time.monotonic() - pooled["validated_at"] < CLIENT_REVALIDATE_SECS:
+            return pooled["client"]
+
+    async with _clients_lock:
+        return await _validate_client(creds, user_id)
+
+async def _validate_client(creds: Credentials, user_id: int):
+    # Another job may have validated it while we waited for the lock
+    pooled = _clients.get(user_id)
+    if pooled and pooled["session"] == creds.monarch_session:
+        if time.monotonic() - pooled["validated_at"] < CLIENT_REVALIDATE_SECS:
+            return pooled["client"]
+    elif pooled:
+        # Session was re-seeded (e.g. scripts/interactive_login.py); drop the old client.
+        await invalidate_monarch_client(user_id)
+        pooled = None
+
     # Try to load session from DB
     if creds.monarch_session:
-        import tempfile
+        mm = pooled["client"] if pooled else MonarchMoney()
         try:
-            # Create a temp file to hold the session pickle
-            with tempfile.NamedTemporaryFile(delete=False) as tmp:
-                tmp.write(creds.monarch_session)
-                tmp_path = tmp.name
-            
-            # Load session using library method
-            mm.load_session(tmp_path)
-            
-            # Clean up temp file
-            os.unlink(tmp_path)
-            
+            if not pooled:
+                mm.load_session_bytes(creds.monarch_session)
+
             # Verify session is valid
             await mm.get_subscription_details()
+            _clients[user_id] = {
+                "client": mm,
+                "session": creds.monarch_session,
+                "validated_at": time.monotonic(),
+            }
             return mm
-            
+
         except Exception as e:
             print(f"Session load/Verify failed: {e}")
+            _clients.pop(user_id, None)
+            await mm.close()
             # Fallthrough to error
-            pass
     
     # If we get here, session is missing or invalid.
     # We do NOT allow headless login anymore per user request for manual flow.
     raise ValueError("Monarch session expired or missing. Please run 'python scripts/interactive_login.py' to login.")
 
+async def invalidate_monarch_client(user_id: int):
+    """
+    Removes a pooled client so the next get_monarch_client() re-validates the session.
+    Call this when a Monarch request fails (e.g. the session was revoked).
+    """
+    pooled = _clients.pop(user_id, None)
+    if pooled:
+        await pooled["client"].close()
+
+async def close_monarch_clients():
+    """Closes every pooled client. Called on application shutdown."""
+    for user_id in list(_clients):
+        await invalidate_monarch_client(user_id)
+
 async def push_transaction(mm: MonarchMoney, data: dict):
+    async with _monarch_slots:
+        return await _push_transaction(mm, data)
+
+async def _push_transaction(mm: MonarchMoney, data: dict):
     # data: date, amount, currency, merchant
     # Find manual account
-    accounts = await mm.get_accounts()
-    # Logic to pick account
     # We look for a specific account named "Euro Transactions"
-    target_account = None
     target_name = os.environ.get("MM_ACCOUNT", "Euro Transactions")
-    
-    for acc in accounts['accounts']:
-        if acc['displayName'] == target_name:
-             target_account = acc
-             break
-    
-    if not target_account:
+    reference_cache = reference_cache_for(mm)
+    account_id = await reference_cache.resolve("accounts", target_name, lambda: _fetch_account_index(mm))
+
+    if not account_id:
         raise ValueError(f"No account found with name '{target_name}'. Please create a new Manual account in Monarch named '{target_name}'.")
 
     # Ensure amount is negative (Expense/Debit)
@@ -86,18 +244,12 @@ async def push_transaction(mm: MonarchMoney, data: dict):
     # We'll default to "Uncategorized"
     category_id = None
     try:
-        categories_data = await mm.get_transaction_categories()
-        # Search for 'Uncategorized' in the response
-        # Structure is usually categories -> [ {id, name, ...} ]
-        for cat in categories_data.get('categories', []):
-            if cat['name'] == 'Uncategorized':
-                category_id = cat['id']
-                break
-        
-        if not category_id and categories_data.get('categories'):
+        category_id = await reference_cache.resolve("categories", "Uncategorized", lambda: _fetch_category_index(mm))
+
+        if not category_id:
             # Fallback to first category if Uncategorized not found
-            category_id = categories_data['categories'][0]['id']
-            print(f"Warning: 'Uncategorized' category not found. Using fallback: {categories_data['categories'][0]['name']}")
+            category_id = reference_cache.first("categories")
+            print(f"Warning: 'Uncategorized' category not found. Using fallback category id: {category_id}")
 
     except Exception as e:
         print(f"Failed to fetch categories: {e}")
@@ -109,7 +261,7 @@ async def push_transaction(mm: MonarchMoney, data: dict):
     # LOG PAYLOAD
     payload_log = {
         "date": data['date'],
-        "account_id": target_account['id'],
+        "account_id": account_id,
         "amount": amount,
         "merchant_name": data['merchant'],
         "notes": notes,
@@ -117,47 +269,57 @@ async def push_transaction(mm: MonarchMoney, data: dict):
     }
     print(f"\n\n--- MONARCH PUSH PAYLOAD ---\n{payload_log}\n----------------------------\n")
 
-    result = await mm.create_transaction(
-        date=data['date'],
-        account_id=target_account['id'],
-        amount=amount, # In account currency (assuming manual is USD/EUR?)
-        merchant_name=data['merchant'],
-        notes=notes,
-        category_id=category_id
-    )
+    try:
+        result = await mm.create_transaction(
+            date=data['date'],
+            account_id=account_id,
+            amount=amount, # In account currency (assuming manual is USD/EUR?)
+            merchant_name=data['merchant'],
+            notes=notes,
+            category_id=category_id
+        )
+    except Exception:
+        # The cached account/category may have been renamed or deleted in Monarch.
+        reference_cache.invalidate("accounts")
+        reference_cache.invalidate("categories")
+        raise
+
+    create_errors = (result.get('createTransaction') or {}).get('errors')
+    if create_errors:
+        # Rejected rather than failed: most likely a stale account or category id
+        reference_cache.invalidate("accounts")
+        reference_cache.invalidate("categories")
+        raise ValueError(f"Monarch rejected the transaction: {create_errors}")
     
-    # Mark as Needs Review
-    # create_transaction doesn't support this flag, so we update it immediately after.
+    # Mark as Needs Review and apply tag
+    # create_transaction doesn't support either, so we update it immediately after,
+    # sending both mutations in a single request.
     try:
         tx_id = result['createTransaction']['transaction']['id']
-        await mm.update_transaction(transaction_id=tx_id, needs_review=True)
-        print(f"Marked transaction {tx_id} as 'Needs Review'")
-        
-        # Apply Tag
-        tag_name = "Imported by MM Bridge"
-        tag_color = "#2196F3" # Material Blue
-        tag_id = None
-        print(f"Applying tag: {tag_name}")
-        
-        # 1. Find existing tag
-        existing_tags = await mm.get_transaction_tags()
-        for tag in existing_tags.get("householdTransactionTags", []):
-            if tag["name"] == tag_name:
-                tag_id = tag["id"]
-                print(f"Found existing tag: {tag_name} with ID: {tag_id}")
+        # Payload errors come back inside the result, e.g. for a cached tag id that was
+        # deleted in Monarch; re-resolve the tag and try once more
+        for attempt in range(2):
+            tag_id = await resolve_tag_id(mm)
+            print(f"Applying tag: {TAG_NAME}")
+            try:
+                updated = await mm.update_transaction_and_tags(transaction_id=tx_id, tag_ids=[tag_id], needs_review=True)
+            except Exception:
+                reference_cache.invalidate("tags")
+                raise
+            errors = [
+                errors
+                for errors in ((updated.get(key) or {}).get('errors') for key in ('updateTransaction', 'setTransactionTags'))
+                if errors
+            ]
+            if not errors:
                 break
-        
-        # 2. Create if missing
-        if not tag_id:
-            new_tag_res = await mm.create_transaction_tag(name=tag_name, color=tag_color)
-            tag_id = new_tag_res["createTransactionTag"]["tag"]["id"]
-            print(f"Created new tag: {tag_name} with ID: {tag_id}")
-            
-        # 3. Apply tag
-        if tag_id:
-            await mm.set_transaction_tags(transaction_id=tx_id, tag_ids=[tag_id])
-            print(f"Tagged transaction {tx_id} with '{tag_name}'")
-        
+            reference_cache.invalidate("tags")
+            print(f"Monarch rejected the post-creation updates (attempt {attempt + 1}): {errors}")
+        else:
+            raise ValueError(f"Monarch rejected the post-creation updates: {errors}")
+        print(f"Marked transaction {tx_id} as 'Needs Review'")
+        print(f"Tagged transaction {tx_id} with '{TAG_NAME}'")
+
         return tx_id
             
     except Exception as e:
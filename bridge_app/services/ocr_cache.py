@@ -0,0 +1,51 @@
+from sqlalchemy import func
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models import OcrResult
+
+# Counted since process start, exposed on /metrics/ocr-cache
+_stats = {"hits": 0, "misses": 0, "stores": 0}
+
+
+async def get_cached_result(db: AsyncSession, image_hash: str, model: str):
+    """
+    Returns a copy of the extraction stored for this image by `model`, or None.
+    Results from another model count as a miss, so changing GEMINI_MODEL re-scans.
+    """
+    stmt = select(OcrResult).where(OcrResult.image_hash == image_hash)
+    row = (await db.execute(stmt)).scalar_one_or_none()
+    if row is None or row.model != model:
+        _stats["misses"] += 1
+        return None
+    _stats["hits"] += 1
+    # The caller edits the dict (currency conversion, Monarch id), keep the cached one intact
+    return dict(row.data)
+
+
+async def store_result(db: AsyncSession, image_hash: str, model: str, data: dict):
+    """Saves a successful extraction, replacing one from an older model."""
+    try:
+        stmt = select(OcrResult).where(OcrResult.image_hash == image_hash)
+        row = (await db.execute(stmt)).scalar_one_or_none()
+        if row is None:
+            db.add(OcrResult(image_hash=image_hash, model=model, data=dict(data)))
+        else:
+            row.model = model
+            row.data = dict(data)
+            row.created_at = func.now()
+        await db.commit()
+        _stats["stores"] += 1
+    except Exception as e:
+        # The cache is only an optimisation, never fail the job over it
+        print(f"Could not cache OCR result for {image_hash}: {e}")
+        await db.rollback()
+
+
+async def get_stats(db: AsyncSession) -> dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    entries = (await db.execute(select(func.count()).select_from(OcrResult))).scalar()
+    return {
+        **_stats,
+        "hit_rate": round(_stats["hits"] / lookups, 3) if lookups else None,
+        "entries": entries,
+    }
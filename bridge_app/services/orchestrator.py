@@ -4,14 +4,21 @@ import json
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import UploadFile, HTTPException
+from PIL import Image
 from ..models import Transaction
-from .gemini import extract_transaction_data
-from .monarch import get_monarch_client, push_transaction
+from .gemini import extract_transaction_data, preprocess_image, GEMINI_MODEL
+from .phash import receipt_index
+from .dedup import semantic_key, find_semantic_duplicate, same_purchase
+from .ocr_cache import get_cached_result, store_result
+from .currency import is_supported_currency
+from .monarch import get_monarch_client, invalidate_monarch_client, push_transaction
+from .jobs import get_pushed_transaction, record_pushed_transaction
 from starlette.concurrency import run_in_threadpool
 
-async def process_manual_transaction(manual_data: dict, db: AsyncSession, progress_callback=None, force_override: bool = False):
+async def process_manual_transaction(manual_data: dict, db: AsyncSession, progress_callback=None, force_override: bool = False, job_id: str = None):
     """
     Process a manually entered transaction.
+    `job_id` is the background job doing it, if any; see _process_transaction_data.
     """
     async def report(msg, percent=None):
         print(f"Progress: {msg} ({percent}%)")
@@ -25,11 +32,17 @@ async def process_manual_transaction(manual_data: dict, db: AsyncSession, progre
     data_string = json.dumps(manual_data, sort_keys=True)
     image_hash = "manual_" + hashlib.sha256(data_string.encode()).hexdigest()
     
-    return await _process_transaction_data(manual_data, image_hash, db, report, force_override=force_override)
+    return await _process_transaction_data(manual_data, image_hash, db, report, force_override=force_override, job_id=job_id)
 
-async def process_transaction(content: bytes, db: AsyncSession, progress_callback=None, user_currency: str = None, force_override: bool = False):
+async def find_processed_image(db: AsyncSession, image_hash: str):
+    """Returns the Transaction already created from the image with this sha256, or None."""
+    stmt = select(Transaction).where(Transaction.image_hash == image_hash)
+    return (await db.execute(stmt)).scalar_one_or_none()
+
+async def process_transaction(content: bytes, db: AsyncSession, progress_callback=None, user_currency: str = None, force_override: bool = False, job_id: str = None):
     """
     Process a file-based transaction (OCR).
+    `job_id` is the background job doing it, if any; see _process_transaction_data.
     """
     async def report(msg, percent=None):
         print(f"Progress: {msg} ({percent}%)") 
@@ -43,27 +56,45 @@ async def process_transaction(content: bytes, db: AsyncSession, progress_callbac
     # 2. Deduplication Check (Fast check before OCR)
     if not force_override:
         await report("Checking for duplicates...", 20)
-        stmt = select(Transaction).where(Transaction.image_hash == image_hash)
-        result = await db.execute(stmt)
-        existing = result.scalar_one_or_none()
+        existing = await find_processed_image(db, image_hash)
         
         if existing:
             print(f"DUPLICATE TRANSACTION DETECTED: Hash={image_hash}")
             print(f"Existing Data: {existing.parsed_data}")
             return {"status": "duplicate", "data": existing.parsed_data}
+
+    # 2b. Near-duplicate Check (same receipt re-photographed or re-compressed)
+    # Decoding and resizing is CPU-bound, keep it off the event loop
+    try:
+        jpeg_bytes, perceptual_hash = await run_in_threadpool(preprocess_image, content)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        # Not an image, an unsupported format (e.g. HEIC), or truncated
+        print(f"Could not decode receipt image {image_hash}: {e}")
+        raise HTTPException(status_code=400, detail="Could not read this file as an image. Please share a JPEG or PNG photo of the receipt.")
+    # A similar-looking image is only a candidate: receipts from the same store share
+    # a layout and hash alike, so the match is confirmed against the OCR'd purchase
+    near_duplicate = None
+    if not force_override:
+        similar_id = await receipt_index.find_near_duplicate(db, perceptual_hash)
+        near_duplicate = await db.get(Transaction, similar_id) if similar_id else None
     
     # 3. OCR Extraction
+    # Retries and forced re-submits of the same image reuse the earlier scan
+    data = await get_cached_result(db, image_hash, GEMINI_MODEL)
+    if data:
+        await report("Reusing previous receipt scan...", 30)
+        return await _process_transaction_data(data, image_hash, db, report, user_currency, force_override=force_override, perceptual_hash=perceptual_hash, near_duplicate=near_duplicate, job_id=job_id)
+
     await report("Scanning receipt with Gemini AI...", 30)
     
     # Retry logic for overloaded Gemini API
     max_retries = 2
-    data = None
     
     for attempt in range(max_retries + 1):
         if attempt > 0:
              await report(f"Retrying Gemini scan (Attempt {attempt+1})...", 35)
 
-        data = await run_in_threadpool(extract_transaction_data, content)
+        data = await extract_transaction_data(jpeg_bytes)
         
         if data and "error" in data:
             err_str = str(data["error"])
@@ -83,6 +114,8 @@ async def process_transaction(content: bytes, db: AsyncSession, progress_callbac
         error_msg = data.get("error", "Unknown OCR error") if data else "Empty OCR response"
         raise HTTPException(status_code=500, detail=error_msg)
 
+    await store_result(db, image_hash, GEMINI_MODEL, data)
+
     # Inject/Override currency if provided by user during upload
     if user_currency:
         # We pass it to the shared processor, but we can also check it here if needed.
@@ -91,11 +124,15 @@ async def process_transaction(content: bytes, db: AsyncSession, progress_callbac
         # Actually logic is in the shared block below.
         pass
 
-    return await _process_transaction_data(data, image_hash, db, report, user_currency, force_override=force_override)
+    return await _process_transaction_data(data, image_hash, db, report, user_currency, force_override=force_override, perceptual_hash=perceptual_hash, near_duplicate=near_duplicate, job_id=job_id)
 
-async def _process_transaction_data(data: dict, image_hash: str, db: AsyncSession, report_func, user_currency_override: str = None, force_override: bool = False):
+async def _process_transaction_data(data: dict, image_hash: str, db: AsyncSession, report_func, user_currency_override: str = None, force_override: bool = False, perceptual_hash: str = None, near_duplicate: Transaction = None, job_id: str = None):
     """
     Shared logic for processing transaction data, converting currency, pushing to Monarch, and saving.
+    `near_duplicate` is a stored transaction whose image looks like this one; it only
+    counts as a duplicate if the purchase details match too.
+    With a `job_id`, the Monarch transaction is created at most once per job: a claim
+    that takes over a job whose earlier claim already pushed it reuses that one.
     """
     
     # re-check duplicates here? 
@@ -124,16 +161,28 @@ async def _process_transaction_data(data: dict, image_hash: str, db: AsyncSessio
     if target_original in ["¥", "YEN"]: target_original = "JPY"
     
     print(f"Currency Check: User='{user_currency_override}' OCR='{raw_currency}' -> Effective='{target_original}'")
+
+    # Same purchase already imported (another photo, "12.5" vs "12.50", merchant casing)?
+    # Compared in the original currency, before conversion.
+    dedup_key = semantic_key(data, target_original)
+    if dedup_key and not force_override:
+        if near_duplicate is not None and same_purchase(near_duplicate, dedup_key):
+            print(f"NEAR-DUPLICATE TRANSACTION DETECTED: Hash={image_hash} matches #{near_duplicate.id}")
+            return {"status": "duplicate", "data": near_duplicate.parsed_data}
+        existing = await find_semantic_duplicate(db, dedup_key)
+        if existing:
+            print(f"SEMANTIC DUPLICATE DETECTED: {dedup_key} matches #{existing.id}")
+            return {"status": "duplicate", "data": existing.parsed_data}
     
     if target_original == "USD":
         data["currency"] = "USD"
         
-    elif target_original in ["EUR", "GBP", "JPY"]:
+    elif await is_supported_currency(target_original):
         try:
             await report_func(f"Converting {target_original} to USD...", 60)
             from .currency import get_exchange_rate
             
-            rate = await get_exchange_rate(target_original, "USD", data["date"])
+            rate = await get_exchange_rate(target_original, "USD", data["date"], db=db)
             original_amount = float(data["amount"]) # Ensure float
             converted_amount = round(original_amount * rate, 2)
             
@@ -162,11 +211,19 @@ async def _process_transaction_data(data: dict, image_hash: str, db: AsyncSessio
         
     try:
         await report_func("Creating transaction in Monarch...", 85)
-        mm = await get_monarch_client(db, creds.id)
-        tx_id = await push_transaction(mm, data)
+        tx_id = await get_pushed_transaction(job_id) if job_id else None
+        if tx_id:
+            print(f"Job {job_id} already created Monarch transaction {tx_id}, not pushing again")
+        else:
+            mm = await get_monarch_client(db, creds.id)
+            tx_id = await push_transaction(mm, data)
+            if tx_id and job_id:
+                await record_pushed_transaction(job_id, tx_id)
         if tx_id:
             data['monarch_tx_id'] = tx_id
     except Exception as e:
+        # Force the pooled client to re-validate its session on the next job
+        await invalidate_monarch_client(creds.id)
         raise HTTPException(status_code=502, detail=f"Monarch Error: {str(e)}")
     
     # 5. Save Record
@@ -178,7 +235,7 @@ async def _process_transaction_data(data: dict, image_hash: str, db: AsyncSessio
         import uuid
         image_hash = f"{image_hash}_forced_{uuid.uuid4().hex[:8]}"
         
-    new_tx = Transaction(image_hash=image_hash, parsed_data=data)
+    new_tx = Transaction(image_hash=image_hash, perceptual_hash=perceptual_hash, parsed_data=data, **(dedup_key or {}))
     db.add(new_tx)
     await db.commit()
     
@@ -0,0 +1,126 @@
+import os
+from datetime import timedelta
+from PIL import Image
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models import Transaction
+
+# Receipts whose dHashes differ in at most this many of 64 bits are treated as the
+# same receipt (re-photographed, re-compressed by the share sheet, slightly cropped).
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "6"))
+# Each refresh re-reads rows created up to this many seconds before the newest one
+# already loaded. created_at is set when the saving transaction starts, so rows can
+# commit out of order; this must cover the longest a job holds that transaction open.
+PHASH_REFRESH_OVERLAP = float(os.getenv("PHASH_REFRESH_OVERLAP", "600"))
+
+
+def dhash(image: Image.Image) -> str:
+    """
+    Difference hash: shrink to 9x8 grayscale and record whether each pixel is brighter
+    than its right-hand neighbour. Returned as 16 hex digits.
+    """
+    small = image.convert("L").resize((9, 8), Image.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:016x}"
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing over 64-bit hashes. Each hash is split into max_distance + 1
+    chunks and filed under every chunk value. Two hashes within max_distance bits of
+    each other must agree exactly on at least one chunk (pigeonhole), so a search
+    only compares against the few hashes sharing a chunk instead of every stored one.
+    """
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        chunks = max_distance + 1
+        self._chunks = [
+            (i * 64 // chunks, (i + 1) * 64 // chunks) for i in range(chunks)
+        ]
+        self._tables = [{} for _ in self._chunks]
+        self._hashes = []
+        self._items = []
+
+    def _keys(self, value: int):
+        for start, end in self._chunks:
+            yield (value >> start) & ((1 << (end - start)) - 1)
+
+    def add(self, value: int, item):
+        position = len(self._hashes)
+        self._hashes.append(value)
+        self._items.append(item)
+        for table, key in zip(self._tables, self._keys(value)):
+            table.setdefault(key, []).append(position)
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def search(self, value: int) -> list:
+        """Returns [(distance, item)] for every hash within max_distance, closest first."""
+        matches = []
+        seen = set()
+        for table, key in zip(self._tables, self._keys(value)):
+            for position in table.get(key, ()):
+                if position in seen:
+                    continue
+                seen.add(position)
+                distance = hamming(value, self._hashes[position])
+                if distance <= self.max_distance:
+                    matches.append((distance, self._items[position]))
+        return sorted(matches, key=lambda match: match[0])
+
+
+class ReceiptIndex:
+    """
+    In-memory multi-index of Transaction.perceptual_hash, loaded from the database on
+    first use. Each lookup first pulls in rows created since shortly before the newest
+    one loaded (see PHASH_REFRESH_OVERLAP), so receipts saved by other worker
+    processes are seen too, even when they commit out of id order.
+    """
+
+    def __init__(self):
+        self.hashes = MultiIndexHash(PHASH_MAX_DISTANCE)
+        self.ids = set()
+        self.newest = None
+
+    def add(self, transaction_id: int, perceptual_hash: str):
+        if transaction_id in self.ids:
+            return
+        self.ids.add(transaction_id)
+        self.hashes.add(int(perceptual_hash, 16), transaction_id)
+
+    async def refresh(self, db: AsyncSession):
+        stmt = select(
+            Transaction.id, Transaction.perceptual_hash, Transaction.created_at
+        ).where(Transaction.perceptual_hash.is_not(None))
+        if self.newest is not None:
+            since = self.newest - timedelta(seconds=PHASH_REFRESH_OVERLAP)
+            stmt = stmt.where(Transaction.created_at >= since)
+        for transaction_id, perceptual_hash, created_at in (
+            await db.execute(stmt)
+        ).all():
+            self.add(transaction_id, perceptual_hash)
+            if created_at is not None and (
+                self.newest is None or created_at > self.newest
+            ):
+                self.newest = created_at
+
+    async def find_near_duplicate(self, db: AsyncSession, perceptual_hash: str):
+        """Returns the id of the closest stored receipt within PHASH_MAX_DISTANCE, or None."""
+        await self.refresh(db)
+        matches = self.hashes.search(int(perceptual_hash, 16))
+        return matches[0][1] if matches else None
+
+
+receipt_index = ReceiptIndex()
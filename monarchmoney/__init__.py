@@ -10,7 +10,9 @@ from .monarchmoney import (
     MonarchMoney,
     RequireMFAException,
     RequestFailedException,
+    TransactionRecord,
 )
+from .mirror import TransactionMirror
 
 __version__ = "1.1.0"
 __author__ = "bradleyseanf"
@@ -0,0 +1,384 @@
+import asyncio
+import json
+import sqlite3
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .monarchmoney import DEFAULT_RECORD_LIMIT, MonarchMoney
+
+DEFAULT_MIRROR_PATH = "transactions.sqlite"
+# Transactions dated within this many days of the newest one are re-fetched on every
+# sync, so recent edits and pending->posted changes are picked up.
+DEFAULT_TRAILING_DAYS = 30
+# Incremental syncs also ask for transactions dated up to this many days ahead.
+DEFAULT_LOOKAHEAD_DAYS = 31
+# Every id is reconciled against Monarch (deletions, edits to old transactions,
+# dates moved out of the trailing window) when the last full reconciliation is
+# older than this.
+DEFAULT_RECONCILE_DAYS = 7
+DEFAULT_MIRROR_PREFETCH = 4
+# A reconciliation against a populated mirror first lists only these, then downloads
+# the full transactions that are new or changed. The date says where to find them.
+RECONCILE_FIELDS = [
+    "allTransactions.results.id",
+    "allTransactions.results.updatedAt",
+    "allTransactions.results.date",
+]
+# Changed transactions dated this close together are re-downloaded with one request
+# over the days between them.
+REFETCH_GAP_DAYS = 7
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    amount REAL,
+    merchant TEXT,
+    category_id TEXT,
+    category TEXT,
+    account_id TEXT,
+    account TEXT,
+    pending INTEGER,
+    updated_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_transactions_date ON transactions (date);
+CREATE INDEX IF NOT EXISTS ix_transactions_account ON transactions (account_id, date);
+CREATE INDEX IF NOT EXISTS ix_transactions_category ON transactions (category_id, date);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class TransactionMirror(object):
+    """
+    Keeps a local SQLite copy of every transaction in the account up to date.
+
+    The first sync downloads the full history. Later syncs only re-fetch the
+    trailing window behind the high-water mark (the newest transaction date seen),
+    and reconcile every id against Monarch once every `reconcile_days`. Deleted
+    transactions are only removed when reconciling.
+    """
+
+    def __init__(
+        self,
+        mm: MonarchMoney,
+        path: str = DEFAULT_MIRROR_PATH,
+        trailing_days: int = DEFAULT_TRAILING_DAYS,
+        reconcile_days: int = DEFAULT_RECONCILE_DAYS,
+        page_size: int = DEFAULT_RECORD_LIMIT,
+        prefetch: int = DEFAULT_MIRROR_PREFETCH,
+    ) -> None:
+        """
+        :param mm: a logged in MonarchMoney client.
+        :param path: the SQLite database file, created if missing.
+        :param trailing_days: the number of days behind the high-water mark re-fetched on every sync.
+        :param reconcile_days: the number of days between full id reconciliations.
+        :param page_size: the number of transactions requested per page.
+        :param prefetch: the number of pages fetched in parallel during full downloads.
+        """
+        self._mm = mm
+        self.trailing_days = trailing_days
+        self.reconcile_days = reconcile_days
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(_SCHEMA)
+        self._lock = asyncio.Lock()
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _get_state(self, key: str) -> Optional[str]:
+        row = self._db.execute(
+            "SELECT value FROM sync_state WHERE key = ?", (key,)
+        ).fetchone()
+        return row["value"] if row else None
+
+    def _set_state(self, key: str, value: Optional[str]) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)",
+            (key, value),
+        )
+
+    def get_sync_state(self) -> Dict[str, Optional[str]]:
+        """
+        Returns the high-water mark (newest transaction date seen) and when the
+        mirror was last synced and fully reconciled.
+        """
+        return dict(
+            (row["key"], row["value"])
+            for row in self._db.execute("SELECT key, value FROM sync_state")
+        )
+
+    async def sync(self, full: bool = False) -> Dict[str, Any]:
+        """
+        Brings the mirror up to date with Monarch.
+
+        :param full: reconcile every transaction even if the last full
+          reconciliation is recent.
+        :return: what the sync did: whether it reconciled, and the number of
+          transactions fetched, upserted (new or changed) and deleted.
+        """
+        async with self._lock:
+            high_water_date = self._get_state("high_water_date")
+            last_reconciled = self._get_state("last_reconciled_at")
+            reconcile = (
+                full
+                or high_water_date is None
+                or last_reconciled is None
+                or datetime.fromisoformat(last_reconciled)
+                < datetime.now() - timedelta(days=self.reconcile_days)
+            )
+
+            if reconcile:
+                stats = await self._sync_range(
+                    None, None, prefetch=self.prefetch, delete_missing=True
+                )
+                self._set_state("last_reconciled_at", datetime.now().isoformat())
+            else:
+                window_start = date.fromisoformat(high_water_date) - timedelta(
+                    days=self.trailing_days
+                )
+                window_end = max(date.today(), date.fromisoformat(high_water_date))
+                window_end += timedelta(days=DEFAULT_LOOKAHEAD_DAYS)
+                # A transaction missing from the window may only have had its
+                # date edited out of it, so nothing is deleted here
+                stats = await self._sync_range(
+                    window_start.isoformat(),
+                    window_end.isoformat(),
+                    prefetch=0,
+                    delete_missing=False,
+                )
+
+            high_water = self._db.execute(
+                "SELECT MAX(date) AS date FROM transactions"
+            ).fetchone()
+            self._set_state("high_water_date", high_water["date"])
+            self._set_state("last_synced_at", datetime.now().isoformat())
+            self._db.commit()
+            return {"reconciled": reconcile, **stats}
+
+    async def _sync_range(
+        self,
+        start_date: Optional[str],
+        end_date: Optional[str],
+        prefetch: int,
+        delete_missing: bool,
+    ) -> Dict[str, int]:
+        """
+        Upserts every transaction Monarch has between two dates (all of them if no
+        dates are given). With `delete_missing`, also deletes the local ones in that
+        range it no longer has. Nothing is committed if the download fails part way.
+
+        With `delete_missing` and transactions already mirrored, only the ids, update
+        times and dates are listed, and the full transactions are downloaded for the
+        new or changed ids alone.
+        """
+        filters = {}
+        if start_date is not None:
+            filters = {"start_date": start_date, "end_date": end_date}
+
+        known = dict(self._select_updated_at(start_date, end_date))
+        listing = delete_missing and bool(known)
+        if listing:
+            filters["fields"] = RECONCILE_FIELDS
+        seen = set()
+        changed = []
+        # { id: date } of the new or changed transactions, when listing
+        changed_dates = {}
+        upserted = 0
+        try:
+            async for transaction in self._mm.iter_transactions(
+                page_size=self.page_size, prefetch=prefetch, **filters
+            ):
+                seen.add(transaction["id"])
+                if (
+                    transaction["id"] in known
+                    and known[transaction["id"]] is not None
+                    and known[transaction["id"]] == transaction.get("updatedAt")
+                ):
+                    continue
+                if listing:
+                    changed_dates[transaction["id"]] = transaction["date"]
+                    continue
+                changed.append(transaction)
+                if len(changed) >= self.page_size:
+                    upserted += self._upsert(changed)
+                    changed = []
+            upserted += self._upsert(changed)
+            if changed_dates:
+                upserted += await self._refetch(changed_dates, prefetch)
+
+            deleted = [(id,) for id in known.keys() - seen] if delete_missing else []
+            self._db.executemany("DELETE FROM transactions WHERE id = ?", deleted)
+        except BaseException:
+            self._db.rollback()
+            raise
+
+        return {
+            "fetched": len(seen),
+            "upserted": upserted,
+            "deleted": len(deleted),
+        }
+
+    async def _refetch(self, changed_dates: Dict[str, str], prefetch: int) -> int:
+        """
+        Downloads and upserts the full transactions for the ids in `changed_dates`
+        ({ id: date }), one date range per cluster of nearby dates. A transaction whose
+        date was edited again in the meantime is left for the next sync.
+        """
+        wanted = dict(changed_dates)
+        upserted = 0
+        for start, end in _date_spans(changed_dates.values()):
+            changed = []
+            async for transaction in self._mm.iter_transactions(
+                page_size=self.page_size,
+                prefetch=prefetch,
+                start_date=start,
+                end_date=end,
+            ):
+                if wanted.pop(transaction["id"], None) is None:
+                    continue
+                changed.append(transaction)
+                if len(changed) >= self.page_size:
+                    upserted += self._upsert(changed)
+                    changed = []
+            upserted += self._upsert(changed)
+        return upserted
+
+    def _select_updated_at(self, start_date: Optional[str], end_date: Optional[str]):
+        if start_date is None:
+            return self._db.execute("SELECT id, updated_at FROM transactions")
+        return self._db.execute(
+            "SELECT id, updated_at FROM transactions WHERE date BETWEEN ? AND ?",
+            (start_date, end_date),
+        )
+
+    def _upsert(self, transactions: List[Dict[str, Any]]) -> int:
+        self._db.executemany(
+            """
+            INSERT OR REPLACE INTO transactions (
+                id, date, amount, merchant, category_id, category, account_id,
+                account, pending, updated_at, data
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    t["id"],
+                    t["date"],
+                    t.get("amount"),
+                    (t.get("merchant") or {}).get("name"),
+                    (t.get("category") or {}).get("id"),
+                    (t.get("category") or {}).get("name"),
+                    (t.get("account") or {}).get("id"),
+                    (t.get("account") or {}).get("displayName"),
+                    t.get("pending"),
+                    t.get("updatedAt"),
+                    json.dumps(t),
+                )
+                for t in transactions
+            ],
+        )
+        return len(transactions)
+
+    def get_transactions(
+        self,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        account_ids: Iterable[str] = (),
+        category_ids: Iterable[str] = (),
+        search: str = "",
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> List[Dict[str, Any]]:
+        """
+        Returns mirrored transactions, newest first, as returned by
+        MonarchMoney.get_transactions.
+
+        :param start_date: the earliest date, in "yyyy-mm-dd" format.
+        :param end_date: the latest date, in "yyyy-mm-dd" format.
+        :param account_ids: only transactions in these accounts.
+        :param category_ids: only transactions in these categories.
+        :param search: only transactions whose merchant contains this text (case-insensitive).
+        :param limit: the maximum number of transactions to return.
+        :param offset: the number of transactions to skip.
+        """
+        where, params = self._where(
+            start_date, end_date, account_ids, category_ids, search
+        )
+        sql = f"SELECT data FROM transactions{where} ORDER BY date DESC, id LIMIT ? OFFSET ?"
+        rows = self._db.execute(sql, params + [-1 if limit is None else limit, offset])
+        return [json.loads(row["data"]) for row in rows]
+
+    def get_transaction(self, transaction_id: str) -> Optional[Dict[str, Any]]:
+        row = self._db.execute(
+            "SELECT data FROM transactions WHERE id = ?", (transaction_id,)
+        ).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def count(
+        self, start_date: Optional[str] = None, end_date: Optional[str] = None
+    ) -> int:
+        where, params = self._where(start_date, end_date)
+        return self._db.execute(
+            f"SELECT COUNT(*) FROM transactions{where}", params
+        ).fetchone()[0]
+
+    def totals_by_category(
+        self, start_date: Optional[str] = None, end_date: Optional[str] = None
+    ) -> Dict[Optional[str], float]:
+        """
+        Returns the sum of transaction amounts per category name.
+        """
+        where, params = self._where(start_date, end_date)
+        rows = self._db.execute(
+            f"SELECT category, SUM(amount) FROM transactions{where} GROUP BY category",
+            params,
+        )
+        return {row[0]: row[1] for row in rows}
+
+    @staticmethod
+    def _where(
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        account_ids: Iterable[str] = (),
+        category_ids: Iterable[str] = (),
+        search: str = "",
+    ):
+        clauses, params = [], []
+        if start_date:
+            clauses.append("date >= ?")
+            params.append(start_date)
+        if end_date:
+            clauses.append("date <= ?")
+            params.append(end_date)
+        for column, ids in (("account_id", account_ids), ("category_id", category_ids)):
+            ids = list(ids)
+            if ids:
+                clauses.append(f"{column} IN ({', '.join('?' * len(ids))})")
+                params.extend(ids)
+        if search:
+            clauses.append("merchant LIKE ?")
+            params.append(f"%{search}%")
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def _date_spans(dates: Iterable[str]) -> List[Tuple[str, str]]:
+    """
+    Groups "yyyy-mm-dd" dates into (start, end) ranges, starting a new range wherever
+    two consecutive dates are more than REFETCH_GAP_DAYS apart.
+    """
+    spans: List[Tuple[str, str]] = []
+    for day in sorted(set(dates)):
+        if spans:
+            start, end = spans[-1]
+            gap = date.fromisoformat(day) - date.fromisoformat(end)
+            if gap <= timedelta(days=REFETCH_GAP_DAYS):
+                spans[-1] = (start, day)
+                continue
+        spans.append((day, day))
+    return spans
@@ -1,5 +1,6 @@
 import asyncio
 import calendar
+import collections
 import csv
 import getpass
 import json
@@ -10,13 +11,37 @@ import time
 from dataclasses import dataclass
 from io import StringIO
 from datetime import datetime, date, timedelta
-from typing import Any, Dict, List, Optional, Union
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Callable,
+    Tuple,
+    Union,
+)
 
 import oathtool
-from aiohttp import ClientSession, FormData
-from gql import Client, gql
+from aiohttp import ClientSession, FormData, TCPConnector
+from gql import Client, GraphQLRequest, gql
 from gql.transport.aiohttp import AIOHTTPTransport
-from graphql import DocumentNode
+from graphql import (
+    DocumentNode,
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    InlineFragmentNode,
+    NameNode,
+    OperationDefinitionNode,
+    SelectionSetNode,
+    VariableNode,
+    Visitor,
+    print_ast,
+    visit,
+)
 
 AUTH_HEADER_KEY = "authorization"
 CSRF_KEY = "csrftoken"
@@ -26,6 +51,32 @@ ERRORS_KEY = "error_code"
 SESSION_DIR = ".mm"
 SESSION_FILE = f"{SESSION_DIR}/mm_session.pickle"
 DEFAULT_TIMEOUT_SECS = 300
+DEFAULT_CONNECTION_LIMIT = 100
+DEFAULT_KEEPALIVE_SECS = 30
+DNS_CACHE_TTL_SECS = 300
+DEFAULT_EXPORT_SHARD_DAYS = 31
+DEFAULT_EXPORT_CONCURRENCY = 4
+EXPORT_FORMATS = ("ndjson", "csv", "parquet")
+# Flattened transaction fields written by export_transactions() to CSV and Parquet.
+EXPORT_COLUMNS = [
+    "id",
+    "date",
+    "amount",
+    "merchant",
+    "plaidName",
+    "category",
+    "account",
+    "notes",
+    "tags",
+    "pending",
+    "hideFromReports",
+    "isSplitTransaction",
+    "isRecurring",
+]
+EXPORT_PARQUET_BATCH_ROWS = 10000
+# Accepted by MonarchMoney(json_decoder=...). "json" (the standard library) is the
+# default; the others are opt-in, and "auto" picks the fastest one installed.
+JSON_DECODERS = ("auto", "orjson", "msgspec", "json")
 
 
 @dataclass
@@ -35,6 +86,119 @@ class BalanceHistoryRow:
     account_name: Optional[str] = None
 
 
+class TransactionRecord(object):
+    """
+    A transaction from get_transactions as a compact record with attribute access.
+
+    Uses __slots__, so a long history takes far less memory than the decoded
+    dicts. Merchant, category, account and tags are reduced to their ids and names.
+    """
+
+    __slots__ = (
+        "id",
+        "date",
+        "amount",
+        "pending",
+        "plaid_name",
+        "notes",
+        "merchant_id",
+        "merchant_name",
+        "category_id",
+        "category_name",
+        "account_id",
+        "account_name",
+        "tag_names",
+        "needs_review",
+        "hide_from_reports",
+        "is_split",
+        "is_recurring",
+        "created_at",
+        "updated_at",
+    )
+
+    def __init__(
+        self,
+        id: str,
+        date: str,
+        amount: float,
+        pending: Optional[bool] = None,
+        plaid_name: Optional[str] = None,
+        notes: Optional[str] = None,
+        merchant_id: Optional[str] = None,
+        merchant_name: Optional[str] = None,
+        category_id: Optional[str] = None,
+        category_name: Optional[str] = None,
+        account_id: Optional[str] = None,
+        account_name: Optional[str] = None,
+        tag_names: Tuple[str, ...] = (),
+        needs_review: Optional[bool] = None,
+        hide_from_reports: Optional[bool] = None,
+        is_split: Optional[bool] = None,
+        is_recurring: Optional[bool] = None,
+        created_at: Optional[str] = None,
+        updated_at: Optional[str] = None,
+    ) -> None:
+        self.id = id
+        self.date = date
+        self.amount = amount
+        self.pending = pending
+        self.plaid_name = plaid_name
+        self.notes = notes
+        self.merchant_id = merchant_id
+        self.merchant_name = merchant_name
+        self.category_id = category_id
+        self.category_name = category_name
+        self.account_id = account_id
+        self.account_name = account_name
+        self.tag_names = tag_names
+        self.needs_review = needs_review
+        self.hide_from_reports = hide_from_reports
+        self.is_split = is_split
+        self.is_recurring = is_recurring
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TransactionRecord":
+        merchant = data.get("merchant") or {}
+        category = data.get("category") or {}
+        account = data.get("account") or {}
+        return cls(
+            data["id"],
+            data["date"],
+            data.get("amount"),
+            data.get("pending"),
+            data.get("plaidName"),
+            data.get("notes"),
+            merchant.get("id"),
+            merchant.get("name"),
+            category.get("id"),
+            category.get("name"),
+            account.get("id"),
+            account.get("displayName"),
+            tuple(tag["name"] for tag in data.get("tags") or ()),
+            data.get("needsReview"),
+            data.get("hideFromReports"),
+            data.get("isSplitTransaction"),
+            data.get("isRecurring"),
+            data.get("createdAt"),
+            data.get("updatedAt"),
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, TransactionRecord):
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"TransactionRecord(id={self.id!r}, date={self.date!r}, "
+            f"amount={self.amount!r}, merchant_name={self.merchant_name!r})"
+        )
+
+
 class MonarchMoneyEndpoints(object):
     BASE_URL = "https://api.monarch.com"
     CLOUDINARY_BASE_URL = "https://api.cloudinary.com"
@@ -68,13 +232,407 @@ class RequestFailedException(Exception):
     pass
 
 
+def _json_decoder(name: str = "json") -> Callable[[Union[str, bytes]], Any]:
+    """
+    Returns the function used to decode GraphQL responses: the standard library's,
+    or orjson's or msgspec's when asked for and installed. ``name`` is one of
+    JSON_DECODERS.
+    """
+    if name not in JSON_DECODERS:
+        raise ValueError(
+            f"Unknown JSON decoder {name!r}, expected one of {JSON_DECODERS}"
+        )
+    if name in ("auto", "orjson"):
+        try:
+            import orjson
+
+            return orjson.loads
+        except ImportError:
+            if name == "orjson":
+                raise
+    if name in ("auto", "msgspec"):
+        try:
+            import msgspec
+
+            return msgspec.json.decode
+        except ImportError:
+            if name == "msgspec":
+                raise
+    return json.loads
+
+
+# Parsed GraphQL documents, keyed by operation name. See _parse_document().
+_PARSED_DOCUMENTS: Dict[str, Tuple[str, DocumentNode]] = {}
+
+
+def _parse_document(key: str, source: str) -> DocumentNode:
+    """
+    Returns the parsed GraphQL document for the given query string.
+
+    The string is parsed with gql() on first use and memoized under ``key``
+    (normally the operation name), so later calls skip reparsing the document.
+    Only the immutable AST is shared; gql_call() builds a new GraphQLRequest
+    around it for every call, so variables never leak between calls.
+    """
+    cached = _PARSED_DOCUMENTS.get(key)
+    if cached is not None and cached[0] == source:
+        return cached[1]
+
+    document = gql(source).document
+    _PARSED_DOCUMENTS[key] = (source, document)
+    return document
+
+
+class _PrefixVariables(Visitor):
+    """
+    AST visitor that renames every variable of an operation with a prefix.
+    """
+
+    def __init__(self, prefix: str) -> None:
+        super().__init__()
+        self.prefix = prefix
+
+    def enter_variable(self, node: VariableNode, *_args) -> VariableNode:
+        return VariableNode(name=NameNode(value=self.prefix + node.name.value))
+
+
+# Combined documents built by _combine_documents(), keyed by the operation name
+# and the (alias, document identity) pairs that were merged. Documents hash by
+# their whole AST, so identity keeps lookups cheap; the merged documents are kept
+# in the value, so their ids can't be reused while the entry exists.
+_COMBINED_DOCUMENTS: Dict[
+    tuple, Tuple[tuple, DocumentNode, Dict[str, Dict[str, str]]]
+] = {}
+
+
+def _combine_documents(
+    operation: str, documents: Dict[str, DocumentNode]
+) -> Tuple[DocumentNode, Dict[str, Dict[str, str]]]:
+    """
+    Merges single-operation documents into one operation named ``operation``.
+
+    The variables and top-level fields of each document are prefixed with
+    ``<alias>_`` so they cannot collide, and fragments shared between documents
+    are included once. Returns the combined document and, for each alias, a map of
+    combined response key to the response key of the original document.
+    """
+    sources = tuple(documents.values())
+    cache_key = (operation, tuple((alias, id(d)) for alias, d in documents.items()))
+    cached = _COMBINED_DOCUMENTS.get(cache_key)
+    if cached is not None and all(a is b for a, b in zip(cached[0], sources)):
+        return cached[1], cached[2]
+
+    operation_type = None
+    variable_definitions: list = []
+    selections: list = []
+    fragments: Dict[str, FragmentDefinitionNode] = {}
+    response_keys: Dict[str, Dict[str, str]] = {}
+
+    for alias, source in documents.items():
+        prefix = f"{alias}_"
+        operations = [
+            d for d in source.definitions if isinstance(d, OperationDefinitionNode)
+        ]
+        if len(operations) != 1:
+            raise ValueError(f"'{alias}' must contain exactly one operation.")
+        if operation_type is None:
+            operation_type = operations[0].operation
+        elif operations[0].operation != operation_type:
+            raise ValueError("Cannot combine operations of different types.")
+
+        definition = visit(operations[0], _PrefixVariables(prefix))
+        variable_definitions.extend(definition.variable_definitions or ())
+
+        response_keys[alias] = {}
+        for selection in definition.selection_set.selections:
+            if not isinstance(selection, FieldNode):
+                raise ValueError(f"'{alias}' must only select fields at the top level.")
+            key = (selection.alias or selection.name).value
+            attributes = {name: getattr(selection, name) for name in selection.keys}
+            attributes["alias"] = NameNode(value=prefix + key)
+            selections.append(FieldNode(**attributes))
+            response_keys[alias][prefix + key] = key
+
+        for fragment in source.definitions:
+            if not isinstance(fragment, FragmentDefinitionNode):
+                continue
+            name = fragment.name.value
+            if name in fragments and print_ast(fragments[name]) != print_ast(fragment):
+                raise ValueError(f"Conflicting definitions of fragment '{name}'.")
+            fragments[name] = fragment
+
+    combined = OperationDefinitionNode(
+        operation=operation_type,
+        name=NameNode(value=operation),
+        variable_definitions=tuple(variable_definitions),
+        directives=(),
+        selection_set=SelectionSetNode(selections=tuple(selections)),
+    )
+    document = DocumentNode(definitions=(combined, *fragments.values()))
+    _COMBINED_DOCUMENTS[cache_key] = (sources, document, response_keys)
+    return document, response_keys
+
+
+class _CollectVariables(Visitor):
+    """
+    AST visitor that records the name of every variable used.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.names: set = set()
+
+    def enter_variable(self, node: VariableNode, *_args) -> None:
+        self.names.add(node.name.value)
+
+
+# Trimmed documents built by _project_document(), keyed by the identity of the
+# original document (kept in the value, see _COMBINED_DOCUMENTS) and the selected
+# field paths, with the names of the variables they still use.
+_PROJECTED_DOCUMENTS: Dict[tuple, Tuple[DocumentNode, DocumentNode, FrozenSet[str]]] = (
+    {}
+)
+
+
+def _project_document(
+    source: DocumentNode, fields: Iterable[str]
+) -> Tuple[DocumentNode, FrozenSet[str]]:
+    """
+    Trims a single-operation document down to the given field paths.
+
+    Paths are dotted response keys from the top of the result, e.g.
+    ``accounts.displayName``. Selecting a field keeps everything below it, and
+    the fields leading to it are kept as well. Fragments are inlined, and
+    variable definitions no longer used are dropped. Returns the trimmed document
+    and the names of the variables it still takes.
+    """
+    paths = frozenset(fields)
+    cache_key = (id(source), paths)
+    cached = _PROJECTED_DOCUMENTS.get(cache_key)
+    if cached is not None and cached[0] is source:
+        return cached[1], cached[2]
+
+    operations = [
+        d for d in source.definitions if isinstance(d, OperationDefinitionNode)
+    ]
+    if len(operations) != 1:
+        raise ValueError("Only single-operation documents can be projected.")
+    fragments = {
+        d.name.value: d
+        for d in source.definitions
+        if isinstance(d, FragmentDefinitionNode)
+    }
+    matched: set = set()
+
+    def project(selection_set: SelectionSetNode, prefix: str, keep_all: bool):
+        selections: list = []
+        for selection in selection_set.selections:
+            if isinstance(selection, FragmentSpreadNode):
+                fragment = fragments[selection.name.value]
+                selections.extend(project(fragment.selection_set, prefix, keep_all))
+            elif isinstance(selection, InlineFragmentNode):
+                inner = project(selection.selection_set, prefix, keep_all)
+                if inner:
+                    attributes = {
+                        name: getattr(selection, name) for name in selection.keys
+                    }
+                    attributes["selection_set"] = SelectionSetNode(selections=inner)
+                    selections.append(InlineFragmentNode(**attributes))
+            else:
+                path = prefix + (selection.alias or selection.name).value
+                selected = keep_all or path in paths
+                if selected:
+                    matched.add(path)
+                elif not any(p.startswith(path + ".") for p in paths):
+                    continue
+                attributes = {name: getattr(selection, name) for name in selection.keys}
+                if selection.selection_set is not None:
+                    inner = project(selection.selection_set, path + ".", selected)
+                    if not inner:
+                        continue
+                    attributes["selection_set"] = SelectionSetNode(selections=inner)
+                selections.append(FieldNode(**attributes))
+        return tuple(selections)
+
+    operation = operations[0]
+    selections = project(operation.selection_set, "", False)
+    unknown = paths - matched
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    used = _CollectVariables()
+    visit(SelectionSetNode(selections=selections), used)
+    attributes = {name: getattr(operation, name) for name in operation.keys}
+    attributes["selection_set"] = SelectionSetNode(selections=selections)
+    attributes["variable_definitions"] = tuple(
+        definition
+        for definition in operation.variable_definitions or ()
+        if definition.variable.name.value in used.names
+    )
+    document = DocumentNode(definitions=(OperationDefinitionNode(**attributes),))
+    used_names = frozenset(used.names)
+    _PROJECTED_DOCUMENTS[cache_key] = (source, document, used_names)
+    return document, used_names
+
+
+class _PooledAIOHTTPTransport(AIOHTTPTransport):
+    """
+    An AIOHTTPTransport that keeps its aiohttp session, and therefore its pool of
+    keep-alive connections, open between queries instead of reconnecting each time.
+
+    gql connects and closes the transport around every execute_async() call, so
+    close() is a no-op here and the session is only torn down by aclose().
+    """
+
+    def __init__(self, *args, connector_args: Dict[str, Any], **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._connector_args = connector_args
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session_signature: Optional[tuple] = None
+
+    def _signature(self) -> tuple:
+        return (tuple(sorted((self.headers or {}).items())), self.timeout)
+
+    async def connect(self) -> None:
+        loop = asyncio.get_running_loop()
+        signature = self._signature()
+        if (
+            self.session is not None
+            and not self.session.closed
+            and self._loop is loop
+            and self._session_signature == signature
+        ):
+            return
+
+        # A session created on another event loop (e.g. a previous asyncio.run())
+        # cannot be reused or closed from this one, so it is simply dropped.
+        stale = self.session if self._loop is loop else None
+        self.session = None
+        self.client_session_args = {
+            "connector": TCPConnector(**self._connector_args),
+        }
+        await super().connect()
+        self._loop = loop
+        self._session_signature = signature
+
+        # Headers or timeout changed (e.g. after login), retire the old session.
+        if stale is not None and not stale.closed:
+            await stale.close()
+
+    async def close(self) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        """
+        Closes the underlying aiohttp session and its connection pool.
+        """
+        if self.session is not None and self._loop is asyncio.get_running_loop():
+            await super().close()
+        self.session = None
+        self._loop = None
+        self._session_signature = None
+
+
+def _flatten_transaction(transaction: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns a transaction from get_transactions as one flat row of EXPORT_COLUMNS.
+    """
+    row = {column: transaction.get(column) for column in EXPORT_COLUMNS}
+    row["merchant"] = (transaction.get("merchant") or {}).get("name")
+    row["category"] = (transaction.get("category") or {}).get("name")
+    row["account"] = (transaction.get("account") or {}).get("displayName")
+    row["tags"] = ",".join(tag["name"] for tag in transaction.get("tags") or [])
+    return row
+
+
+class _ExportWriter(object):
+    """
+    Writes transactions to an NDJSON, CSV or Parquet file one at a time.
+    """
+
+    def __init__(self, path: str, format: str) -> None:
+        self.format = format
+        self._rows: List[Dict[str, Any]] = []
+        self._parquet = None
+        if format == "parquet":
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise ImportError("Exporting to Parquet requires pyarrow") from None
+            self._pyarrow = pyarrow
+            self._parquet = pyarrow.parquet.ParquetWriter(
+                path, self._parquet_schema(pyarrow)
+            )
+            return
+
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        if format == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=EXPORT_COLUMNS)
+            self._csv.writeheader()
+
+    @staticmethod
+    def _parquet_schema(pyarrow):
+        types = {
+            "amount": pyarrow.float64(),
+            "pending": pyarrow.bool_(),
+            "hideFromReports": pyarrow.bool_(),
+            "isSplitTransaction": pyarrow.bool_(),
+            "isRecurring": pyarrow.bool_(),
+        }
+        return pyarrow.schema(
+            [(column, types.get(column, pyarrow.string())) for column in EXPORT_COLUMNS]
+        )
+
+    def write(self, transaction: Dict[str, Any]) -> None:
+        if self.format == "ndjson":
+            self._file.write(json.dumps(transaction) + "\n")
+        elif self.format == "csv":
+            self._csv.writerow(_flatten_transaction(transaction))
+        else:
+            self._rows.append(_flatten_transaction(transaction))
+            if len(self._rows) >= EXPORT_PARQUET_BATCH_ROWS:
+                self._flush()
+
+    def _flush(self) -> None:
+        if self._rows:
+            self._parquet.write_table(
+                self._pyarrow.Table.from_pylist(self._rows, schema=self._parquet.schema)
+            )
+            self._rows = []
+
+    def close(self) -> None:
+        if self._parquet is not None:
+            self._flush()
+            self._parquet.close()
+        else:
+            self._file.close()
+
+
 class MonarchMoney(object):
     def __init__(
         self,
         session_file: str = SESSION_FILE,
         timeout: int = 10,
         token: Optional[str] = None,
+        connection_limit: int = DEFAULT_CONNECTION_LIMIT,
+        keepalive_timeout: float = DEFAULT_KEEPALIVE_SECS,
+        json_decoder: Union[str, Callable[[Union[str, bytes]], Any]] = "json",
     ) -> None:
+        """
+        :param session_file: where to save and load the session token.
+        :param timeout: the timeout, in seconds, for GraphQL calls.
+        :param token: an existing session token to use instead of logging in.
+        :param connection_limit: the maximum number of pooled connections kept open
+          to the API at once. 0 means no limit.
+        :param keepalive_timeout: how long, in seconds, an idle pooled connection is
+          kept open for reuse.
+        :param json_decoder: how GraphQL responses are decoded: "json" (the
+          standard library, the default), "orjson", "msgspec", "auto" (orjson or
+          msgspec when installed, else the standard library), or a ``loads``-style
+          callable. The fast decoders are opt-in because they can decode some
+          responses differently, e.g. orjson can't hold integers wider than 64 bits.
+        """
         self._headers = {
             "Accept": "application/json",
             "Client-Platform": "web",
@@ -87,6 +645,26 @@ class MonarchMoney(object):
         self._session_file = session_file
         self._token = token
         self._timeout = timeout
+        self._connection_limit = connection_limit
+        self._keepalive_timeout = keepalive_timeout
+        self._json_loads = (
+            json_decoder if callable(json_decoder) else _json_decoder(json_decoder)
+        )
+        self._graphql_client: Optional[Client] = None
+
+    async def __aenter__(self) -> "MonarchMoney":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """
+        Closes the pooled connections used for GraphQL calls.
+        The instance can still be used afterwards; a new pool is opened on demand.
+        """
+        if self._graphql_client is not None:
+            await self._graphql_client.transport.aclose()
 
     @staticmethod
     def _looks_like_jwt(token: str) -> bool:
@@ -178,11 +756,16 @@ class MonarchMoney(object):
 
             return await resp.json()
 
-    async def get_accounts(self) -> Dict[str, Any]:
+    async def get_accounts(
+        self, fields: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
         """
         Gets the list of accounts configured in the Monarch Money account.
+
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
-        query = gql(
+        query = _parse_document(
+            "GetAccounts",
             """
           query GetAccounts {
             accounts {
@@ -255,18 +838,24 @@ class MonarchMoney(object):
             }
             __typename
           }
-        """
+        """,
         )
         return await self.gql_call(
             operation="GetAccounts",
             graphql_query=query,
+            fields=fields,
         )
 
-    async def get_account_type_options(self) -> Dict[str, Any]:
+    async def get_account_type_options(
+        self, fields: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
         """
         Retrieves a list of available account types and their subtypes.
+
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
-        query = gql(
+        query = _parse_document(
+            "GetAccountTypeOptions",
             """
             query GetAccountTypeOptions {
                 accountTypeOptions {
@@ -289,25 +878,29 @@ class MonarchMoney(object):
                     __typename
                 }
             }
-        """
+        """,
         )
         return await self.gql_call(
             operation="GetAccountTypeOptions",
             graphql_query=query,
+            fields=fields,
         )
 
     async def get_recent_account_balances(
-        self, start_date: Optional[str] = None
+        self, start_date: Optional[str] = None, fields: Optional[Iterable[str]] = None
     ) -> Dict[str, Any]:
         """
         Retrieves the daily balance for all accounts starting from `start_date`.
         `start_date` is an ISO formatted datestring, e.g. YYYY-MM-DD.
         If `start_date` is None, then the last 31 days are requested.
+
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
         if start_date is None:
             start_date = (date.today() - timedelta(days=31)).isoformat()
 
-        query = gql(
+        query = _parse_document(
+            "GetAccountRecentBalances",
             """
             query GetAccountRecentBalances($startDate: Date!) {
                 accounts {
@@ -316,15 +909,18 @@ class MonarchMoney(object):
                     __typename
                 }
             }
-        """
+        """,
         )
         return await self.gql_call(
             operation="GetAccountRecentBalances",
             graphql_query=query,
             variables={"startDate": start_date},
+            fields=fields,
         )
 
-    async def get_account_snapshots_by_type(self, start_date: str, timeframe: str):
+    async def get_account_snapshots_by_type(
+        self, start_date: str, timeframe: str, fields: Optional[Iterable[str]] = None
+    ):
         """
         Retrieves snapshots of the net values of all accounts of a given type, with either a yearly
         monthly granularity.
@@ -334,11 +930,14 @@ class MonarchMoney(object):
 
         Note, `month` in the snapshot results is not a full ISO datestring, as it doesn't include the day.
         Instead, it looks like, e.g., 2023-01
+
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
         if timeframe not in ("year", "month"):
             raise Exception(f'Unknown timeframe "{timeframe}"')
 
-        query = gql(
+        query = _parse_document(
+            "GetSnapshotsByAccountType",
             """
             query GetSnapshotsByAccountType($startDate: Date!, $timeframe: Timeframe!) {
                 snapshotsByAccountType(startDate: $startDate, timeframe: $timeframe) {
@@ -353,12 +952,13 @@ class MonarchMoney(object):
                     __typename
                 }
             }
-        """
+        """,
         )
         return await self.gql_call(
             operation="GetSnapshotsByAccountType",
             graphql_query=query,
             variables={"startDate": start_date, "timeframe": timeframe},
+            fields=fields,
         )
 
     async def get_aggregate_snapshots(
@@ -366,13 +966,17 @@ class MonarchMoney(object):
         start_date: Optional[date] = None,
         end_date: Optional[date] = None,
         account_type: Optional[str] = None,
+        fields: Optional[Iterable[str]] = None,
     ) -> dict:
         """
         Retrieves the daily net value of all accounts, optionally between `start_date` and `end_date`,
         and optionally only for accounts of type `account_type`.
         Both `start_date` and `end_date` are ISO datestrings, formatted as YYYY-MM-DD
+
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
-        query = gql(
+        query = _parse_document(
+            "GetAggregateSnapshots",
             """
             query GetAggregateSnapshots($filters: AggregateSnapshotFilters) {
                 aggregateSnapshots(filters: $filters) {
@@ -381,7 +985,7 @@ class MonarchMoney(object):
                     __typename
                 }
             }
-        """
+        """,
         )
 
         if start_date is None:
@@ -402,6 +1006,7 @@ class MonarchMoney(object):
                     "accountType": account_type,
                 }
             },
+            fields=fields,
         )
 
     async def create_manual_account(
@@ -421,7 +1026,8 @@ class MonarchMoney(object):
         :param account_name: The string of the account name
         :param display_balance: a float of the amount of the account balance when the account is created
         """
-        query = gql(
+        query = _parse_document(
+            "Web_CreateManualAccount",
             """
             mutation Web_CreateManualAccount($input: CreateManualAccountMutationInput!) {
                 createManualAccount(input: $input) {
@@ -446,7 +1052,7 @@ class MonarchMoney(object):
                 code
                 __typename
             }
-            """
+            """,
         )
         variables = {
             "input": {
@@ -491,7 +1097,8 @@ class MonarchMoney(object):
         :param hide_from_summary_list: A boolean if the account should be hidden in the "Accounts" view
         :param hide_transactions_from_reports: A boolean if the account should be excluded from budgets and reports
         """
-        query = gql(
+        query = _parse_document(
+            "Common_UpdateAccount",
             """
             mutation Common_UpdateAccount($input: UpdateAccountMutationInput!) {
                 updateAccount(input: $input) {
@@ -580,7 +1187,7 @@ class MonarchMoney(object):
                 code
                 __typename
             }
-            """
+            """,
         )
 
         variables = {
@@ -615,7 +1222,8 @@ class MonarchMoney(object):
         """
         Deletes an account
         """
-        query = gql(
+        query = _parse_document(
+            "Common_DeleteAccount",
             """
             mutation Common_DeleteAccount($id: UUID!) {
                 deleteAccount(id: $id) {
@@ -637,7 +1245,7 @@ class MonarchMoney(object):
                 code
                 __typename
             }
-            """
+            """,
         )
 
         variables = {"id": account_id}
@@ -655,7 +1263,8 @@ class MonarchMoney(object):
 
         Otherwise, throws a `RequestFailedException`.
         """
-        query = gql(
+        query = _parse_document(
+            "Common_ForceRefreshAccountsMutation",
             """
           mutation Common_ForceRefreshAccountsMutation($input: ForceRefreshAccountsInput!) {
             forceRefreshAccounts(input: $input) {
@@ -678,7 +1287,7 @@ class MonarchMoney(object):
             code
             __typename
           }
-          """
+          """,
         )
 
         variables = {
@@ -712,8 +1321,12 @@ class MonarchMoney(object):
 
         :param account_ids: The list of accounts IDs to check on the status of.
           If set to None, all account IDs will be checked.
+
+        Takes no `fields`: the query only asks for the id and sync status the check
+        reads, so there is nothing left to trim.
         """
-        query = gql(
+        query = _parse_document(
+            "ForceRefreshAccountsQuery",
             """
           query ForceRefreshAccountsQuery {
             accounts {
@@ -722,7 +1335,7 @@ class MonarchMoney(object):
               __typename
             }
           }
-          """
+          """,
         )
 
         response = await self.gql_call(
@@ -773,11 +1386,16 @@ class MonarchMoney(object):
             refreshed = await self.is_accounts_refresh_complete(account_ids)
         return refreshed
 
-    async def get_account_holdings(self, account_id: int) -> Dict[str, Any]:
+    async def get_account_holdings(
+        self, account_id: int, fields: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
         """
         Get the holdings information for a brokerage or similar type of account.
+
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
-        query = gql(
+        query = _parse_document(
+            "Web_GetHoldings",
             """
           query Web_GetHoldings($input: PortfolioInput) {
             portfolio(input: $input) {
@@ -825,7 +1443,7 @@ class MonarchMoney(object):
               __typename
             }
           }
-        """
+        """,
         )
 
         variables = {
@@ -841,20 +1459,27 @@ class MonarchMoney(object):
             operation="Web_GetHoldings",
             graphql_query=query,
             variables=variables,
+            fields=fields,
         )
 
-    async def get_account_history(self, account_id: int) -> Dict[str, Any]:
+    async def get_account_history(
+        self, account_id: int, fields: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
         """
         Gets historical account snapshot data for the requested account
 
         Args:
           account_id: Monarch account ID as an integer
+          fields: only request these snapshot field paths (see gql_call), e.g.
+            ``["snapshots.date", "snapshots.signedBalance"]``. Defaults to every
+            snapshot field.
 
         Returns:
           json object with all historical snapshots of requested account's balances
         """
 
-        query = gql(
+        query = _parse_document(
+            "AccountDetails_getAccount",
             """
             query AccountDetails_getAccount($id: UUID!, $filters: TransactionFilterInput) {
               account(id: $id) {
@@ -1050,15 +1675,21 @@ class MonarchMoney(object):
               }
               __typename
             }
-            """
+            """,
         )
 
         variables = {"id": str(account_id)}
+        # Only the account's name and its snapshots are returned, so the account's
+        # details and recent transactions are never requested
+        fields = {"account.displayName", *(fields if fields is not None else ())}
+        if not any(path.split(".")[0] == "snapshots" for path in fields):
+            fields.add("snapshots")
 
         account_details = await self.gql_call(
             operation="AccountDetails_getAccount",
             graphql_query=query,
             variables=variables,
+            fields=fields,
         )
 
         # Parse JSON
@@ -1072,12 +1703,17 @@ class MonarchMoney(object):
 
         return account_balance_history
 
-    async def get_institutions(self) -> Dict[str, Any]:
+    async def get_institutions(
+        self, fields: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
         """
         Gets institution data from the account.
+
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
 
-        query = gql(
+        query = _parse_document(
+            "Web_GetInstitutionSettings",
             """
             query Web_GetInstitutionSettings {
               credentials {
@@ -1150,11 +1786,12 @@ class MonarchMoney(object):
               }
               __typename
             }
-        """
+        """,
         )
         return await self.gql_call(
             operation="Web_GetInstitutionSettings",
             graphql_query=query,
+            fields=fields,
         )
 
     async def get_budgets(
@@ -1163,6 +1800,7 @@ class MonarchMoney(object):
         end_date: Optional[str] = None,
         use_legacy_goals: Optional[bool] = False,
         use_v2_goals: Optional[bool] = True,
+        fields: Optional[Iterable[str]] = None,
     ) -> Dict[str, Any]:
         """
         Get your budgets and corresponding actual amounts from the account.
@@ -1179,8 +1817,10 @@ class MonarchMoney(object):
             Deprecated; legacy goals are no longer supported by the API.
         :param use_v2_goals:
             Set True to return a list of monthly budget set aside for version 2 goals (default list)
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
-        query = gql(
+        query = _parse_document(
+            "GetJointPlanningData",
             """
           query GetJointPlanningData($startDate: Date!, $endDate: Date!, $useV2Goals: Boolean!) {
             budgetData(startMonth: $startDate, endMonth: $endDate) {
@@ -1322,7 +1962,7 @@ class MonarchMoney(object):
             }
             budgetSystem
           }
-        """
+        """,
         )
 
         variables = {
@@ -1366,13 +2006,19 @@ class MonarchMoney(object):
             operation="GetJointPlanningData",
             graphql_query=query,
             variables=variables,
+            fields=fields,
         )
 
-    async def get_subscription_details(self) -> Dict[str, Any]:
+    async def get_subscription_details(
+        self, fields: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
         """
         The type of subscription for the Monarch Money account.
+
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
-        query = gql(
+        query = _parse_document(
+            "GetSubscriptionDetails",
             """
           query GetSubscriptionDetails {
             subscription {
@@ -1384,19 +2030,25 @@ class MonarchMoney(object):
               __typename
             }
           }
-        """
+        """,
         )
         return await self.gql_call(
             operation="GetSubscriptionDetails",
             graphql_query=query,
+            fields=fields,
         )
 
-    async def get_transactions_summary(self) -> Dict[str, Any]:
+    async def get_transactions_summary(
+        self, fields: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
         """
         Gets transactions summary from the account.
+
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
 
-        query = gql(
+        query = _parse_document(
+            "GetTransactionsPage",
             """
             query GetTransactionsPage($filters: TransactionFilterInput) {
               aggregates(filters: $filters) {
@@ -1420,11 +2072,12 @@ class MonarchMoney(object):
               last
               __typename
             }
-        """
+        """,
         )
         return await self.gql_call(
             operation="GetTransactionsPage",
             graphql_query=query,
+            fields=fields,
         )
 
     async def get_transactions(
@@ -1444,6 +2097,7 @@ class MonarchMoney(object):
         is_recurring: Optional[bool] = None,
         imported_from_mint: Optional[bool] = None,
         synced_from_institution: Optional[bool] = None,
+        fields: Optional[Iterable[str]] = None,
     ) -> Dict[str, Any]:
         """
         Gets transaction data from the account.
@@ -1463,9 +2117,11 @@ class MonarchMoney(object):
         :param is_recurring: a bool to filter for whether the transactions are recurring.
         :param imported_from_mint: a bool to filter for whether the transactions were imported from mint.
         :param synced_from_institution: a bool to filter for whether the transactions were synced from an institution.
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
 
-        query = gql(
+        query = _parse_document(
+            "GetTransactionsList",
             """
           query GetTransactionsList($offset: Int, $limit: Int, $filters: TransactionFilterInput, $orderBy: TransactionOrdering) {
             allTransactions(filters: $filters) {
@@ -1531,7 +2187,7 @@ class MonarchMoney(object):
             }
             __typename
           }
-        """
+        """,
         )
 
         variables = {
@@ -1577,9 +2233,226 @@ class MonarchMoney(object):
             )
 
         return await self.gql_call(
-            operation="GetTransactionsList", graphql_query=query, variables=variables
+            operation="GetTransactionsList",
+            graphql_query=query,
+            variables=variables,
+            fields=fields,
         )
 
+    async def iter_transactions(
+        self,
+        page_size: int = DEFAULT_RECORD_LIMIT,
+        prefetch: int = 0,
+        as_records: bool = False,
+        **filters: Any,
+    ) -> AsyncIterator[Union[Dict[str, Any], TransactionRecord]]:
+        """
+        Yields every transaction matching the filters, one at a time, fetching them
+        page by page with get_transactions.
+
+        At most `prefetch + 1` pages are held in memory at once, however long the
+        history is. Pages are fetched by offset, so transactions added or removed
+        while iterating may be skipped or repeated.
+
+        :param page_size: the number of transactions to request per page.
+        :param prefetch: the number of following pages to fetch in parallel while
+          the current one is consumed. 0 fetches one page at a time.
+        :param as_records: yield TransactionRecord objects instead of dicts.
+        :param filters: any filter accepted by get_transactions (start_date,
+          end_date, search, account_ids, fields, ...), except limit and offset.
+        """
+        if page_size < 1:
+            raise ValueError("page_size must be at least 1")
+        if prefetch < 0:
+            raise ValueError("prefetch must not be negative")
+        if filters.get("fields") is not None:
+            # Paging needs the total whatever else is projected, and callers the id
+            filters["fields"] = {
+                *filters["fields"],
+                "allTransactions.totalCount",
+                "allTransactions.results.id",
+            }
+            if as_records:
+                # TransactionRecord.from_dict requires the date too
+                filters["fields"].add("allTransactions.results.date")
+
+        async def fetch_page(offset: int) -> Dict[str, Any]:
+            response = await self.get_transactions(
+                limit=page_size, offset=offset, **filters
+            )
+            return response["allTransactions"]
+
+        page = await fetch_page(0)
+        # Known from the first page on; later pages are only fetched up to it
+        total = page["totalCount"]
+        next_offset = page_size
+        pending: collections.deque = collections.deque()
+        try:
+            while True:
+                while len(pending) < prefetch and next_offset < total:
+                    pending.append(asyncio.ensure_future(fetch_page(next_offset)))
+                    next_offset += page_size
+
+                results = page["results"]
+                if as_records:
+                    results = map(TransactionRecord.from_dict, results)
+                for transaction in results:
+                    yield transaction
+                full_page = len(page["results"]) == page_size
+                # Release the consumed page before waiting on the next one
+                page = results = None
+
+                if pending:
+                    page = await pending.popleft()
+                elif full_page and next_offset < total:
+                    page = await fetch_page(next_offset)
+                    next_offset += page_size
+                else:
+                    return
+        finally:
+            # The caller stopped early (break/aclose); drop pages still in flight
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def iter_transactions_by_date(
+        self,
+        start_date: str,
+        end_date: str,
+        shard_days: int = DEFAULT_EXPORT_SHARD_DAYS,
+        concurrency: int = DEFAULT_EXPORT_CONCURRENCY,
+        page_size: int = DEFAULT_RECORD_LIMIT,
+        **filters: Any,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yields every transaction between two dates, oldest date first.
+
+        The range is split into shards of `shard_days` days, and up to `concurrency`
+        shards are downloaded at once with iter_transactions. Each shard is sorted by
+        date and yielded in turn. A transaction showing up in two neighbouring shards
+        is only yielded once. At most `concurrency` shards are held in memory.
+
+        :param start_date: the earliest date to get transactions from, in "yyyy-mm-dd" format.
+        :param end_date: the latest date to get transactions from, in "yyyy-mm-dd" format.
+        :param shard_days: the number of days fetched per shard.
+        :param concurrency: the maximum number of shards downloaded at once.
+        :param page_size: the number of transactions requested per page within a shard.
+        :param filters: any other filter accepted by get_transactions.
+        """
+        if shard_days < 1 or concurrency < 1:
+            raise ValueError("shard_days and concurrency must be at least 1")
+        if filters.get("fields") is not None:
+            # Shards are ordered by date and de-duplicated by id
+            filters["fields"] = {
+                *filters["fields"],
+                "allTransactions.results.id",
+                "allTransactions.results.date",
+            }
+
+        shards = []
+        shard_start = date.fromisoformat(start_date)
+        last_day = date.fromisoformat(end_date)
+        while shard_start <= last_day:
+            shard_end = min(shard_start + timedelta(days=shard_days - 1), last_day)
+            shards.append((shard_start.isoformat(), shard_end.isoformat()))
+            shard_start = shard_end + timedelta(days=1)
+
+        async def fetch_shard(shard: Tuple[str, str]) -> List[Dict[str, Any]]:
+            transactions = [
+                transaction
+                async for transaction in self.iter_transactions(
+                    page_size=page_size,
+                    start_date=shard[0],
+                    end_date=shard[1],
+                    **filters,
+                )
+            ]
+            transactions.sort(key=lambda transaction: transaction["date"])
+            return transactions
+
+        remaining = iter(shards)
+        pending: collections.deque = collections.deque()
+        previous_ids: set = set()
+        try:
+            while True:
+                while len(pending) < concurrency:
+                    shard = next(remaining, None)
+                    if shard is None:
+                        break
+                    pending.append(asyncio.ensure_future(fetch_shard(shard)))
+                if not pending:
+                    return
+
+                transactions = await pending.popleft()
+                shard_ids = set()
+                for transaction in transactions:
+                    if (
+                        transaction["id"] in previous_ids
+                        or transaction["id"] in shard_ids
+                    ):
+                        continue
+                    shard_ids.add(transaction["id"])
+                    yield transaction
+                previous_ids = shard_ids
+                transactions = None
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def export_transactions(
+        self,
+        path: str,
+        start_date: str,
+        end_date: str,
+        format: Optional[str] = None,
+        shard_days: int = DEFAULT_EXPORT_SHARD_DAYS,
+        concurrency: int = DEFAULT_EXPORT_CONCURRENCY,
+        page_size: int = DEFAULT_RECORD_LIMIT,
+        **filters: Any,
+    ) -> int:
+        """
+        Downloads every transaction between two dates into a file, oldest date first,
+        writing them as they arrive (see iter_transactions_by_date).
+
+        NDJSON keeps each transaction as returned by get_transactions. CSV and Parquet
+        write one flat row of EXPORT_COLUMNS per transaction; Parquet requires pyarrow.
+
+        :param path: the file to write.
+        :param start_date: the earliest date to get transactions from, in "yyyy-mm-dd" format.
+        :param end_date: the latest date to get transactions from, in "yyyy-mm-dd" format.
+        :param format: "ndjson", "csv" or "parquet". Defaults to the file extension.
+        :param shard_days: the number of days fetched per shard.
+        :param concurrency: the maximum number of shards downloaded at once.
+        :param page_size: the number of transactions requested per page within a shard.
+        :param filters: any other filter accepted by get_transactions.
+        :return: the number of transactions written.
+        """
+        if format is None:
+            extension = os.path.splitext(path)[1].lstrip(".").lower()
+            format = "ndjson" if extension in ("json", "jsonl") else extension
+        if format not in EXPORT_FORMATS:
+            raise ValueError(
+                f"Unsupported export format {format!r}, expected one of {EXPORT_FORMATS}"
+            )
+
+        writer = _ExportWriter(path, format)
+        count = 0
+        try:
+            async for transaction in self.iter_transactions_by_date(
+                start_date,
+                end_date,
+                shard_days=shard_days,
+                concurrency=concurrency,
+                page_size=page_size,
+                **filters,
+            ):
+                writer.write(transaction)
+                count += 1
+        finally:
+            writer.close()
+        return count
+
     async def create_transaction(
         self,
         date: str,
@@ -1593,7 +2466,8 @@ class MonarchMoney(object):
         """
         Creates a transaction with the given parameters
         """
-        query = gql(
+        query = _parse_document(
+            "Common_CreateTransactionMutation",
             """
           mutation Common_CreateTransactionMutation($input: CreateTransactionMutationInput!) {
             createTransaction(input: $input) {
@@ -1618,7 +2492,7 @@ class MonarchMoney(object):
             code
             __typename
           }
-        """
+        """,
         )
 
         variables = {
@@ -1645,7 +2519,8 @@ class MonarchMoney(object):
 
         :param transaction_id: the ID of the transaction targeted for deletion.
         """
-        query = gql(
+        query = _parse_document(
+            "Common_DeleteTransactionMutation",
             """
           mutation Common_DeleteTransactionMutation($input: DeleteTransactionMutationInput!) {
             deleteTransaction(input: $input) {
@@ -1668,7 +2543,7 @@ class MonarchMoney(object):
             code
             __typename
           }
-        """
+        """,
         )
 
         variables = {
@@ -1688,11 +2563,16 @@ class MonarchMoney(object):
 
         return True
 
-    async def get_transaction_categories(self) -> Dict[str, Any]:
+    async def get_transaction_categories(
+        self, fields: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
         """
         Gets all the categories configured in the account.
+
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
-        query = gql(
+        query = _parse_document(
+            "GetCategories",
             """
           query GetCategories {
             categories {
@@ -1718,12 +2598,15 @@ class MonarchMoney(object):
             }
             __typename
           }
-        """
+        """,
+        )
+        return await self.gql_call(
+            operation="GetCategories", graphql_query=query, fields=fields
         )
-        return await self.gql_call(operation="GetCategories", graphql_query=query)
 
     async def delete_transaction_category(self, category_id: str) -> bool:
-        query = gql(
+        query = _parse_document(
+            "Web_DeleteCategory",
             """
           mutation Web_DeleteCategory($id: UUID!, $moveToCategoryId: UUID) {
             deleteCategory(id: $id, moveToCategoryId: $moveToCategoryId) {
@@ -1746,7 +2629,7 @@ class MonarchMoney(object):
             code
             __typename
           }
-        """
+        """,
         )
 
         variables = {
@@ -1773,11 +2656,16 @@ class MonarchMoney(object):
             return_exceptions=True,
         )
 
-    async def get_transaction_category_groups(self) -> Dict[str, Any]:
+    async def get_transaction_category_groups(
+        self, fields: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
         """
         Gets all the category groups configured in the account.
+
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
-        query = gql(
+        query = _parse_document(
+            "ManageGetCategoryGroups",
             """
           query ManageGetCategoryGroups {
               categoryGroups {
@@ -1790,10 +2678,12 @@ class MonarchMoney(object):
                   __typename
               }
           }
-        """
+        """,
         )
         return await self.gql_call(
-            operation="ManageGetCategoryGroups", graphql_query=query
+            operation="ManageGetCategoryGroups",
+            graphql_query=query,
+            fields=fields,
         )
 
     async def create_transaction_category(
@@ -1815,7 +2705,8 @@ class MonarchMoney(object):
         :param rollover_type: The budget roll over type
         """
 
-        query = gql(
+        query = _parse_document(
+            "Web_CreateCategory",
             """
             mutation Web_CreateCategory($input: CreateCategoryInput!) {
                 createCategory(input: $input) {
@@ -1864,7 +2755,7 @@ class MonarchMoney(object):
                 }
                 __typename
             }
-            """
+            """,
         )
         variables = {
             "input": {
@@ -1893,7 +2784,8 @@ class MonarchMoney(object):
           More information can be found https://en.wikipedia.org/wiki/Web_colors#Hex_triplet.
           Does not appear to be limited to the color selections in the dashboard.
         """
-        mutation = gql(
+        mutation = _parse_document(
+            "Common_CreateTransactionTag",
             """
             mutation Common_CreateTransactionTag($input: CreateTransactionTagInput!) {
               createTransactionTag(input: $input) {
@@ -1912,7 +2804,7 @@ class MonarchMoney(object):
                 __typename
               }
             }
-            """
+            """,
         )
         variables = {"input": {"name": name, "color": color}}
 
@@ -1922,11 +2814,16 @@ class MonarchMoney(object):
             variables=variables,
         )
 
-    async def get_transaction_tags(self) -> Dict[str, Any]:
+    async def get_transaction_tags(
+        self, fields: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
         """
         Gets all the tags configured in the account.
+
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
-        query = gql(
+        query = _parse_document(
+            "GetHouseholdTransactionTags",
             """
           query GetHouseholdTransactionTags($search: String, $limit: Int, $bulkParams: BulkTransactionDataParams) {
             householdTransactionTags(
@@ -1942,10 +2839,12 @@ class MonarchMoney(object):
               __typename
             }
           }
-        """
+        """,
         )
         return await self.gql_call(
-            operation="GetHouseholdTransactionTags", graphql_query=query
+            operation="GetHouseholdTransactionTags",
+            graphql_query=query,
+            fields=fields,
         )
 
     async def set_transaction_tags(
@@ -1960,7 +2859,22 @@ class MonarchMoney(object):
           Overwrites existing tags. Empty list removes all tags.
         """
 
-        query = gql(
+        query, variables = self._set_transaction_tags_request(transaction_id, tag_ids)
+
+        return await self.gql_call(
+            operation="Web_SetTransactionTags",
+            graphql_query=query,
+            variables=variables,
+        )
+
+    def _set_transaction_tags_request(
+        self, transaction_id: str, tag_ids: List[str]
+    ) -> Tuple[DocumentNode, Dict[str, Any]]:
+        """
+        Builds the query and variables for set_transaction_tags().
+        """
+        query = _parse_document(
+            "Web_SetTransactionTags",
             """
           mutation Web_SetTransactionTags($input: SetTransactionTagsInput!) {
             setTransactionTags(input: $input) {
@@ -1990,29 +2904,52 @@ class MonarchMoney(object):
             code
             __typename
           }
-          """
+          """,
         )
 
         variables = {
             "input": {"transactionId": transaction_id, "tagIds": tag_ids},
         }
 
-        return await self.gql_call(
-            operation="Web_SetTransactionTags",
-            graphql_query=query,
-            variables=variables,
+        return query, variables
+
+    async def update_transaction_and_tags(
+        self, transaction_id: str, tag_ids: List[str], **update_kwargs
+    ) -> Dict[str, Any]:
+        """
+        Updates a transaction and sets its tags in a single request.
+        :param transaction_id: The transaction id
+        :param tag_ids: The list of tag ids to set on the transaction.
+          Overwrites existing tags. Empty list removes all tags.
+        :param update_kwargs: any of the keyword arguments of update_transaction().
+        :return: the updateTransaction and setTransactionTags results.
+        """
+        results = await self.gql_call_combined(
+            operation="Common_UpdateTransactionAndTags",
+            calls={
+                "update": self._update_transaction_request(
+                    transaction_id, **update_kwargs
+                ),
+                "tags": self._set_transaction_tags_request(transaction_id, tag_ids),
+            },
         )
+        return {**results["update"], **results["tags"]}
 
     async def get_transaction_details(
-        self, transaction_id: str, redirect_posted: bool = True
+        self,
+        transaction_id: str,
+        redirect_posted: bool = True,
+        fields: Optional[Iterable[str]] = None,
     ) -> Dict[str, Any]:
         """
         Returns detailed information about a transaction.
 
         :param transaction_id: the transaction to fetch.
         :param redirect_posted: whether to redirect posted transactions. Defaults to True.
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
-        query = gql(
+        query = _parse_document(
+            "GetTransactionDrawer",
             """
           query GetTransactionDrawer($id: UUID!, $redirectPosted: Boolean) {
             getTransaction(id: $id, redirectPosted: $redirectPosted) {
@@ -2141,7 +3078,7 @@ class MonarchMoney(object):
             }
             __typename
           }
-        """
+        """,
         )
 
         variables = {
@@ -2150,16 +3087,23 @@ class MonarchMoney(object):
         }
 
         return await self.gql_call(
-            operation="GetTransactionDrawer", variables=variables, graphql_query=query
+            operation="GetTransactionDrawer",
+            variables=variables,
+            graphql_query=query,
+            fields=fields,
         )
 
-    async def get_transaction_splits(self, transaction_id: str) -> Dict[str, Any]:
+    async def get_transaction_splits(
+        self, transaction_id: str, fields: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
         """
         Returns the transaction split information for a transaction.
 
         :param transaction_id: the transaction to query.
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
-        query = gql(
+        query = _parse_document(
+            "TransactionSplitQuery",
             """
           query TransactionSplitQuery($id: UUID!) {
             getTransaction(id: $id) {
@@ -2194,13 +3138,16 @@ class MonarchMoney(object):
               __typename
             }
           }
-        """
+        """,
         )
 
         variables = {"id": transaction_id}
 
         return await self.gql_call(
-            operation="TransactionSplitQuery", variables=variables, graphql_query=query
+            operation="TransactionSplitQuery",
+            variables=variables,
+            graphql_query=query,
+            fields=fields,
         )
 
     async def update_transaction_splits(
@@ -2218,7 +3165,8 @@ class MonarchMoney(object):
           split_data takes the shape: [{"merchantName": "...", "amount": -12.34, "categoryId": "231"}, split2, split3, ...]
           sum([split.amount for split in split_data]) must equal transaction_id.amount.
         """
-        query = gql(
+        query = _parse_document(
+            "Common_SplitTransactionMutation",
             """
           mutation Common_SplitTransactionMutation($input: UpdateTransactionSplitMutationInput!) {
             updateTransactionSplit(input: $input) {
@@ -2261,7 +3209,7 @@ class MonarchMoney(object):
             code
             __typename
           }
-        """
+        """,
         )
 
         if split_data is None:
@@ -2282,11 +3230,15 @@ class MonarchMoney(object):
         limit: int = DEFAULT_RECORD_LIMIT,
         start_date: Optional[str] = None,
         end_date: Optional[str] = None,
+        fields: Optional[Iterable[str]] = None,
     ) -> Dict[str, Any]:
         """
         Gets all the categories configured in the account.
+
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
-        query = gql(
+        query = _parse_document(
+            "Web_GetCashFlowPage",
             """
           query Web_GetCashFlowPage($filters: TransactionFilterInput) {
             byCategory: aggregates(filters: $filters, groupBy: ["category"]) {
@@ -2353,7 +3305,7 @@ class MonarchMoney(object):
               __typename
             }
           }
-        """
+        """,
         )
 
         variables = {
@@ -2379,7 +3331,10 @@ class MonarchMoney(object):
             variables["filters"]["endDate"] = self._get_end_of_current_month()
 
         return await self.gql_call(
-            operation="Web_GetCashFlowPage", variables=variables, graphql_query=query
+            operation="Web_GetCashFlowPage",
+            variables=variables,
+            graphql_query=query,
+            fields=fields,
         )
 
     async def get_cashflow_summary(
@@ -2387,11 +3342,15 @@ class MonarchMoney(object):
         limit: int = DEFAULT_RECORD_LIMIT,
         start_date: Optional[str] = None,
         end_date: Optional[str] = None,
+        fields: Optional[Iterable[str]] = None,
     ) -> Dict[str, Any]:
         """
         Gets all the categories configured in the account.
+
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
-        query = gql(
+        query = _parse_document(
+            "Web_GetCashFlowPage:summary",
             """
           query Web_GetCashFlowPage($filters: TransactionFilterInput) {
             summary: aggregates(filters: $filters, fillEmptyValues: true) {
@@ -2405,7 +3364,7 @@ class MonarchMoney(object):
               __typename
             }
           }
-        """
+        """,
         )
 
         variables = {
@@ -2431,7 +3390,10 @@ class MonarchMoney(object):
             variables["filters"]["endDate"] = self._get_end_of_current_month()
 
         return await self.gql_call(
-            operation="Web_GetCashFlowPage", variables=variables, graphql_query=query
+            operation="Web_GetCashFlowPage",
+            variables=variables,
+            graphql_query=query,
+            fields=fields,
         )
 
     async def update_transaction(
@@ -2500,7 +3462,41 @@ class MonarchMoney(object):
                 notes=f'Updated On: {datetime.now().strftime("%m/%d/%Y %H:%M:%S")}',
             )
         """
-        query = gql(
+        query, variables = self._update_transaction_request(
+            transaction_id=transaction_id,
+            category_id=category_id,
+            merchant_name=merchant_name,
+            goal_id=goal_id,
+            amount=amount,
+            date=date,
+            hide_from_reports=hide_from_reports,
+            needs_review=needs_review,
+            notes=notes,
+        )
+
+        return await self.gql_call(
+            operation="Web_TransactionDrawerUpdateTransaction",
+            variables=variables,
+            graphql_query=query,
+        )
+
+    def _update_transaction_request(
+        self,
+        transaction_id: str,
+        category_id: Optional[str] = None,
+        merchant_name: Optional[str] = None,
+        goal_id: Optional[str] = None,
+        amount: Optional[float] = None,
+        date: Optional[str] = None,
+        hide_from_reports: Optional[bool] = None,
+        needs_review: Optional[bool] = None,
+        notes: Optional[str] = None,
+    ) -> Tuple[DocumentNode, Dict[str, Any]]:
+        """
+        Builds the query and variables for update_transaction().
+        """
+        query = _parse_document(
+            "Web_TransactionDrawerUpdateTransaction",
             """
         mutation Web_TransactionDrawerUpdateTransaction($input: UpdateTransactionMutationInput!) {
             updateTransaction(input: $input) {
@@ -2553,7 +3549,7 @@ class MonarchMoney(object):
             code
             __typename
         }
-        """
+        """,
         )
 
         variables: dict[str, Any] = {
@@ -2590,11 +3586,7 @@ class MonarchMoney(object):
         if notes is not None:
             variables["input"].update({"notes": notes})
 
-        return await self.gql_call(
-            operation="Web_TransactionDrawerUpdateTransaction",
-            variables=variables,
-            graphql_query=query,
-        )
+        return query, variables
 
     async def set_budget_amount(
         self,
@@ -2631,7 +3623,8 @@ class MonarchMoney(object):
                 "You must specify either a category_id OR category_group_id; not both"
             )
 
-        query = gql(
+        query = _parse_document(
+            "Common_UpdateBudgetItem",
             """
           mutation Common_UpdateBudgetItem($input: UpdateOrCreateBudgetItemMutationInput!) {
             updateOrCreateBudgetItem(input: $input) {
@@ -2643,7 +3636,7 @@ class MonarchMoney(object):
               __typename
             }
           }
-        """
+        """,
         )
 
         variables = {
@@ -2727,7 +3720,8 @@ class MonarchMoney(object):
         :param session_key: The session key for the uploaded file.
         """
 
-        query = gql(
+        query = _parse_document(
+            "Web_ParseUploadBalanceHistorySession",
             """
             mutation Web_ParseUploadBalanceHistorySession($input: ParseBalanceHistoryInput!) {
                 parseBalanceHistory(input: $input) {
@@ -2743,7 +3737,7 @@ class MonarchMoney(object):
                 status
                 __typename
             }
-            """
+            """,
         )
 
         variables = {"input": {"sessionKey": session_key}}
@@ -2759,7 +3753,8 @@ class MonarchMoney(object):
         :param session_key: The session key for the uploaded file.
         """
 
-        query = gql(
+        query = _parse_document(
+            "Web_GetUploadBalanceHistorySession",
             """
             query Web_GetUploadBalanceHistorySession($sessionKey: String!) {
                 uploadBalanceHistorySession(sessionKey: $sessionKey) {
@@ -2772,7 +3767,7 @@ class MonarchMoney(object):
                 status
                 __typename
             }
-            """
+            """,
         )
 
         variables = {"sessionKey": session_key}
@@ -2787,7 +3782,8 @@ class MonarchMoney(object):
         :param transaction_id: The selected transaction id to get the request parameters for
         """
 
-        query = gql(
+        query = _parse_document(
+            "Common_GetTransactionAttachmentUploadInfo",
             """
             mutation Common_GetTransactionAttachmentUploadInfo($transactionId: UUID!) {
                 getTransactionAttachmentUploadInfo(transactionId: $transactionId) {
@@ -2806,7 +3802,7 @@ class MonarchMoney(object):
                     __typename
                 }
             }
-            """
+            """,
         )
 
         variables = {"transactionId": transaction_id}
@@ -2835,7 +3831,8 @@ class MonarchMoney(object):
         :param size_bytes: the size of the file from request params
         """
 
-        query = gql(
+        query = _parse_document(
+            "Common_AddTransactionAttachment",
             """
             mutation Common_AddTransactionAttachment($input: TransactionAddAttachmentMutationInput!) {
                 addTransactionAttachment(input: $input) {
@@ -2855,7 +3852,7 @@ class MonarchMoney(object):
                     __typename
                 }
             }
-            """
+            """,
         )
 
         variables = {
@@ -2927,7 +3924,8 @@ class MonarchMoney(object):
         :param session_key: The session key for the uploaded file.
         """
 
-        query = gql(
+        query = _parse_document(
+            "Web_ParseUploadBalanceHistorySession",
             """
             mutation Web_ParseUploadBalanceHistorySession($input: ParseBalanceHistoryInput!) {
                 parseBalanceHistory(input: $input) {
@@ -2943,7 +3941,7 @@ class MonarchMoney(object):
                 status
                 __typename
             }
-            """
+            """,
         )
 
         variables = {"input": {"sessionKey": session_key}}
@@ -2959,7 +3957,8 @@ class MonarchMoney(object):
         :param session_key: The session key for the uploaded file.
         """
 
-        query = gql(
+        query = _parse_document(
+            "Web_GetUploadBalanceHistorySession",
             """
             query Web_GetUploadBalanceHistorySession($sessionKey: String!) {
                 uploadBalanceHistorySession(sessionKey: $sessionKey) {
@@ -2972,7 +3971,7 @@ class MonarchMoney(object):
                 status
                 __typename
             }
-            """
+            """,
         )
 
         variables = {"sessionKey": session_key}
@@ -2985,12 +3984,16 @@ class MonarchMoney(object):
         self,
         start_date: Optional[str] = None,
         end_date: Optional[str] = None,
+        fields: Optional[Iterable[str]] = None,
     ) -> Dict[str, Any]:
         """
         Fetches upcoming recurring transactions from Monarch Money's API.  This includes
         all merchant data, as well as the accounts where the charge will take place.
+
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
-        query = gql(
+        query = _parse_document(
+            "Web_GetUpcomingRecurringTransactionItems",
             """
             query Web_GetUpcomingRecurringTransactionItems($startDate: Date!, $endDate: Date!, $filters: RecurringTransactionFilter) {
               recurringTransactionItems(
@@ -3030,7 +4033,7 @@ class MonarchMoney(object):
                 __typename
               }
             }
-        """
+        """,
         )
 
         variables = {"startDate": start_date, "endDate": end_date}
@@ -3044,14 +4047,22 @@ class MonarchMoney(object):
             variables["endDate"] = self._get_end_of_current_month()
 
         return await self.gql_call(
-            "Web_GetUpcomingRecurringTransactionItems", query, variables
+            "Web_GetUpcomingRecurringTransactionItems",
+            query,
+            variables,
+            fields=fields,
         )
 
-    async def get_credit_history(self) -> Dict[str, Any]:
+    async def get_credit_history(
+        self, fields: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
         """
         Gets credit score history and related user details.
+
+        :param fields: only request these field paths (see gql_call). Defaults to every field.
         """
-        query = gql(
+        query = _parse_document(
+            "Common_GetSpinwheelCreditScoreSnapshots",
             """
             query Common_GetSpinwheelCreditScoreSnapshots {
               me {
@@ -3101,10 +4112,12 @@ class MonarchMoney(object):
               isBillSyncTrackingEnabled
               __typename
             }
-        """
+        """,
         )
         return await self.gql_call(
-            operation="Common_GetSpinwheelCreditScoreSnapshots", graphql_query=query
+            operation="Common_GetSpinwheelCreditScoreSnapshots",
+            graphql_query=query,
+            fields=fields,
         )
 
     def _get_current_date(self) -> str:
@@ -3135,13 +4148,60 @@ class MonarchMoney(object):
         operation: str,
         graphql_query: DocumentNode,
         variables: Dict[str, Any] = {},
+        fields: Optional[Iterable[str]] = None,
     ) -> Dict[str, Any]:
         """
         Makes a GraphQL call to Monarch Money's API.
+
+        :param fields: if given, only these field paths are requested, e.g.
+          ``["accounts.id", "accounts.displayName"]``. Selecting a field keeps
+          everything below it. The trimmed document is cached per set of paths.
         """
-        return await self._get_graphql_client().execute_async(
-            request=graphql_query, variable_values=variables, operation_name=operation
+        if fields is not None:
+            graphql_query, used = _project_document(graphql_query, fields)
+            variables = {
+                name: value for name, value in variables.items() if name in used
+            }
+        request = GraphQLRequest(
+            graphql_query, variable_values=variables, operation_name=operation
         )
+        return await self._get_graphql_client().execute_async(request=request)
+
+    async def gql_call_combined(
+        self,
+        operation: str,
+        calls: Dict[str, Tuple[DocumentNode, Dict[str, Any]]],
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Makes several GraphQL calls to Monarch Money's API in a single HTTP request.
+
+        The calls are merged into one aliased document, so they must all be queries
+        or all be mutations. Mutations are executed in the given order.
+
+        :param operation: the operation name to send for the combined document.
+        :param calls: maps an alias (a valid GraphQL name) to the query and
+          variables of a single-operation call.
+        :return: the result of each call, keyed by its alias.
+        """
+        query, response_keys = _combine_documents(
+            operation, {alias: call[0] for alias, call in calls.items()}
+        )
+        variables = {
+            f"{alias}_{name}": value
+            for alias, (_, call_variables) in calls.items()
+            for name, value in call_variables.items()
+        }
+
+        response = await self.gql_call(
+            operation=operation, graphql_query=query, variables=variables
+        )
+
+        return {
+            alias: {
+                original: response.get(combined) for combined, original in keys.items()
+            }
+            for alias, keys in response_keys.items()
+        }
 
     def save_session(self, filename: Optional[str] = None) -> None:
         """
@@ -3175,9 +4235,16 @@ class MonarchMoney(object):
             filename = self._session_file
 
         with open(filename, "rb") as fh:
-            data = pickle.load(fh)
-            self.set_token(data["token"])
-            self._headers["Authorization"] = f"Token {self._token}"
+            self.load_session_bytes(fh.read())
+
+    def load_session_bytes(self, session_bytes: bytes) -> None:
+        """
+        Loads a pre-existing auth token from the pickled bytes of a session file,
+        e.g. a session stored in a database, without writing it to disk.
+        """
+        data = pickle.loads(session_bytes)
+        self.set_token(data["token"])
+        self._headers["Authorization"] = f"Token {self._token}"
 
     def delete_session(self, filename: Optional[str] = None) -> None:
         """
@@ -3311,22 +4378,38 @@ class MonarchMoney(object):
 
     def _get_graphql_client(self) -> Client:
         """
-        Creates a correctly configured GraphQL client for connecting to Monarch Money.
+        Returns the GraphQL client for connecting to Monarch Money.
+
+        The client is created once per instance and its transport keeps a pool of
+        keep-alive connections open between calls; use close() or ``async with``
+        to release them.
         """
         if self._headers is None:
             raise LoginFailedException(
                 "Make sure you call login() first or provide a session token!"
             )
-        transport = AIOHTTPTransport(
-            url=MonarchMoneyEndpoints.getGraphQL(),
-            headers=self._headers,
-            timeout=self._timeout,
-        )
-        return Client(
-            transport=transport,
-            fetch_schema_from_transport=False,
-            execute_timeout=self._timeout,
-        )
+        if self._graphql_client is None:
+            transport = _PooledAIOHTTPTransport(
+                url=MonarchMoneyEndpoints.getGraphQL(),
+                headers=self._headers,
+                timeout=self._timeout,
+                json_deserialize=self._json_loads,
+                connector_args={
+                    "limit": self._connection_limit,
+                    "keepalive_timeout": self._keepalive_timeout,
+                    "ttl_dns_cache": DNS_CACHE_TTL_SECS,
+                },
+            )
+            self._graphql_client = Client(
+                transport=transport,
+                fetch_schema_from_transport=False,
+                execute_timeout=self._timeout,
+            )
+
+        # Pick up any timeout changed through set_timeout() since the last call.
+        self._graphql_client.transport.timeout = self._timeout
+        self._graphql_client.execute_timeout = self._timeout
+        return self._graphql_client
 
     def _convert_to_csv_string(self, csv_content: List[BalanceHistoryRow]) -> str:
         """
@@ -0,0 +1,89 @@
+"""
+Benchmark the post-creation updates in the bridge's push_transaction against a
+local mock GraphQL server that adds a simulated round-trip time to every request.
+
+Compares sending update_transaction(needs_review=True) and set_transaction_tags
+as separate requests with sending them as one combined request.
+
+Usage: python scripts/benchmark_combined_mutations.py [--rtt-ms 150] [--runs 10]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from aiohttp import web
+from graphql import OperationDefinitionNode, parse
+
+# Add project root to path
+sys.path.insert(0, os.getcwd())
+
+from monarchmoney import MonarchMoney, MonarchMoneyEndpoints
+
+
+def make_handler(rtt: float, counter: dict):
+    async def graphql_stub(request: web.Request) -> web.Response:
+        payload = await request.json()
+        counter["requests"] += 1
+        await asyncio.sleep(rtt)
+
+        # Answer every top-level field (by its response key) with a canned payload.
+        data = {}
+        for definition in parse(payload["query"]).definitions:
+            if isinstance(definition, OperationDefinitionNode):
+                for field in definition.selection_set.selections:
+                    key = (field.alias or field.name).value
+                    data[key] = {"transaction": {"id": "1"}, "errors": None}
+        return web.json_response({"data": data})
+
+    return graphql_stub
+
+
+async def main(rtt_ms: float, runs: int) -> None:
+    counter = {"requests": 0}
+    app = web.Application()
+    app.router.add_post("/graphql", make_handler(rtt_ms / 1000, counter))
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    MonarchMoneyEndpoints.BASE_URL = f"http://127.0.0.1:{port}"
+
+    async with MonarchMoney(token="benchmark") as mm:
+
+        async def sequential():
+            await mm.update_transaction(transaction_id="1", needs_review=True)
+            await mm.set_transaction_tags(transaction_id="1", tag_ids=["2"])
+
+        async def combined():
+            await mm.update_transaction_and_tags(
+                transaction_id="1", tag_ids=["2"], needs_review=True
+            )
+
+        await combined()
+        print(f"Simulated RTT {rtt_ms:.0f}ms, {runs} runs each")
+        for label, call in (("sequential", sequential), ("combined", combined)):
+            counter["requests"] = 0
+            samples = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                await call()
+                samples.append((time.perf_counter() - start) * 1000)
+            print(
+                f"{label:<12} mean={statistics.mean(samples):7.1f}ms "
+                f"requests/run={counter['requests'] / runs:.0f}"
+            )
+
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rtt-ms", type=float, default=150)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.rtt_ms, args.runs))
@@ -0,0 +1,62 @@
+"""
+Microbenchmark the CPU cost of building GraphQL requests in MonarchMoney methods.
+
+Each method is called with the network stubbed out, once with the parsed
+document cache cleared before every call (the old behaviour of reparsing the
+query each time) and once with the cache warm.
+
+Usage: python scripts/benchmark_document_cache.py [--calls 2000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Add project root to path
+sys.path.insert(0, os.getcwd())
+
+from monarchmoney import MonarchMoney
+from monarchmoney import monarchmoney as mm_module
+
+
+async def noop_gql_call(*args, **kwargs):
+    return {}
+
+
+METHODS = {
+    "update_transaction": lambda mm: mm.update_transaction("1", notes="n"),
+    "create_transaction": lambda mm: mm.create_transaction(
+        "2024-01-01", "1", -1.0, "Merchant", "1"
+    ),
+    "get_transactions": lambda mm: mm.get_transactions(),
+    "get_accounts": lambda mm: mm.get_accounts(),
+}
+
+
+async def time_method(mm: MonarchMoney, call, calls: int, cold: bool) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        if cold:
+            mm_module._PARSED_DOCUMENTS.clear()
+        await call(mm)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+async def main(calls: int) -> None:
+    mm = MonarchMoney(token="benchmark")
+    mm.gql_call = noop_gql_call
+
+    print(f"{'method':<22}{'reparse (us)':>14}{'cached (us)':>14}{'saved (us)':>14}")
+    for name, call in METHODS.items():
+        cold = await time_method(mm, call, calls, cold=True)
+        warm = await time_method(mm, call, calls, cold=False)
+        print(f"{name:<22}{cold:>14.1f}{warm:>14.1f}{cold - warm:>14.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.calls))
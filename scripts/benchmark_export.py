@@ -0,0 +1,157 @@
+"""
+Benchmark bulk transaction export throughput against a local mock server.
+
+The stub answers GetTransactionsList from a synthetic history, honouring the date
+filters, offset and limit, with a fixed delay per request to stand in for API
+latency. Compares sequential offset paging over the whole range (what callers of
+get_transactions had to do) with export_transactions() at several concurrency
+limits.
+
+Usage: python scripts/benchmark_export.py [--years 3] [--per-day 20] [--latency-ms 40]
+"""
+
+import argparse
+import asyncio
+import bisect
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from aiohttp import web
+
+# Add project root to path
+sys.path.insert(0, os.getcwd())
+
+from monarchmoney import MonarchMoney, MonarchMoneyEndpoints  # noqa: E402
+
+
+def make_history(years: int, per_day: int) -> list:
+    """Transactions newest first, as the API returns them."""
+    end = date(2024, 12, 31)
+    day = end - timedelta(days=365 * years - 1)
+    transactions = []
+    while day <= end:
+        for i in range(per_day):
+            transactions.append(
+                {
+                    "id": f"{day.isoformat()}-{i}",
+                    "date": day.isoformat(),
+                    "amount": -12.5 - i,
+                    "pending": False,
+                    "plaidName": "COFFEE SHOP",
+                    "notes": None,
+                    "hideFromReports": False,
+                    "isSplitTransaction": False,
+                    "isRecurring": False,
+                    "merchant": {"id": "1", "name": "Coffee Shop"},
+                    "category": {"id": "2", "name": "Coffee"},
+                    "account": {"id": "3", "displayName": "Checking"},
+                    "tags": [],
+                    "__typename": "Transaction",
+                }
+            )
+        day += timedelta(days=1)
+    transactions.reverse()
+    return transactions
+
+
+def make_stub(transactions: list, latency: float):
+    # Negated ordinals ascend along the newest-first list, so bisect can slice it
+    keys = [-date.fromisoformat(t["date"]).toordinal() for t in transactions]
+
+    async def graphql_stub(request: web.Request) -> web.Response:
+        variables = (await request.json())["variables"]
+        filters = variables["filters"]
+        lo, hi = 0, len(transactions)
+        if "startDate" in filters:
+            hi = bisect.bisect_right(
+                keys, -date.fromisoformat(filters["startDate"]).toordinal()
+            )
+            lo = bisect.bisect_left(
+                keys, -date.fromisoformat(filters["endDate"]).toordinal()
+            )
+        offset, limit = variables["offset"], variables["limit"]
+        start = lo + offset
+        await asyncio.sleep(latency)
+        return web.json_response(
+            {
+                "data": {
+                    "allTransactions": {
+                        "totalCount": hi - lo,
+                        "results": transactions[start : min(start + limit, hi)],
+                    },
+                    "transactionRules": [],
+                }
+            }
+        )
+
+    return graphql_stub
+
+
+async def main(years: int, per_day: int, latency_ms: float, page_size: int) -> None:
+    transactions = make_history(years, per_day)
+    app = web.Application(client_max_size=1024**2)
+    app.router.add_post("/graphql", make_stub(transactions, latency_ms / 1000))
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    MonarchMoneyEndpoints.BASE_URL = f"http://127.0.0.1:{port}"
+
+    mm = MonarchMoney(token="benchmark")
+    start_date, end_date = transactions[-1]["date"], transactions[0]["date"]
+    print(
+        f"{len(transactions)} transactions ({start_date}..{end_date}), "
+        f"page size {page_size}, {latency_ms:.0f} ms per request"
+    )
+
+    async def sequential(path: str) -> int:
+        # One offset loop over the whole range, like callers of get_transactions wrote
+        count = 0
+        with open(path, "w") as fh:
+            async for transaction in mm.iter_transactions(
+                page_size=page_size, start_date=start_date, end_date=end_date
+            ):
+                fh.write(f"{transaction['id']}\n")
+                count += 1
+        return count
+
+    runs = [("sequential offset paging", sequential)]
+    for concurrency in (1, 4, 8, 16):
+
+        async def sharded(path: str, concurrency=concurrency) -> int:
+            return await mm.export_transactions(
+                path,
+                start_date,
+                end_date,
+                format="ndjson",
+                concurrency=concurrency,
+                page_size=page_size,
+            )
+
+        runs.append((f"export, concurrency={concurrency}", sharded))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, run in runs:
+            path = os.path.join(tmp, "export.ndjson")
+            started = time.perf_counter()
+            count = await run(path)
+            elapsed = time.perf_counter() - started
+            assert count == len(transactions), count
+            print(f"{label:<26} {elapsed:7.2f}s {count / elapsed:9.0f} tx/s")
+
+    await mm.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--per-day", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--page-size", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.years, args.per_day, args.latency_ms, args.page_size))
@@ -0,0 +1,99 @@
+"""
+Benchmark request throughput through the ghost-cookie middleware.
+
+Serves /health and a static asset from bridge_app/static behind the previous
+BaseHTTPMiddleware implementation and behind the current pure ASGI one, and
+drives both in-process through httpx's ASGI transport so only the app and
+middleware are measured.
+
+Usage: python scripts/benchmark_ghost_middleware.py [--requests 5000] [--concurrency 8]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI, Request, Response
+from fastapi.staticfiles import StaticFiles
+from starlette.middleware.base import BaseHTTPMiddleware
+
+os.environ.setdefault("UNLOCK_SECRET", "benchmark-secret")
+
+# Add project root to path
+sys.path.insert(0, os.getcwd())
+
+from bridge_app import main as bridge_main  # noqa: E402
+
+STATIC_ASSET = "/manifest.json"
+
+
+class LegacyGhostSecurityMiddleware(BaseHTTPMiddleware):
+    """The BaseHTTPMiddleware implementation this benchmark compares against."""
+
+    async def dispatch(self, request: Request, call_next):
+        if not bridge_main.UNLOCK_SECRET:
+            return await call_next(request)
+        if request.url.path == "/s":
+            return await call_next(request)
+        if request.url.path in ["/manifest.json", "/sw.js", "/favicon.ico"]:
+            return await call_next(request)
+        if request.url.path.endswith((".png", ".jpg", ".css", ".js", ".gif")):
+            return await call_next(request)
+        token = request.cookies.get(bridge_main.DEVICE_TOKEN_COOKIE)
+        if token == bridge_main.COOKIE_VALUE:
+            return await call_next(request)
+        return Response(status_code=404, content="Not Found")
+
+
+def make_app(middleware) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    app.mount("/", StaticFiles(directory="bridge_app/static", html=True))
+    app.add_middleware(middleware)
+    return app
+
+
+async def run(app: FastAPI, path: str, requests: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    cookies = {bridge_main.DEVICE_TOKEN_COOKIE: bridge_main.COOKIE_VALUE}
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", cookies=cookies
+    ) as client:
+
+        async def worker(count: int):
+            for _ in range(count):
+                response = await client.get(path)
+                assert response.status_code == 200, response.status_code
+
+        await worker(50)  # warm up
+        start = time.perf_counter()
+        per_worker = requests // concurrency
+        await asyncio.gather(*(worker(per_worker) for _ in range(concurrency)))
+        return per_worker * concurrency / (time.perf_counter() - start)
+
+
+async def main(requests: int, concurrency: int) -> None:
+    apps = {
+        "BaseHTTPMiddleware": make_app(LegacyGhostSecurityMiddleware),
+        "pure ASGI": make_app(bridge_main.GhostSecurityMiddleware),
+    }
+    print(f"{requests} requests, {concurrency} concurrent")
+    for path in ("/health", STATIC_ASSET):
+        for label, app in apps.items():
+            rate = await run(app, path, requests, concurrency)
+            print(f"{path:<16} {label:<20} {rate:9.0f} req/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
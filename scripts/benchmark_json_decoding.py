@@ -0,0 +1,138 @@
+"""
+Benchmark decoding a large get_transactions response with each JSON decoder.
+
+The tests/get_transactions.json fixture is scaled up to --transactions rows and
+decoded with every decoder in JSON_DECODERS that is installed, first on its own
+and then end to end through MonarchMoney.get_transactions against a local stub
+server. Also compares the memory taken by the decoded dicts with
+TransactionRecord objects.
+
+Usage: python scripts/benchmark_json_decoding.py [--transactions 100000] [--repeat 5]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from aiohttp import web
+
+# Add project root to path
+sys.path.insert(0, os.getcwd())
+
+from monarchmoney import (  # noqa: E402
+    MonarchMoney,
+    MonarchMoneyEndpoints,
+    TransactionRecord,
+)
+from monarchmoney.monarchmoney import JSON_DECODERS, _json_decoder  # noqa: E402
+
+
+def scaled_response(count: int) -> bytes:
+    with open("tests/get_transactions.json") as fh:
+        data = json.load(fh)
+    templates = data["allTransactions"]["results"]
+    results = []
+    for i in range(count):
+        transaction = dict(templates[i % len(templates)])
+        transaction["id"] = str(160000000000000000 + i)
+        results.append(transaction)
+    data["allTransactions"]["results"] = results
+    data["allTransactions"]["totalCount"] = count
+    return json.dumps({"data": data}).encode()
+
+
+def installed_decoders() -> dict:
+    decoders = {}
+    for name in JSON_DECODERS[1:]:
+        try:
+            decoders[name] = _json_decoder(name)
+        except ImportError:
+            print(f"{name:<8} not installed, skipped")
+    return decoders
+
+
+def best_of(repeat: int, call) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def measure_memory(build) -> int:
+    tracemalloc.start()
+    kept = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+async def end_to_end(body: bytes, decoders: dict, repeat: int) -> None:
+    async def graphql_stub(request: web.Request) -> web.Response:
+        await request.read()
+        return web.Response(body=body, content_type="application/json")
+
+    app = web.Application()
+    app.router.add_post("/graphql", graphql_stub)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    MonarchMoneyEndpoints.BASE_URL = f"http://127.0.0.1:{port}"
+
+    for name, loads in decoders.items():
+        mm = MonarchMoney(token="benchmark", timeout=120, json_decoder=loads)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await mm.get_transactions(limit=100000)
+            timings.append(time.perf_counter() - start)
+        await mm.close()
+        print(f"{name:<8} get_transactions  {min(timings) * 1000:8.1f} ms")
+
+    await runner.cleanup()
+
+
+def main(transactions: int, repeat: int) -> None:
+    body = scaled_response(transactions)
+    text = body.decode()
+    print(f"{transactions} transactions, {len(body) / 1024 ** 2:.1f} MiB response")
+
+    decoders = installed_decoders()
+    for name, loads in decoders.items():
+        # aiohttp hands the decoder the response text, as gql does
+        elapsed = best_of(repeat, lambda: loads(text))
+        print(f"{name:<8} decode            {elapsed * 1000:8.1f} ms")
+
+    asyncio.run(end_to_end(body, decoders, repeat))
+
+    results = json.loads(text)["data"]["allTransactions"]["results"]
+    elapsed = best_of(repeat, lambda: [TransactionRecord.from_dict(t) for t in results])
+    print(f"{'records':<8} from_dict         {elapsed * 1000:8.1f} ms")
+    del results
+    dicts = measure_memory(
+        lambda: json.loads(text)["data"]["allTransactions"]["results"]
+    )
+    records = measure_memory(
+        lambda: [
+            TransactionRecord.from_dict(t)
+            for t in json.loads(text)["data"]["allTransactions"]["results"]
+        ]
+    )
+    print(f"memory   dicts {dicts / 1024 ** 2:7.1f} MiB")
+    print(f"memory   records {records / 1024 ** 2:5.1f} MiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transactions", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.transactions, args.repeat)
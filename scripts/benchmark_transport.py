@@ -0,0 +1,128 @@
+"""
+Benchmark per-call GraphQL latency of MonarchMoney against a local stub server.
+
+Compares the old behaviour (a new AIOHTTPTransport/Client, and so a new TCP
+connection, for every query) with the pooled transport owned by MonarchMoney.
+
+Usage: python scripts/benchmark_transport.py [--calls 500] [--tls]
+"""
+
+import argparse
+import asyncio
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+from gql import Client, gql
+from gql.transport.aiohttp import AIOHTTPTransport
+
+# Add project root to path
+sys.path.insert(0, os.getcwd())
+
+from monarchmoney import MonarchMoney, MonarchMoneyEndpoints
+
+QUERY = """
+  query GetSubscriptionDetails {
+    subscription {
+      id
+      __typename
+    }
+  }
+"""
+
+
+async def graphql_stub(request: web.Request) -> web.Response:
+    await request.read()
+    return web.json_response(
+        {"data": {"subscription": {"id": "1", "__typename": "Subscription"}}}
+    )
+
+
+def make_tls_contexts():
+    """Creates a throwaway self-signed certificate so TLS handshakes are measured."""
+    tmp = tempfile.mkdtemp()
+    cert, key = os.path.join(tmp, "cert.pem"), os.path.join(tmp, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1"]
+        + ["-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+        check=True,
+        capture_output=True,
+    )
+    server_ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_ctx.load_cert_chain(cert, key)
+    client_ctx = ssl.create_default_context(cafile=cert)
+    return server_ctx, client_ctx
+
+
+async def time_calls(call, n: int) -> list:
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        await call()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label: str, samples: list) -> None:
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(
+        f"{label:<28} mean={statistics.mean(samples):7.3f}ms "
+        f"p50={statistics.median(samples):7.3f}ms p95={p95:7.3f}ms"
+    )
+
+
+async def main(calls: int, use_tls: bool) -> None:
+    server_ctx, client_ctx = make_tls_contexts() if use_tls else (None, None)
+
+    app = web.Application()
+    app.router.add_post("/graphql", graphql_stub)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0, ssl_context=server_ctx)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    MonarchMoneyEndpoints.BASE_URL = (
+        f"{'https' if use_tls else 'http'}://localhost:{port}"
+    )
+
+    mm = MonarchMoney(token="benchmark")
+    document = gql(QUERY)
+
+    async def per_call_client():
+        # Mirrors the previous _get_graphql_client(): new transport every query.
+        transport = AIOHTTPTransport(
+            url=MonarchMoneyEndpoints.getGraphQL(),
+            headers=mm._headers,
+            timeout=mm.timeout,
+            ssl=client_ctx or True,
+        )
+        client = Client(transport=transport, fetch_schema_from_transport=False)
+        await client.execute_async(document)
+
+    async def pooled_client():
+        await mm.gql_call(operation="GetSubscriptionDetails", graphql_query=document)
+
+    if client_ctx is not None:
+        mm._get_graphql_client().transport.ssl = client_ctx
+
+    print(f"{calls} sequential calls against {MonarchMoneyEndpoints.getGraphQL()}")
+    await time_calls(pooled_client, 10)
+    report("new client per call", await time_calls(per_call_client, calls))
+    report("pooled transport", await time_calls(pooled_client, calls))
+
+    await mm.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--tls", action="store_true", help="serve the stub over TLS")
+    args = parser.parse_args()
+    asyncio.run(main(args.calls, args.tls))
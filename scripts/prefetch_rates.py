@@ -0,0 +1,44 @@
+import argparse
+import asyncio
+import os
+import sys
+from datetime import date, timedelta
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from bridge_app.database import engine, Base, AsyncSessionLocal
+from bridge_app.services.currency import prefetch_rates, close_client, BASE_CURRENCY
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+async def main(start_date: str, end_date: str):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    print(f"Fetching all {BASE_CURRENCY} rates from {start_date} to {end_date}...")
+    async with AsyncSessionLocal() as db:
+        inserted = await prefetch_rates(db, start_date, end_date)
+    await close_client()
+    print(f"✅ Stored {inserted} new exchange rates.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Store historical exchange rates in the bridge database."
+    )
+    parser.add_argument(
+        "--start",
+        default=(date.today() - timedelta(days=90)).isoformat(),
+        help="YYYY-MM-DD (default: 90 days ago)",
+    )
+    parser.add_argument(
+        "--end", default=date.today().isoformat(), help="YYYY-MM-DD (default: today)"
+    )
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.start, args.end))
+    except Exception as e:
+        print(f"Error: {e}")
@@ -13,8 +13,74 @@ CREATE INDEX IF NOT EXISTS ix_credentials_email ON credentials (email);
 CREATE TABLE IF NOT EXISTS transactions (
     id SERIAL PRIMARY KEY,
     image_hash VARCHAR NOT NULL UNIQUE,
+    perceptual_hash VARCHAR(16),
+    tx_date DATE,
+    amount_cents INTEGER,
+    currency VARCHAR(3),
+    merchant_key VARCHAR,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     parsed_data JSON
 );
 
 CREATE INDEX IF NOT EXISTS ix_transactions_image_hash ON transactions (image_hash);
+
+-- Added later; safe to re-run on existing databases
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS perceptual_hash VARCHAR(16);
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS tx_date DATE;
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS amount_cents INTEGER;
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS currency VARCHAR(3);
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS merchant_key VARCHAR;
+
+CREATE INDEX IF NOT EXISTS ix_transactions_semantic ON transactions (currency, merchant_key, tx_date);
+CREATE INDEX IF NOT EXISTS ix_transactions_created_at ON transactions (created_at);
+
+-- OCR Results Table (cached Gemini extractions)
+CREATE TABLE IF NOT EXISTS ocr_results (
+    id SERIAL PRIMARY KEY,
+    image_hash VARCHAR NOT NULL UNIQUE,
+    model VARCHAR NOT NULL,
+    data JSON NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_ocr_results_image_hash ON ocr_results (image_hash);
+
+-- Exchange Rates Table (cached Frankfurter rates)
+CREATE TABLE IF NOT EXISTS exchange_rates (
+    id SERIAL PRIMARY KEY,
+    base VARCHAR(3) NOT NULL,
+    quote VARCHAR(3) NOT NULL,
+    date DATE NOT NULL,
+    rate DOUBLE PRECISION NOT NULL,
+    CONSTRAINT uq_exchange_rates_pair_date UNIQUE (base, quote, date)
+);
+CREATE INDEX IF NOT EXISTS ix_exchange_rates_base_date ON exchange_rates (base, date);
+
+-- Jobs Table (background processing queue shared by all workers)
+CREATE TABLE IF NOT EXISTS jobs (
+    id VARCHAR(36) PRIMARY KEY,
+    status VARCHAR NOT NULL DEFAULT 'queued',
+    step VARCHAR,
+    progress INTEGER NOT NULL DEFAULT 0,
+    result JSON,
+    error VARCHAR,
+    content_hash VARCHAR(64),
+    user_currency VARCHAR,
+    manual_data JSON,
+    force_override BOOLEAN NOT NULL DEFAULT FALSE,
+    batch_id VARCHAR(36),
+    filename VARCHAR,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner VARCHAR,
+    lease_expires_at TIMESTAMP,
+    created_at TIMESTAMP NOT NULL,
+    expires_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_jobs_status_created_at ON jobs (status, created_at);
+
+-- Added later; safe to re-run on existing databases
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS batch_id VARCHAR(36);
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS filename VARCHAR;
+
+CREATE INDEX IF NOT EXISTS ix_jobs_batch_id ON jobs (batch_id);
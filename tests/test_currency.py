@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+from datetime import date, timedelta
+
+import httpx
+
+# The bridge reads its database location on import
+_tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_tmp.name}/bridge.db")
+
+from sqlalchemy import func, select  # noqa: E402
+
+from bridge_app.database import AsyncSessionLocal, Base, engine  # noqa: E402
+from bridge_app.models import ExchangeRate  # noqa: E402
+from bridge_app.services import currency  # noqa: E402
+
+
+class TestProvisionalRates(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+        for cache in (
+            currency._historical_tables,
+            currency._unpublished_dates,
+            currency._provisional_tables,
+        ):
+            cache.clear()
+        self.addCleanup(currency._historical_tables.clear)
+        self.addCleanup(currency._provisional_tables.clear)
+
+        # Frankfurter answers with the date of the rates it actually returns
+        self.published = {}
+        self.requests = []
+
+        def handler(request):
+            requested = request.url.path.strip("/")
+            self.requests.append(requested)
+            published, rate = self.published[requested]
+            return httpx.Response(
+                200, json={"base": "EUR", "date": published, "rates": {"USD": rate}}
+            )
+
+        currency._client = httpx.AsyncClient(
+            base_url=currency.FRANKFURTER_URL,
+            transport=httpx.MockTransport(handler),
+        )
+        self.addAsyncCleanup(currency.close_client)
+
+    async def stored_rows(self) -> int:
+        async with AsyncSessionLocal() as db:
+            return await db.scalar(select(func.count()).select_from(ExchangeRate))
+
+    async def test_todays_rates_before_publication_are_not_kept(self):
+        """
+        Test that a table for today answered with yesterday's rates is neither cached
+        for good nor stored, so the published rates are picked up later.
+        """
+        today = date.today().isoformat()
+        yesterday = (date.today() - timedelta(days=1)).isoformat()
+        self.published[today] = (yesterday, 1.08)
+
+        async with AsyncSessionLocal() as db:
+            table = await currency.get_rate_table(today, db)
+        self.assertEqual(table["USD"], 1.08)
+        self.assertNotIn(today, currency._historical_tables)
+        self.assertEqual(await self.stored_rows(), 0)
+
+        # Reused until the short TTL runs out
+        async with AsyncSessionLocal() as db:
+            await currency.get_rate_table(today, db)
+        self.assertEqual(self.requests, [today])
+
+        currency._provisional_tables[today] = (0, table)
+        self.published[today] = (today, 1.09)
+        async with AsyncSessionLocal() as db:
+            table = await currency.get_rate_table(today, db)
+        self.assertEqual(table["USD"], 1.09)
+        self.assertIn(today, currency._historical_tables)
+        self.assertEqual(await self.stored_rows(), 1)
+
+    async def test_past_weekend_rates_are_kept(self):
+        """Test that an old weekend answered with the Friday before is stored as usual."""
+        self.published["2024-05-04"] = ("2024-05-03", 1.07)
+
+        async with AsyncSessionLocal() as db:
+            table = await currency.get_rate_table("2024-05-04", db)
+        self.assertEqual(table["USD"], 1.07)
+        self.assertIn("2024-05-04", currency._historical_tables)
+        self.assertEqual(await self.stored_rows(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# The bridge reads its database location on import
+_tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_tmp.name}/bridge.db")
+
+from sqlalchemy import delete  # noqa: E402
+
+from bridge_app.database import AsyncSessionLocal, Base, engine  # noqa: E402
+from bridge_app.models import Credentials, Job, Transaction  # noqa: E402
+from bridge_app.services import jobs, orchestrator  # noqa: E402
+
+MANUAL_ENTRY = {
+    "date": "2024-05-03",
+    "amount": 12.5,
+    "currency": "USD",
+    "merchant": "Corner Cafe",
+}
+
+
+class TestJobLeases(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSessionLocal() as db:
+            db.add(Credentials(email="test@example.com", encrypted_payload=b"x"))
+            await db.commit()
+
+        self.pushed = []
+
+        async def get_monarch_client(db, user_id):
+            return None
+
+        async def push_transaction(mm, data):
+            self.pushed.append(data)
+            return f"tx-{len(self.pushed)}"
+
+        for name, mock in (
+            ("get_monarch_client", get_monarch_client),
+            ("push_transaction", push_transaction),
+        ):
+            patcher = patch.object(orchestrator, name, mock)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def enqueue(self) -> str:
+        async with AsyncSessionLocal() as db:
+            return await jobs.enqueue_job(db, manual_data=MANUAL_ENTRY)
+
+    async def test_silent_job_keeps_its_lease(self):
+        """
+        Test that a job which reports no progress for longer than the visibility
+        timeout isn't handed to another worker while it is still running.
+        """
+        job_id = await self.enqueue()
+        claimed_meanwhile = []
+
+        async def process_manual_transaction(manual_data, db, **kwargs):
+            await asyncio.sleep(0.3)
+            claimed_meanwhile.append(await jobs.claim_job())
+            await asyncio.sleep(0.3)
+            return {"status": "success"}
+
+        with patch.object(jobs, "JOB_VISIBILITY_TIMEOUT", 0.2), patch.object(
+            jobs, "JOB_HEARTBEAT_INTERVAL", 0.05
+        ), patch.object(
+            orchestrator, "process_manual_transaction", process_manual_transaction
+        ):
+            job = await jobs.claim_job()
+            self.assertEqual(job.id, job_id)
+            await jobs.process_job(job)
+
+        self.assertEqual(claimed_meanwhile, [None])
+        async with AsyncSessionLocal() as db:
+            job = await db.get(Job, job_id)
+        self.assertEqual(job.status, "completed")
+
+    async def test_push_happens_once_per_job(self):
+        """
+        Test that a claim taking over a job whose earlier claim already created the
+        Monarch transaction reuses it instead of creating another.
+        """
+        job_id = await self.enqueue()
+        async with AsyncSessionLocal() as db:
+            first = await orchestrator.process_manual_transaction(
+                dict(MANUAL_ENTRY), db, job_id=job_id
+            )
+        self.assertEqual(first["monarch_tx_id"], "tx-1")
+        self.assertEqual(await jobs.get_pushed_transaction(job_id), "tx-1")
+
+        # The earlier claim was cut off after the push, before saving its record, and
+        # the job is run again
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Transaction))
+            await db.commit()
+            second = await orchestrator.process_manual_transaction(
+                dict(MANUAL_ENTRY), db, job_id=job_id
+            )
+        self.assertEqual(second["monarch_tx_id"], "tx-1")
+        self.assertEqual(len(self.pushed), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,15 @@
+import csv
 import os
+from datetime import date, timedelta
 import pickle
+import tempfile
 import unittest
 from unittest.mock import patch
 
 import json
 from gql import Client
-from monarchmoney import MonarchMoney
+from graphql import print_ast
+from monarchmoney import MonarchMoney, TransactionMirror, TransactionRecord
 from monarchmoney.monarchmoney import LoginFailedException
 
 
@@ -110,9 +114,9 @@ class TestMonarchMoney(unittest.IsolatedAsyncioTestCase):
 
         mock_execute_async.assert_called_once()
 
-        kwargs = mock_execute_async.call_args.kwargs
-        self.assertEqual(kwargs["operation_name"], "Common_DeleteAccount")
-        self.assertEqual(kwargs["variable_values"], {"id": "170123456789012345"})
+        request = mock_execute_async.call_args.kwargs["request"]
+        self.assertEqual(request.operation_name, "Common_DeleteAccount")
+        self.assertEqual(request.variable_values, {"id": "170123456789012345"})
 
         self.assertIsNotNone(result, "Expected result to not be None")
         self.assertEqual(result["deleteAccount"]["deleted"], True)
@@ -221,6 +225,353 @@ class TestMonarchMoney(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(len(result["categoryGroups"]), 2, "Expected 2 category groups")
         self.assertEqual(len(result["goalsV2"]), 1, "Expected 1 goal")
 
+    @patch.object(Client, "execute_async")
+    async def test_query_documents_are_parsed_once(self, mock_execute_async):
+        """
+        Test that repeated calls reuse the same parsed GraphQL document.
+        """
+        mock_execute_async.return_value = {}
+        await self.monarch_money.update_transaction("1", notes="first")
+        await self.monarch_money.update_transaction("1", notes="second")
+
+        first, second = (
+            call.kwargs["request"] for call in mock_execute_async.call_args_list
+        )
+        self.assertIs(first.document, second.document)
+        self.assertIsNot(first, second)
+        self.assertEqual(first.variable_values["input"]["notes"], "first")
+        self.assertEqual(second.variable_values["input"]["notes"], "second")
+
+    @patch.object(Client, "execute_async")
+    async def test_iter_transaction_records(self, mock_execute_async):
+        """
+        Test that iter_transactions can yield slotted TransactionRecords.
+        """
+        mock_execute_async.return_value = TestMonarchMoney.loadTestData(
+            filename="get_transactions.json",
+        )
+        records = [
+            record
+            async for record in self.monarch_money.iter_transactions(as_records=True)
+        ]
+        self.assertEqual(len(records), 2)
+        self.assertIsInstance(records[0], TransactionRecord)
+        self.assertFalse(hasattr(records[0], "__dict__"))
+        self.assertEqual(records[0].merchant_name, "Whole Foods")
+        self.assertEqual(records[0].tag_names, ("Monarch Bridge",))
+        self.assertEqual(records[1].amount, 2500.0)
+
+    def test_json_decoder(self):
+        """
+        Test that the transport decodes responses with the configured decoder.
+        """
+        mm = MonarchMoney(token="test_token")
+        self.assertIs(mm._get_graphql_client().transport.json_deserialize, json.loads)
+
+        def loads(text):
+            return json.loads(text)
+
+        mm = MonarchMoney(token="test_token", json_decoder=loads)
+        self.assertIs(mm._get_graphql_client().transport.json_deserialize, loads)
+
+        with self.assertRaises(ValueError):
+            MonarchMoney(json_decoder="yaml")
+
+    @patch.object(Client, "execute_async")
+    async def test_iter_transactions(self, mock_execute_async):
+        """
+        Test that iter_transactions pages through every transaction in order.
+        """
+        transactions = [{"id": str(i)} for i in range(25)]
+
+        async def execute_async(request):
+            variables = request.variable_values
+            offset, limit = variables["offset"], variables["limit"]
+            return {
+                "allTransactions": {
+                    "totalCount": len(transactions),
+                    "results": transactions[offset : offset + limit],
+                }
+            }
+
+        mock_execute_async.side_effect = execute_async
+
+        for prefetch in (0, 2):
+            mock_execute_async.reset_mock()
+            result = [
+                transaction
+                async for transaction in self.monarch_money.iter_transactions(
+                    page_size=10, prefetch=prefetch, search="coffee"
+                )
+            ]
+            self.assertEqual(result, transactions)
+            offsets = sorted(
+                call.kwargs["request"].variable_values["offset"]
+                for call in mock_execute_async.call_args_list
+            )
+            self.assertEqual(offsets, [0, 10, 20], "Expected one request per page")
+            self.assertEqual(
+                mock_execute_async.call_args.kwargs["request"].variable_values[
+                    "filters"
+                ]["search"],
+                "coffee",
+            )
+
+    @patch.object(Client, "execute_async")
+    async def test_export_transactions(self, mock_execute_async):
+        """
+        Test that export_transactions writes each transaction once, oldest first.
+        """
+        transactions = [
+            {"id": "3", "date": "2024-01-20", "merchant": {"name": "Cafe"}, "tags": []},
+            {"id": "2", "date": "2024-01-10", "merchant": None, "tags": []},
+            {"id": "1", "date": "2024-01-01", "merchant": None, "tags": []},
+        ]
+
+        async def execute_async(request):
+            filters = request.variable_values["filters"]
+            matching = [
+                t
+                for t in transactions
+                if filters["startDate"] <= t["date"] <= filters["endDate"]
+            ]
+            # The same transaction returned by two neighbouring shards
+            if filters["startDate"] == "2024-01-11":
+                matching.append(transactions[1])
+            return {
+                "allTransactions": {"totalCount": len(matching), "results": matching}
+            }
+
+        mock_execute_async.side_effect = execute_async
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "transactions.ndjson")
+            count = await self.monarch_money.export_transactions(
+                path, "2024-01-01", "2024-01-31", shard_days=10, concurrency=2
+            )
+            with open(path) as fh:
+                ids = [json.loads(line)["id"] for line in fh]
+
+            csv_path = os.path.join(tmp, "transactions.csv")
+            await self.monarch_money.export_transactions(
+                csv_path, "2024-01-01", "2024-01-31", shard_days=10
+            )
+            with open(csv_path) as fh:
+                rows = list(csv.DictReader(fh))
+
+        self.assertEqual(count, 3)
+        self.assertEqual(ids, ["1", "2", "3"])
+        self.assertEqual(rows[-1]["merchant"], "Cafe")
+
+    @patch.object(Client, "execute_async")
+    async def test_transaction_mirror_sync(self, mock_execute_async):
+        """
+        Test that the mirror only re-fetches the trailing window once populated,
+        picks up edits, and only deletes transactions when reconciling, downloading
+        just the changed ones in full.
+        """
+        today = date.today()
+        server = {
+            str(i): {
+                "id": str(i),
+                "date": (today - timedelta(days=10 * i)).isoformat(),
+                "amount": -float(i),
+                "updatedAt": "v1",
+                "category": {"id": "c", "name": "Coffee"},
+            }
+            for i in range(20)
+        }
+
+        async def execute_async(request):
+            filters = request.variable_values["filters"]
+            matching = sorted(
+                (
+                    t
+                    for t in server.values()
+                    if filters.get("startDate", "") <= t["date"]
+                    and t["date"] <= filters.get("endDate", "9999")
+                ),
+                key=lambda t: t["date"],
+                reverse=True,
+            )
+            offset = request.variable_values["offset"]
+            limit = request.variable_values["limit"]
+            results = matching[offset : offset + limit]
+            if "category" in print_ast(request.document):
+                full_requests.append((filters.get("startDate"), filters.get("endDate")))
+            else:
+                results = [
+                    {"id": t["id"], "updatedAt": t["updatedAt"], "date": t["date"]}
+                    for t in results
+                ]
+            return {
+                "allTransactions": {"totalCount": len(matching), "results": results}
+            }
+
+        mock_execute_async.side_effect = execute_async
+        full_requests = []
+
+        with tempfile.TemporaryDirectory() as tmp:
+            mirror = TransactionMirror(
+                self.monarch_money,
+                os.path.join(tmp, "mirror.sqlite"),
+                trailing_days=30,
+                page_size=5,
+            )
+            first = await mirror.sync()
+            self.assertTrue(first["reconciled"])
+            self.assertEqual(first["upserted"], 20)
+            self.assertEqual(mirror.count(), 20)
+
+            server["0"] = {**server["0"], "amount": -99.0, "updatedAt": "v2"}
+            # Moved out of the trailing window, not deleted
+            moved = (today - timedelta(days=200)).isoformat()
+            server["2"] = {**server["2"], "date": moved, "updatedAt": "v2"}
+            del server["1"]
+            del server["15"]
+            mock_execute_async.reset_mock()
+            second = await mirror.sync()
+            self.assertFalse(second["reconciled"])
+            self.assertEqual(second["fetched"], 2, "Expected only the trailing window")
+            self.assertEqual(mock_execute_async.call_count, 1)
+            self.assertEqual(second["upserted"], 1)
+            self.assertEqual(second["deleted"], 0)
+            self.assertEqual(mirror.get_transaction("0")["amount"], -99.0)
+            self.assertIsNotNone(mirror.get_transaction("2"))
+
+            full_requests.clear()
+            third = await mirror.sync(full=True)
+            self.assertEqual(third["fetched"], 18)
+            self.assertEqual(third["upserted"], 1)
+            self.assertEqual(
+                full_requests,
+                [(moved, moved)],
+                "Expected only the changed transaction to be downloaded in full",
+            )
+            self.assertEqual(third["deleted"], 2)
+            self.assertEqual(mirror.count(), 18)
+            self.assertEqual(mirror.get_transaction("2")["date"], moved)
+            self.assertEqual(
+                [t["id"] for t in mirror.get_transactions(limit=2)], ["0", "3"]
+            )
+            self.assertAlmostEqual(
+                mirror.totals_by_category()["Coffee"], -99.0 - sum(range(2, 20)) + 15
+            )
+            mirror.close()
+
+    @patch.object(Client, "execute_async")
+    async def test_projected_fields(self, mock_execute_async):
+        """
+        Test that a projection trims the query document and caches it.
+        """
+        mock_execute_async.return_value = {}
+        fields = ["accounts.id", "accounts.displayName"]
+        await self.monarch_money.get_accounts(fields=fields)
+        await self.monarch_money.get_accounts(fields=reversed(fields))
+
+        first, second = (
+            call.kwargs["request"] for call in mock_execute_async.call_args_list
+        )
+        self.assertIs(first.document, second.document)
+        query = print_ast(first.document)
+        self.assertIn("displayName", query)
+        self.assertNotIn("currentBalance", query)
+        self.assertNotIn("householdPreferences", query)
+        self.assertNotIn("fragment", query)
+
+        await self.monarch_money.get_transactions(fields=["allTransactions.totalCount"])
+        request = mock_execute_async.call_args.kwargs["request"]
+        self.assertNotIn("results", print_ast(request.document))
+        self.assertEqual(list(request.variable_values), ["filters"])
+
+        with self.assertRaises(ValueError):
+            await self.monarch_money.get_accounts(fields=["accounts.nope"])
+
+    @patch.object(Client, "execute_async")
+    async def test_projection_keeps_required_fields(self, mock_execute_async):
+        """
+        Test that projections keep the fields a method's own processing reads.
+        """
+        mock_execute_async.return_value = {
+            "allTransactions": {
+                "totalCount": 1,
+                "results": [{"id": "1", "date": "2024-01-01", "amount": -5.0}],
+            }
+        }
+        records = [
+            record
+            async for record in self.monarch_money.iter_transactions(
+                as_records=True, fields=["allTransactions.results.amount"]
+            )
+        ]
+        query = print_ast(mock_execute_async.call_args.kwargs["request"].document)
+        self.assertIn("id", query)
+        self.assertIn("date", query)
+        self.assertNotIn("merchant", query)
+        self.assertEqual(records[0].amount, -5.0)
+
+        mock_execute_async.return_value = {
+            "account": {"displayName": "Checking"},
+            "snapshots": [{"date": "2024-01-01", "signedBalance": 10.0}],
+        }
+        history = await self.monarch_money.get_account_history(
+            1, fields=["snapshots.signedBalance"]
+        )
+        request = mock_execute_async.call_args.kwargs["request"]
+        query = print_ast(request.document)
+        self.assertIn("displayName", query)
+        self.assertNotIn("currentBalance", query)
+        self.assertNotIn("allTransactions", query)
+        self.assertNotIn("date", query)
+        self.assertEqual(list(request.variable_values), ["id"])
+        self.assertEqual(history[0]["accountName"], "Checking")
+
+    @patch.object(Client, "execute_async")
+    async def test_update_transaction_and_tags(self, mock_execute_async):
+        """
+        Test that the update and tag mutations are sent as one combined request.
+        """
+        mock_execute_async.return_value = {
+            "update_updateTransaction": {"transaction": {"id": "1"}, "errors": None},
+            "tags_setTransactionTags": {"transaction": {"id": "1"}, "errors": None},
+        }
+        result = await self.monarch_money.update_transaction_and_tags(
+            "1", ["tag1"], needs_review=True
+        )
+
+        mock_execute_async.assert_called_once()
+        request = mock_execute_async.call_args.kwargs["request"]
+        self.assertEqual(request.operation_name, "Common_UpdateTransactionAndTags")
+        self.assertEqual(request.variable_values["update_input"]["needsReview"], True)
+        self.assertEqual(
+            request.variable_values["tags_input"],
+            {"transactionId": "1", "tagIds": ["tag1"]},
+        )
+        self.assertEqual(result["updateTransaction"]["transaction"]["id"], "1")
+        self.assertIsNone(result["setTransactionTags"]["errors"])
+
+    async def test_graphql_transport_is_pooled(self):
+        """
+        Test that the GraphQL client and its aiohttp session are reused between calls.
+        """
+        client = self.monarch_money._get_graphql_client()
+        self.assertIs(client, self.monarch_money._get_graphql_client())
+
+        transport = client.transport
+        await transport.connect()
+        session = transport.session
+        await transport.close()
+        await transport.connect()
+        self.assertIs(session, transport.session, "Expected session to be kept open")
+
+        self.monarch_money._headers["Authorization"] = "Token another_token"
+        await transport.connect()
+        self.assertIsNot(session, transport.session)
+        self.assertTrue(session.closed, "Expected stale session to be closed")
+
+        await self.monarch_money.close()
+        self.assertIsNone(transport.session)
+
     async def test_login(self):
         """
         Test the login method with empty values for email and password.
@@ -0,0 +1,115 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from PIL import Image, ImageDraw, ImageFont
+
+# The bridge reads its database location on import
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_tmp.name}/bridge.db"
+
+from sqlalchemy import func, select  # noqa: E402
+
+from bridge_app.database import AsyncSessionLocal, Base, engine  # noqa: E402
+from bridge_app.models import Credentials, Transaction  # noqa: E402
+from bridge_app.services import orchestrator  # noqa: E402
+from bridge_app.services.gemini import preprocess_image  # noqa: E402
+from bridge_app.services.phash import PHASH_MAX_DISTANCE, hamming  # noqa: E402
+
+
+def make_receipt(number: int, quality: int = 90) -> bytes:
+    """A white receipt with the same store layout every time, only the lines differ."""
+    image = Image.new("RGB", (1200, 3000), "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=48)
+    draw.text((380, 100), "CORNER CAFE", fill="black", font=font)
+    draw.text((300, 180), "12 Rue de Rivoli, Paris", fill="black", font=font)
+    for line in range(12):
+        item = f"Item {number * 7 + line:03d}"
+        price = f"{(number * 13 + line * 3) % 40 + 1}.{number % 10}0"
+        y = 400 + line * 90
+        draw.text((100, y), item, fill="black", font=font)
+        draw.text((900, y), price, fill="black", font=font)
+    draw.text((100, 1700), f"TOTAL {number + 10}.50 EUR", fill="black", font=font)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def ocr_result(number: int) -> dict:
+    return {
+        "date": f"2024-05-{number + 1:02d}",
+        "amount": number + 10.5,
+        "currency": "USD",
+        "merchant": "Corner Cafe",
+    }
+
+
+class TestNearDuplicates(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSessionLocal() as db:
+            db.add(Credentials(email="test@example.com", encrypted_payload=b"x"))
+            await db.commit()
+
+        self.scans = {}
+
+        async def extract_transaction_data(jpeg_bytes):
+            return self.scans[jpeg_bytes]
+
+        async def get_monarch_client(db, user_id):
+            return None
+
+        async def push_transaction(mm, data):
+            return f"tx-{data['date']}"
+
+        for name, mock in (
+            ("extract_transaction_data", extract_transaction_data),
+            ("get_monarch_client", get_monarch_client),
+            ("push_transaction", push_transaction),
+        ):
+            patcher = patch.object(orchestrator, name, mock)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def process(self, content: bytes, scan: dict) -> dict:
+        jpeg_bytes, _ = preprocess_image(content)
+        self.scans[jpeg_bytes] = scan
+        async with AsyncSessionLocal() as db:
+            return await orchestrator.process_transaction(content, db)
+
+    async def test_same_layout_receipts_are_not_duplicates(self):
+        """
+        Test that receipts that only look alike are all imported, while a re-encoded
+        copy of one of them is still caught.
+        """
+        receipts = [make_receipt(n) for n in range(6)]
+        hashes = [int(preprocess_image(r)[1], 16) for r in receipts]
+        self.assertTrue(
+            any(
+                hamming(a, b) <= PHASH_MAX_DISTANCE
+                for i, a in enumerate(hashes)
+                for b in hashes[i + 1 :]
+            ),
+            "Expected the same layout to give perceptual hash matches",
+        )
+
+        for number, content in enumerate(receipts):
+            result = await self.process(content, ocr_result(number))
+            self.assertNotEqual(result.get("status"), "duplicate", number)
+
+        async with AsyncSessionLocal() as db:
+            stored = await db.scalar(select(func.count()).select_from(Transaction))
+        self.assertEqual(stored, len(receipts))
+
+        result = await self.process(make_receipt(2, quality=60), ocr_result(2))
+        self.assertEqual(result["status"], "duplicate")
+        self.assertEqual(result["data"]["monarch_tx_id"], "tx-2024-05-03")
+
+
+if __name__ == "__main__":
+    unittest.main()